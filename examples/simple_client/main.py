@@ -5,6 +5,7 @@ import pathlib
 import time
 
 import numpy as np
+from openpi_client import image_codec as _image_codec
 from openpi_client import websocket_client_policy as _websocket_client_policy
 import polars as pl
 import rich
@@ -39,6 +40,10 @@ class Args:
     timing_file: pathlib.Path | None = None
     # Environment to run the policy in.
     env: EnvMode = EnvMode.ALOHA_SIM
+    # Format used to compress the camera images (jpeg, webp or png). If None, images are sent raw.
+    image_format: str | None = None
+    # Quality of lossy image formats.
+    image_quality: int = 90
 
 
 class TimingRecorder:
@@ -122,10 +127,16 @@ def main(args: Args) -> None:
         EnvMode.LIBERO: _random_observation_libero,
     }[args.env]
 
+    image_codecs = {}
+    if args.image_format is not None:
+        codec = _image_codec.ImageCodec(args.image_format, args.image_quality)
+        image_codecs = dict.fromkeys(_image_keys(obs_fn()), codec)
+
     policy = _websocket_client_policy.WebsocketClientPolicy(
         host=args.host,
         port=args.port,
         api_key=args.api_key,
+        image_codecs=image_codecs,
     )
     logger.info(f"Server metadata: {policy.get_server_metadata()}")
 
@@ -139,6 +150,8 @@ def main(args: Args) -> None:
         inference_start = time.time()
         action = policy.infer(obs_fn())
         timing_recorder.record("client_infer_ms", 1000 * (time.time() - inference_start))
+        for key, value in action.get("client_timing", {}).items():
+            timing_recorder.record(f"client_{key}", value)
         for key, value in action.get("server_timing", {}).items():
             timing_recorder.record(f"server_{key}", value)
         for key, value in action.get("policy_timing", {}).items():
@@ -150,6 +163,17 @@ def main(args: Args) -> None:
         timing_recorder.write_parquet(args.timing_file)
 
 
+def _image_keys(obs: dict, prefix: str = "") -> list[str]:
+    """Returns the keys of all uint8 images in the observation, with nested keys joined with "/"."""
+    keys = []
+    for key, value in obs.items():
+        if isinstance(value, dict):
+            keys.extend(_image_keys(value, prefix + key + "/"))
+        elif isinstance(value, np.ndarray) and value.dtype == np.uint8 and value.ndim == 3:
+            keys.append(prefix + key)
+    return keys
+
+
 def _random_observation_aloha() -> dict:
     return {
         "state": np.ones((14,)),
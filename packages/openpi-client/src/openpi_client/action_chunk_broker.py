@@ -1,4 +1,7 @@
-from typing import Dict
+import concurrent.futures
+import math
+import time
+from typing import Dict, Optional
 
 import numpy as np
 import tree
@@ -12,20 +15,55 @@ class ActionChunkBroker(_base_policy.BasePolicy):
 
     Assumes that the first dimension of all action fields is the chunk size.
 
-    A new inference call to the inner policy is only made when the current
-    list of chunks is exhausted.
+    By default, a new inference call to the inner policy is only made when the current
+    list of chunks is exhausted, so the caller waits for a full inference at every chunk
+    boundary.
+
+    With `prefetch=True`, the next chunk is requested in the background once only
+    `prefetch_steps` actions of the current chunk remain. If `prefetch_steps` is None, it
+    is derived from the measured inference latency and the time between calls, so that
+    the next chunk is expected to arrive just before the current one runs out. Since the
+    new chunk was computed from an earlier observation, it is time-aligned: its first
+    actions, which correspond to the steps that were executed while waiting, are skipped.
+    The first `blend_steps` actions of the new chunk are then linearly blended with the
+    remaining actions of the current chunk to avoid discontinuities.
     """
 
-    def __init__(self, policy: _base_policy.BasePolicy, action_horizon: int):
+    def __init__(
+        self,
+        policy: _base_policy.BasePolicy,
+        action_horizon: int,
+        *,
+        prefetch: bool = False,
+        prefetch_steps: Optional[int] = None,
+        blend_steps: int = 0,
+    ):
+        if prefetch_steps is not None and not 0 < prefetch_steps < action_horizon:
+            raise ValueError(f"prefetch_steps must be in (0, {action_horizon}), got {prefetch_steps}")
         self._policy = policy
         self._action_horizon = action_horizon
+        self._prefetch = prefetch
+        self._prefetch_steps = prefetch_steps
+        self._blend_steps = blend_steps
         self._cur_step: int = 0
 
         self._last_results: Dict[str, np.ndarray] | None = None
 
+        # Prefetch state. Steps are counted since the last reset.
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pending: Optional[concurrent.futures.Future] = None
+        self._pending_step: int = 0
+        self._step: int = 0
+        self._last_call_time: Optional[float] = None
+        # Exponential moving averages of the time between calls and the inference latency, in seconds.
+        self._step_period: Optional[float] = None
+        self._latency: Optional[float] = None
+
     @override
     def infer(self, obs: Dict) -> Dict:  # noqa: UP006
-        if self._last_results is None:
+        if self._prefetch:
+            self._update_prefetch(obs)
+        elif self._last_results is None:
             self._last_results = self._policy.infer(obs)
             self._cur_step = 0
 
@@ -37,6 +75,7 @@ class ActionChunkBroker(_base_policy.BasePolicy):
 
         results = tree.map_structure(slicer, self._last_results)
         self._cur_step += 1
+        self._step += 1
 
         if self._cur_step >= self._action_horizon:
             self._last_results = None
@@ -48,3 +87,89 @@ class ActionChunkBroker(_base_policy.BasePolicy):
         self._policy.reset()
         self._last_results = None
         self._cur_step = 0
+        if self._pending is not None:
+            self._pending.cancel()
+        self._pending = None
+        self._step = 0
+        self._last_call_time = None
+
+    @property
+    def prefetch_steps(self) -> int:
+        """Number of remaining actions at which the next chunk is requested."""
+        if self._prefetch_steps is not None:
+            return self._prefetch_steps
+        if self._latency is None or not self._step_period:
+            return self._action_horizon // 2
+        # Request one step early to absorb jitter.
+        steps = math.ceil(self._latency / self._step_period) + 1
+        return min(max(steps, 1), self._action_horizon - 1)
+
+    def _update_prefetch(self, obs: Dict) -> None:
+        now = time.monotonic()
+        if self._last_call_time is not None:
+            self._step_period = _ema(self._step_period, now - self._last_call_time)
+        self._last_call_time = now
+
+        if self._pending is not None and (self._pending.done() or self._last_results is None):
+            # Use the prefetched chunk as soon as it is available, or wait for it if the current chunk is exhausted.
+            self._switch_to(self._pending.result(), self._step - self._pending_step)
+
+        if self._last_results is None:
+            # No chunk is available (e.g., after a reset or if the prefetched chunk was too late).
+            self._last_results = self._timed_infer(obs)
+            self._cur_step = 0
+        elif self._pending is None and self._action_horizon - self._cur_step <= self.prefetch_steps:
+            self._pending = self._submit(obs)
+            self._pending_step = self._step
+
+    def _switch_to(self, results: Dict, offset: int) -> None:
+        self._pending = None
+        if offset >= self._action_horizon:
+            self._last_results = None
+            return
+
+        if self._last_results is not None and self._blend_steps > 0:
+            num_blend = min(self._blend_steps, self._action_horizon - self._cur_step, self._action_horizon - offset)
+            # Weights increase linearly towards the new chunk.
+            weights = np.arange(1, num_blend + 1) / (num_blend + 1)
+            results = dict(results)
+            for key, new in results.items():
+                old = self._last_results.get(key)
+                if not (isinstance(new, np.ndarray) and isinstance(old, np.ndarray)):
+                    continue
+                if not np.issubdtype(new.dtype, np.floating):
+                    continue
+                w = weights.reshape(-1, *([1] * (new.ndim - 1)))
+                new = np.array(new)
+                new[offset : offset + num_blend] = (
+                    w * new[offset : offset + num_blend] + (1 - w) * old[self._cur_step : self._cur_step + num_blend]
+                )
+                results[key] = new
+
+        self._last_results = results
+        self._cur_step = offset
+
+    def _submit(self, obs: Dict) -> concurrent.futures.Future:
+        start_time = time.monotonic()
+        if hasattr(self._policy, "infer_async"):
+            future = self._policy.infer_async(obs)
+        else:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            future = self._executor.submit(self._policy.infer, obs)
+
+        def record_latency(_):
+            self._latency = _ema(self._latency, time.monotonic() - start_time)
+
+        future.add_done_callback(record_latency)
+        return future
+
+    def _timed_infer(self, obs: Dict) -> Dict:
+        start_time = time.monotonic()
+        results = self._policy.infer(obs)
+        self._latency = _ema(self._latency, time.monotonic() - start_time)
+        return results
+
+
+def _ema(prev: Optional[float], value: float, decay: float = 0.8) -> float:
+    return value if prev is None else decay * prev + (1 - decay) * value
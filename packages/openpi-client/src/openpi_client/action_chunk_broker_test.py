@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Dict
+
+import numpy as np
+import pytest
+
+from openpi_client import action_chunk_broker
+from openpi_client import base_policy as _base_policy
+
+
+class _CountingPolicy(_base_policy.BasePolicy):
+    """Returns chunks whose actions are `100 * chunk index + step` and records the observations it receives."""
+
+    def __init__(self, action_horizon: int, infer_delay: float = 0.0):
+        self._action_horizon = action_horizon
+        self._infer_delay = infer_delay
+        self._lock = threading.Lock()
+        self.observations = []
+
+    def infer(self, obs: Dict) -> Dict:
+        with self._lock:
+            chunk = len(self.observations)
+            self.observations.append(obs["step"])
+        time.sleep(self._infer_delay)
+        return {"actions": 100.0 * chunk + np.arange(self._action_horizon, dtype=np.float64)[:, None]}
+
+
+def test_without_prefetch():
+    policy = _CountingPolicy(action_horizon=4)
+    broker = action_chunk_broker.ActionChunkBroker(policy, action_horizon=4)
+
+    actions = [broker.infer({"step": i})["actions"][0] for i in range(8)]
+    assert actions == [0, 1, 2, 3, 100, 101, 102, 103]
+    assert policy.observations == [0, 4]
+
+
+def test_prefetch_time_aligned():
+    policy = _CountingPolicy(action_horizon=8)
+    broker = action_chunk_broker.ActionChunkBroker(policy, action_horizon=8, prefetch=True, prefetch_steps=3)
+
+    actions = []
+    for i in range(8):
+        actions.append(broker.infer({"step": i})["actions"][0])
+        # Give the background request time to finish.
+        time.sleep(0.02)
+
+    # The next chunk is requested from the observation at step 5, when 3 actions remain. It arrives before step 6, so
+    # its first action (which belongs to step 5) is skipped.
+    assert policy.observations == [0, 5]
+    assert actions == [0, 1, 2, 3, 4, 5, 101, 102]
+
+
+def test_prefetch_waits_for_late_chunk():
+    policy = _CountingPolicy(action_horizon=4, infer_delay=0.1)
+    broker = action_chunk_broker.ActionChunkBroker(policy, action_horizon=4, prefetch=True, prefetch_steps=1)
+
+    actions = [broker.infer({"step": i})["actions"][0] for i in range(5)]
+    # The chunk requested at step 3 is only available at step 4, so it starts at its second action.
+    assert policy.observations == [0, 3]
+    assert actions == [0, 1, 2, 3, 101]
+
+
+def test_prefetch_blend():
+    policy = _CountingPolicy(action_horizon=8)
+    broker = action_chunk_broker.ActionChunkBroker(
+        policy, action_horizon=8, prefetch=True, prefetch_steps=4, blend_steps=2
+    )
+
+    actions = []
+    for i in range(8):
+        actions.append(broker.infer({"step": i})["actions"][0])
+        time.sleep(0.02)
+
+    # The new chunk is requested at step 4 and used from step 5 on. Its first two actions are blended with the
+    # remaining actions of the first chunk with weights 1/3 and 2/3.
+    assert policy.observations == [0, 4]
+    np.testing.assert_allclose(actions[5:], [101 / 3 + 5 * 2 / 3, 102 * 2 / 3 + 6 / 3, 103])
+
+
+def test_prefetch_steps_from_latency():
+    policy = _CountingPolicy(action_horizon=20, infer_delay=0.1)
+    broker = action_chunk_broker.ActionChunkBroker(policy, action_horizon=20, prefetch=True)
+    # Before any measurement, the next chunk is requested halfway through the current one.
+    assert broker.prefetch_steps == 10
+
+    for i in range(25):
+        broker.infer({"step": i})
+        time.sleep(0.05)
+
+    # Inference takes about two steps, so the next chunk is requested about three steps before the current one runs
+    # out (with some tolerance for timing noise).
+    assert 3 <= broker.prefetch_steps <= 5
+
+
+def test_invalid_prefetch_steps():
+    with pytest.raises(ValueError, match="prefetch_steps"):
+        action_chunk_broker.ActionChunkBroker(_CountingPolicy(4), action_horizon=4, prefetch=True, prefetch_steps=4)
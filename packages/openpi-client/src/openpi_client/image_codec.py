@@ -0,0 +1,121 @@
+"""Compression of camera images sent between the client and the server.
+
+Raw uint8 images dominate the size of an observation (three 480x640 cameras are ~2.7 MB per step), which is slow over
+wireless networks. Clients can opt into encoding selected images with a compressed format. The server announces the
+formats it can decode in its metadata under `METADATA_KEY`, and the client only uses formats that the server supports.
+Encoded images are serialized by `msgpack_numpy` and decoded back into arrays on the server.
+"""
+
+import dataclasses
+import io
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Formats supported by Pillow that can be used to encode images.
+FORMATS = ("jpeg", "webp", "png")
+
+# Key of the list of supported formats in the server metadata.
+METADATA_KEY = "image_codecs"
+
+
+@dataclasses.dataclass(frozen=True)
+class ImageCodec:
+    """Describes how to encode an image.
+
+    Attributes:
+        format: One of `FORMATS`. JPEG and WebP are lossy, PNG is lossless. JPEG does not support RGBA images.
+        quality: Quality of lossy formats from 0 to 100. Ignored for PNG.
+    """
+
+    format: str = "jpeg"
+    quality: int = 90
+
+    def __post_init__(self):
+        if self.format not in FORMATS:
+            raise ValueError(f"Unsupported image format: {self.format}. Supported formats: {FORMATS}")
+
+
+@dataclasses.dataclass(frozen=True)
+class EncodedImage:
+    """An image that was encoded with `encode`."""
+
+    data: bytes
+    format: str
+    # Shape of the original image. Decoded images are restored to this shape.
+    shape: Tuple[int, ...]
+    # Whether the original image was in [channel, height, width] format.
+    channels_first: bool = False
+
+
+# Pillow image modes for the supported numbers of channels.
+_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
+
+def encode(image: np.ndarray, codec: ImageCodec) -> EncodedImage:
+    """Encodes a uint8 image in [height, width], [height, width, channel] or [channel, height, width] format."""
+    if image.dtype != np.uint8:
+        raise ValueError(f"Only uint8 images can be encoded, got {image.dtype}")
+    channels_first = image.ndim == 3 and image.shape[0] in _MODES and image.shape[-1] not in _MODES
+    pil_image = np.transpose(image, (1, 2, 0)) if channels_first else image
+    if pil_image.ndim == 3 and pil_image.shape[-1] == 1:
+        pil_image = pil_image[..., 0]
+    if pil_image.ndim not in (2, 3) or (pil_image.ndim == 3 and pil_image.shape[-1] not in _MODES):
+        raise ValueError(f"Only grayscale, RGB and RGBA images can be encoded, got shape {image.shape}")
+    if codec.format == "jpeg" and pil_image.ndim == 3 and pil_image.shape[-1] == 4:
+        raise ValueError("JPEG does not support an alpha channel, use PNG or WebP to encode RGBA images")
+    kwargs = {} if codec.format == "png" else {"quality": codec.quality}
+    buffer = io.BytesIO()
+    Image.fromarray(pil_image).save(buffer, format=codec.format, **kwargs)
+    return EncodedImage(data=buffer.getvalue(), format=codec.format, shape=image.shape, channels_first=channels_first)
+
+
+def decode(image: EncodedImage) -> np.ndarray:
+    """Decodes an image back into a uint8 array with the shape of the original image."""
+    if len(image.shape) == 2:
+        channels = 1
+    else:
+        channels = image.shape[0] if image.channels_first else image.shape[-1]
+    with Image.open(io.BytesIO(image.data), formats=[image.format.upper()]) as img:
+        # Some formats (e.g., WebP) always decode to color images.
+        result = np.asarray(img.convert(_MODES[channels]))
+    if image.channels_first:
+        result = np.transpose(result.reshape(*result.shape[:2], channels), (2, 0, 1))
+    return result.reshape(image.shape)
+
+
+def encode_images(obs: Dict, codecs: Dict[str, ImageCodec], *, prefix: str = "") -> Dict:
+    """Returns a copy of `obs` where the images at the keys of `codecs` are encoded.
+
+    Keys of nested dictionaries are joined with "/" (e.g., "images/cam_high").
+    """
+    result = {}
+    for key, value in obs.items():
+        path = prefix + key
+        if isinstance(value, dict):
+            result[key] = encode_images(value, codecs, prefix=path + "/")
+        elif path in codecs:
+            result[key] = encode(np.asarray(value), codecs[path])
+        else:
+            result[key] = value
+    return result
+
+
+def decode_images(obs: Dict) -> Dict:
+    """Returns a copy of `obs` where all encoded images are decoded."""
+    result = {}
+    for key, value in obs.items():
+        if isinstance(value, dict):
+            result[key] = decode_images(value)
+        elif isinstance(value, EncodedImage):
+            result[key] = decode(value)
+        else:
+            result[key] = value
+    return result
+
+
+def negotiate(codecs: Dict[str, ImageCodec], server_metadata: Dict) -> Dict[str, ImageCodec]:
+    """Returns the codecs whose format is supported by the server. Images at other keys are sent raw."""
+    supported = server_metadata.get(METADATA_KEY, ())
+    return {key: codec for key, codec in codecs.items() if codec.format in supported}
@@ -0,0 +1,69 @@
+from typing import Tuple
+
+import numpy as np
+import pytest
+
+from openpi_client import image_codec, msgpack_numpy
+
+
+def _smooth_image(shape) -> np.ndarray:
+    # Lossy codecs only reproduce smooth images closely.
+    height, width = shape[:2]
+    image = np.add.outer(np.arange(height), np.arange(width)) % 256
+    return np.broadcast_to(image.reshape(height, width, *([1] * (len(shape) - 2))), shape).astype(np.uint8)
+
+
+@pytest.mark.parametrize("format", image_codec.FORMATS)
+@pytest.mark.parametrize("shape", [(48, 64, 3), (48, 64), (48, 64, 1)])
+def test_encode_decode(format: str, shape: Tuple[int, ...]):
+    image = _smooth_image(shape)
+    encoded = image_codec.encode(image, image_codec.ImageCodec(format, quality=95))
+    decoded = image_codec.decode(encoded)
+
+    assert decoded.dtype == np.uint8
+    assert decoded.shape == image.shape
+    if format == "png":
+        np.testing.assert_array_equal(decoded, image)
+    else:
+        assert np.abs(decoded.astype(np.int32) - image).mean() < 5
+
+
+def test_encode_channels_first():
+    image = np.ascontiguousarray(np.transpose(_smooth_image((48, 64, 3)), (2, 0, 1)))
+    decoded = image_codec.decode(image_codec.encode(image, image_codec.ImageCodec("png")))
+    np.testing.assert_array_equal(decoded, image)
+
+
+def test_encode_images():
+    obs = {
+        "images": {"cam_high": _smooth_image((48, 64, 3)), "cam_low": _smooth_image((48, 64, 3))},
+        "state": np.zeros(7),
+    }
+    encoded = image_codec.encode_images(obs, {"images/cam_high": image_codec.ImageCodec("png")})
+    assert isinstance(encoded["images"]["cam_high"], image_codec.EncodedImage)
+    assert encoded["images"]["cam_low"] is obs["images"]["cam_low"]
+
+    decoded = image_codec.decode_images(msgpack_numpy.unpackb(msgpack_numpy.packb(encoded)))
+    np.testing.assert_array_equal(decoded["images"]["cam_high"], obs["images"]["cam_high"])
+    np.testing.assert_array_equal(decoded["images"]["cam_low"], obs["images"]["cam_low"])
+    np.testing.assert_array_equal(decoded["state"], obs["state"])
+
+
+def test_negotiate():
+    codecs = {"a": image_codec.ImageCodec("jpeg"), "b": image_codec.ImageCodec("webp")}
+    assert image_codec.negotiate(codecs, {image_codec.METADATA_KEY: ["jpeg", "png"]}) == {"a": codecs["a"]}
+    assert image_codec.negotiate(codecs, {}) == {}
+
+
+def test_invalid_codec():
+    with pytest.raises(ValueError, match="Unsupported image format"):
+        image_codec.ImageCodec("gif")
+
+
+def test_encode_invalid_image():
+    with pytest.raises(ValueError, match="Only uint8 images"):
+        image_codec.encode(np.zeros((48, 64, 3), dtype=np.float32), image_codec.ImageCodec("jpeg"))
+    with pytest.raises(ValueError, match="JPEG does not support an alpha channel"):
+        image_codec.encode(_smooth_image((48, 64, 4)), image_codec.ImageCodec("jpeg"))
+    with pytest.raises(ValueError, match="Only grayscale, RGB and RGBA images"):
+        image_codec.encode(_smooth_image((48, 64, 2)), image_codec.ImageCodec("png"))
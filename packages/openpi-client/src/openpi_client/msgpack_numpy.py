@@ -8,6 +8,19 @@ msgpack is good for (de)serializing data over a network for multiple reasons:
 - msgpack is fast and efficient (as opposed to readable formats like JSON/YAML/etc); I found that msgpack was ~4x faster
     than pickle for serializing large arrays using the below strategy
 
+Array data is handed to msgpack as a `memoryview`, so it is copied straight into the packer's buffer without an
+intermediate `bytes` object. Unpacked arrays are read-only views into the received data; code that needs to modify them
+must make a copy first. To also avoid allocating a new output buffer for every message, create the packer with
+`autoreset=False` and send its buffer directly:
+
+    packer = Packer(autoreset=False)
+    try:
+        packer.pack(obj)
+        with packer.getbuffer() as buffer:
+            send(buffer)
+    finally:
+        packer.reset()
+
 The code below is adapted from https://github.com/lebedov/msgpack-numpy. The reason not to use that library directly is
 that it falls back to pickle for object arrays.
 """
@@ -17,6 +30,8 @@ import functools
 import msgpack
 import numpy as np
 
+from openpi_client import image_codec
+
 
 def pack_array(obj):
     if (isinstance(obj, (np.ndarray, np.generic))) and obj.dtype.kind in ("V", "O", "c"):
@@ -25,7 +40,7 @@ def pack_array(obj):
     if isinstance(obj, np.ndarray):
         return {
             b"__ndarray__": True,
-            b"data": obj.tobytes(),
+            b"data": _as_buffer(obj),
             b"dtype": obj.dtype.str,
             b"shape": obj.shape,
         }
@@ -37,9 +52,23 @@ def pack_array(obj):
             b"dtype": obj.dtype.str,
         }
 
+    if isinstance(obj, image_codec.EncodedImage):
+        return {
+            b"__image__": True,
+            b"data": obj.data,
+            b"format": obj.format,
+            b"shape": obj.shape,
+            b"channels_first": obj.channels_first,
+        }
+
     return obj
 
 
+def _as_buffer(obj: np.ndarray) -> memoryview:
+    # Only non-contiguous arrays are copied. Viewing the data as flat bytes also supports 0-d and empty arrays.
+    return memoryview(np.ascontiguousarray(obj).reshape(-1).view(np.uint8))
+
+
 def unpack_array(obj):
     if b"__ndarray__" in obj:
         return np.ndarray(buffer=obj[b"data"], dtype=np.dtype(obj[b"dtype"]), shape=obj[b"shape"])
@@ -47,6 +76,16 @@ def unpack_array(obj):
     if b"__npgeneric__" in obj:
         return np.dtype(obj[b"dtype"]).type(obj[b"data"])
 
+    if b"__image__" in obj:
+        # Images are decoded separately (see `image_codec.decode_images`), so that decoding can be timed and run in a
+        # thread pool.
+        return image_codec.EncodedImage(
+            data=obj[b"data"],
+            format=obj[b"format"],
+            shape=tuple(obj[b"shape"]),
+            channels_first=obj[b"channels_first"],
+        )
+
     return obj
 
 
@@ -43,3 +43,27 @@ def test_pack_unpack(data):
     packed = msgpack_numpy.packb(data)
     unpacked = msgpack_numpy.unpackb(packed)
     tree.map_structure(_check, data, unpacked)
+
+
+def test_pack_non_contiguous():
+    data = np.arange(24, dtype=np.int32).reshape(2, 3, 4)[:, ::2, 1:]
+    unpacked = msgpack_numpy.unpackb(msgpack_numpy.packb(data))
+    _check(data, unpacked)
+
+
+def test_pack_empty():
+    data = np.zeros((0, 3), dtype=np.float32)
+    _check(data, msgpack_numpy.unpackb(msgpack_numpy.packb(data)))
+
+
+def test_packer_buffer_reuse():
+    packer = msgpack_numpy.Packer(autoreset=False)
+    for i in range(3):
+        data = {"image": np.full((4, 5, 3), i, dtype=np.uint8)}
+        try:
+            packer.pack(data)
+            with packer.getbuffer() as buffer:
+                unpacked = msgpack_numpy.unpackb(buffer)
+        finally:
+            packer.reset()
+        _check(data["image"], unpacked["image"])
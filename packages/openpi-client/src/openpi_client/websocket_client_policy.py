@@ -1,33 +1,78 @@
+import concurrent.futures
 import logging
+import threading
 import time
 from typing import Dict, Optional, Tuple
 
-from typing_extensions import override
 import websockets.sync.client
+from typing_extensions import override
 
 from openpi_client import base_policy as _base_policy
+from openpi_client import image_codec as _image_codec
 from openpi_client import msgpack_numpy
 
+logger = logging.getLogger(__name__)
+
+# Key of the request ID in pipelined requests and their responses.
+REQUEST_ID_KEY = "__request_id__"
+# Key in the server metadata that holds the number of requests per connection that the server processes concurrently.
+# Servers that don't set it answer requests strictly one at a time.
+MAX_IN_FLIGHT_REQUESTS_KEY = "max_in_flight_requests"
+
 
 class WebsocketClientPolicy(_base_policy.BasePolicy):
     """Implements the Policy interface by communicating with a server over websocket.
 
     See WebsocketPolicyServer for a corresponding server implementation.
+
+    Images can optionally be compressed before they are sent by passing `image_codecs`, which maps observation keys
+    (nested keys joined with "/", e.g., "images/cam_high") to the codec to use for that image. Codecs that the server
+    does not support are ignored and the corresponding images are sent raw.
+
+    `infer_async` sends an observation without waiting for the result. If the server supports pipelining, several
+    requests can be in flight on the connection at once; responses are matched to their requests by an ID and are
+    received on a background thread.
     """
 
-    def __init__(self, host: str = "0.0.0.0", port: Optional[int] = None, api_key: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: Optional[int] = None,
+        api_key: Optional[str] = None,
+        image_codecs: Optional[Dict[str, _image_codec.ImageCodec]] = None,
+    ) -> None:
         self._uri = f"ws://{host}"
         if port is not None:
             self._uri += f":{port}"
-        self._packer = msgpack_numpy.Packer()
+        # The packer's buffer is reused for every observation to avoid allocating a new buffer per request.
+        self._packer = msgpack_numpy.Packer(autoreset=False)
         self._api_key = api_key
         self._ws, self._server_metadata = self._wait_for_server()
 
+        image_codecs = image_codecs or {}
+        self._image_codecs = _image_codec.negotiate(image_codecs, self._server_metadata)
+        unsupported = sorted(image_codecs.keys() - self._image_codecs.keys())
+        if unsupported:
+            logger.warning(f"The server does not support the image codecs for {unsupported}. Sending them raw.")
+
+        # Serializes access to the packer and the connection.
+        self._send_lock = threading.Lock()
+        self._pipelined = MAX_IN_FLIGHT_REQUESTS_KEY in self._server_metadata
+        if self._pipelined:
+            self._next_request_id = 0
+            self._pending: Dict[int, Tuple[concurrent.futures.Future, float]] = {}
+            self._pending_lock = threading.Lock()
+            self._receive_error: Optional[Exception] = None
+            threading.Thread(target=self._receive_loop, name="websocket-client-receiver", daemon=True).start()
+        else:
+            # Servers without pipelining answer one request at a time, so async requests are sent from a single thread.
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
     def get_server_metadata(self) -> Dict:
         return self._server_metadata
 
     def _wait_for_server(self) -> Tuple[websockets.sync.client.ClientConnection, Dict]:
-        logging.info(f"Waiting for server at {self._uri}...")
+        logger.info(f"Waiting for server at {self._uri}...")
         while True:
             try:
                 headers = {"Authorization": f"Api-Key {self._api_key}"} if self._api_key else None
@@ -37,19 +82,84 @@ class WebsocketClientPolicy(_base_policy.BasePolicy):
                 metadata = msgpack_numpy.unpackb(conn.recv())
                 return conn, metadata
             except ConnectionRefusedError:
-                logging.info("Still waiting for server...")
+                logger.info("Still waiting for server...")
                 time.sleep(5)
 
     @override
-    def infer(self, obs: Dict) -> Dict:  # noqa: UP006
-        data = self._packer.pack(obs)
-        self._ws.send(data)
-        response = self._ws.recv()
+    def infer(self, obs: Dict) -> Dict:
+        if self._pipelined:
+            return self.infer_async(obs).result()
+
+        obs, encode_time = self._encode(obs)
+        with self._send_lock:
+            self._send(obs)
+            response = self._unpack_response(self._ws.recv())
+        response["client_timing"] = {"encode_ms": encode_time * 1000}
+        return response
+
+    def infer_async(self, obs: Dict) -> concurrent.futures.Future:
+        """Sends an observation to the server and returns a future for the result of `infer`.
+
+        The observation is sent before this method returns, so it may be modified afterwards.
+        """
+        if not self._pipelined:
+            return self._executor.submit(self.infer, obs)
+
+        obs, encode_time = self._encode(obs)
+        future = concurrent.futures.Future()
+        with self._pending_lock:
+            if self._receive_error is not None:
+                raise RuntimeError("The connection to the server was lost.") from self._receive_error
+            request_id = self._next_request_id
+            self._next_request_id += 1
+            self._pending[request_id] = (future, encode_time)
+        try:
+            with self._send_lock:
+                self._send({**obs, REQUEST_ID_KEY: request_id})
+        except Exception:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise
+        return future
+
+    def _encode(self, obs: Dict) -> Tuple[Dict, float]:
+        encode_time = time.monotonic()
+        if self._image_codecs:
+            obs = _image_codec.encode_images(obs, self._image_codecs)
+        return obs, time.monotonic() - encode_time
+
+    def _send(self, obs: Dict) -> None:
+        try:
+            self._packer.pack(obs)
+            with self._packer.getbuffer() as buffer:
+                self._ws.send(buffer)
+        finally:
+            self._packer.reset()
+
+    def _unpack_response(self, response) -> Dict:
         if isinstance(response, str):
             # we're expecting bytes; if the server sends a string, it's an error.
             raise RuntimeError(f"Error in inference server:\n{response}")
         return msgpack_numpy.unpackb(response)
 
+    def _receive_loop(self) -> None:
+        """Receives the responses to pipelined requests and resolves the corresponding futures."""
+        try:
+            while True:
+                # If the server sends an error, it closes the connection afterwards, so all pending requests fail.
+                response = self._unpack_response(self._ws.recv())
+                with self._pending_lock:
+                    future, encode_time = self._pending.pop(response.pop(REQUEST_ID_KEY))
+                response["client_timing"] = {"encode_ms": encode_time * 1000}
+                future.set_result(response)
+        except Exception as e:  # noqa: BLE001
+            with self._pending_lock:
+                self._receive_error = e
+                pending = list(self._pending.values())
+                self._pending.clear()
+            for future, _ in pending:
+                future.set_exception(e)
+
     @override
     def reset(self) -> None:
         pass
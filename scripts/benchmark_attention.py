@@ -0,0 +1,77 @@
+"""Benchmarks full and query-chunked attention of the JAX Gemma model.
+
+Runs the forward and backward pass of a small Gemma mixture on a long prefix-LM sequence and reports the temporary
+memory of the compiled computation next to its throughput. The default dimensions are small enough to run on a CPU,
+while the sequence length matches a Pi0 prefix with three cameras.
+"""
+
+import dataclasses
+import time
+
+from flax import nnx
+import flax.nnx.bridge as nnx_bridge
+import jax
+import jax.numpy as jnp
+import tyro
+
+from openpi.models import gemma as _gemma
+from openpi.models import pi0
+
+
+@dataclasses.dataclass
+class Args:
+    # Gemma variants of the prefix and the suffix expert.
+    variants: tuple[str, str] = ("dummy", "dummy")
+    batch_size: int = 4
+    # Number of prefix tokens with bidirectional attention (e.g., 3 images with 256 tokens and 48 language tokens).
+    prefix_len: int = 816
+    # Number of suffix tokens with causal attention to the prefix.
+    suffix_len: int = 51
+    # Chunk sizes to compare. None is full attention.
+    chunk_sizes: tuple[int | None, ...] = (None, 512, 256, 128)
+    # Number of timed calls per setting.
+    num_iters: int = 5
+
+
+def main(args: Args) -> None:
+    configs = [_gemma.get_config(variant) for variant in args.variants]
+    rng = jax.random.key(0)
+    seq_len = args.prefix_len + args.suffix_len
+    embedded = [
+        jax.random.normal(jax.random.fold_in(rng, i), (args.batch_size, length, config.width))
+        for i, (config, length) in enumerate(zip(configs, (args.prefix_len, args.suffix_len), strict=True))
+    ]
+    input_mask = jnp.ones((args.batch_size, seq_len), dtype=bool)
+    mask_ar = jnp.zeros((args.batch_size, seq_len), dtype=bool).at[:, args.prefix_len].set(True)
+    attn_mask = pi0.make_attn_mask(input_mask, mask_ar)
+    positions = jnp.broadcast_to(jnp.arange(seq_len), (args.batch_size, seq_len))
+
+    print(f"{'chunk':>6} {'temp memory':>12} {'latency':>10} {'tokens/s':>10}")
+    for chunk_size in args.chunk_sizes:
+        llm = nnx_bridge.ToNNX(_gemma.Module(configs=configs, embed_dtype="bfloat16", attn_chunk_size=chunk_size))
+        llm.lazy_init(rngs=nnx.Rngs(0), method="init", use_adarms=[False] * len(configs))
+        graphdef, state = nnx.split(llm)
+
+        @jax.jit
+        def train_step(state, embedded, graphdef=graphdef):
+            def loss_fn(state):
+                outputs, _ = nnx.merge(graphdef, state)(embedded, positions, attn_mask)
+                return sum(jnp.mean(jnp.square(out.astype(jnp.float32))) for out in outputs)
+
+            return jax.grad(loss_fn)(state)
+
+        compiled = train_step.lower(state, embedded).compile()
+        memory = compiled.memory_analysis()
+        temp_mb = f"{memory.temp_size_in_bytes / 2**20:>10.1f}MB" if memory is not None else f"{'n/a':>12}"
+
+        jax.block_until_ready(compiled(state, embedded))
+        start = time.perf_counter()
+        for _ in range(args.num_iters):
+            jax.block_until_ready(compiled(state, embedded))
+        latency = (time.perf_counter() - start) / args.num_iters
+        chunk_str = "-" if chunk_size is None else str(chunk_size)
+        print(f"{chunk_str:>6} {temp_mb} {latency * 1000:>8.1f}ms {args.batch_size * seq_len / latency:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(tyro.cli(Args))
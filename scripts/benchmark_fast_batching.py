@@ -0,0 +1,88 @@
+"""Benchmarks batched decoding of Pi0FAST models.
+
+Decodes batches of observations with `Pi0FAST.sample_actions`, which decodes every sequence of the batch until the last
+one is finished, and with `pi0_fast.CompactingDecoder`, which removes finished sequences from the batch every
+`--compact-every` tokens. Reports the decoded tokens (up to and including EOS) per second for each batch size.
+
+The observations have random prompts, so that the sequences of a batch differ. A randomly initialized model rarely
+decodes EOS, so use a checkpoint (`--dir`) to measure the effect of sequences of different lengths.
+"""
+
+import dataclasses
+import time
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+import tyro
+
+from openpi.models import model as _model
+from openpi.models import pi0_fast
+from openpi.shared import download
+from openpi.shared import nnx_utils
+from openpi.training import config as _config
+
+
+@dataclasses.dataclass
+class Args:
+    # Training config name of a Pi0FAST model (e.g., "pi0_fast_droid").
+    config: str
+    # Checkpoint directory. If not provided, the model is randomly initialized.
+    dir: str | None = None
+    # Batch sizes to compare.
+    batch_sizes: tuple[int, ...] = (1, 2, 4, 8, 16, 32)
+    # Maximum number of decoded tokens.
+    max_decoding_steps: int = 256
+    # Number of decoded tokens between removing finished sequences from the batch.
+    compact_every: int = 16
+    # Number of timed calls per setting.
+    num_iters: int = 3
+
+
+def num_decoded_tokens(tokens: np.ndarray) -> int:
+    is_eos = tokens == pi0_fast.PALIGEMMA_EOS_TOKEN
+    lengths = np.where(is_eos.any(axis=-1), np.argmax(is_eos, axis=-1) + 1, tokens.shape[-1])
+    return int(np.sum(lengths))
+
+
+def main(args: Args) -> None:
+    train_config = _config.get_config(args.config)
+    rng = jax.random.key(0)
+    if args.dir is None:
+        model = train_config.model.create(rng)
+    else:
+        params = _model.restore_params(download.maybe_download(args.dir) / "params", dtype=jnp.bfloat16)
+        model = train_config.model.load(params)
+    if not isinstance(model, pi0_fast.Pi0FAST):
+        raise ValueError(f"{args.config} is not a Pi0FAST config.")
+
+    sample_actions = nnx_utils.module_jit(model.sample_actions, static_argnames=["max_decoding_steps"])
+    decoder = pi0_fast.CompactingDecoder(model, compact_every=args.compact_every)
+    methods = {
+        "batched": lambda obs: np.asarray(sample_actions(rng, obs, max_decoding_steps=args.max_decoding_steps)),
+        "compacted": lambda obs: decoder.sample_actions(rng, obs, max_decoding_steps=args.max_decoding_steps),
+    }
+
+    print(f"{'batch':>5} {'tokens':>7} " + " ".join(f"{name + ' tok/s':>15}" for name in methods))
+    for batch_size in args.batch_sizes:
+        obs = train_config.model.fake_obs(batch_size)
+        prompt_rng, rng = jax.random.split(rng)
+        obs = dataclasses.replace(
+            obs,
+            tokenized_prompt=jax.random.randint(prompt_rng, obs.tokenized_prompt.shape, 2, 1000),
+            tokenized_prompt_mask=jnp.ones_like(obs.tokenized_prompt_mask),
+        )
+
+        throughputs = []
+        for method in methods.values():
+            # Compile outside of the timed calls.
+            num_tokens = num_decoded_tokens(method(obs))
+            start = time.perf_counter()
+            for _ in range(args.num_iters):
+                method(obs)
+            throughputs.append(num_tokens * args.num_iters / (time.perf_counter() - start))
+        print(f"{batch_size:>5} {num_tokens:>7} " + " ".join(f"{throughput:>15.1f}" for throughput in throughputs))
+
+
+if __name__ == "__main__":
+    main(tyro.cli(Args))
@@ -0,0 +1,67 @@
+"""Benchmarks speculative decoding of Pi0FAST models.
+
+Decodes the same observations greedily with different numbers of drafted tokens per step (see
+`Pi0FASTConfig.num_draft_tokens`) and reports the latency next to whether the decoded tokens are identical to decoding
+without drafts. Drafts are only accepted where the decoded tokens repeat earlier token sequences, so the speedup depends
+on the checkpoint and the observations.
+"""
+
+import dataclasses
+import time
+
+import flax.nnx as nnx
+import jax
+import jax.numpy as jnp
+import numpy as np
+import tyro
+
+from openpi.models import model as _model
+from openpi.shared import download
+from openpi.shared import nnx_utils
+from openpi.training import config as _config
+
+
+@dataclasses.dataclass
+class Args:
+    # Training config name of a Pi0FAST model (e.g., "pi0_fast_droid").
+    config: str
+    # Checkpoint directory. If not provided, the model is randomly initialized.
+    dir: str | None = None
+    # Batch size of the decoded observations.
+    batch_size: int = 1
+    # Maximum number of decoded tokens.
+    max_decoding_steps: int = 256
+    # Numbers of drafted tokens to compare.
+    num_draft_tokens: tuple[int, ...] = (0, 2, 4, 8)
+    # Number of timed calls per setting.
+    num_iters: int = 5
+
+
+def main(args: Args) -> None:
+    train_config = _config.get_config(args.config)
+    rng = jax.random.key(0)
+    if args.dir is None:
+        params = nnx.state(train_config.model.create(rng)).to_pure_dict()
+    else:
+        params = _model.restore_params(download.maybe_download(args.dir) / "params", dtype=jnp.bfloat16)
+    obs = train_config.model.fake_obs(args.batch_size)
+
+    baseline = None
+    print(f"{'drafts':>6} {'latency':>10} {'identical':>9}")
+    for num_draft_tokens in args.num_draft_tokens:
+        model = dataclasses.replace(train_config.model, num_draft_tokens=num_draft_tokens).load(params)
+        sample_actions = nnx_utils.module_jit(model.sample_actions, static_argnames=["max_decoding_steps"])
+        # Compile outside of the timed calls.
+        tokens = np.asarray(sample_actions(rng, obs, max_decoding_steps=args.max_decoding_steps))
+        start = time.perf_counter()
+        for _ in range(args.num_iters):
+            jax.block_until_ready(sample_actions(rng, obs, max_decoding_steps=args.max_decoding_steps))
+        latency = (time.perf_counter() - start) / args.num_iters
+
+        if baseline is None:
+            baseline = tokens
+        print(f"{num_draft_tokens:>6} {latency * 1000:>8.1f}ms {np.array_equal(tokens, baseline)!s:>9}")
+
+
+if __name__ == "__main__":
+    main(tyro.cli(Args))
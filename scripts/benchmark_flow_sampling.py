@@ -0,0 +1,110 @@
+"""Benchmarks the flow matching solvers of Pi0 models.
+
+Samples actions with every combination of solver, number of steps and timestep schedule and reports the latency next to
+the mean squared error against the actions of the default 10 step Euler sampler. All settings use the same
+observations and initial noise, so the error only measures the integration error of the solver.
+"""
+
+import dataclasses
+import itertools
+import time
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+import tyro
+
+from openpi.models import flow_sampling
+from openpi.models import model as _model
+from openpi.shared import download
+from openpi.shared import nnx_utils
+from openpi.training import config as _config
+
+
+@dataclasses.dataclass
+class Args:
+    # Training config name of a Pi0 model (e.g., "pi0_aloha_sim").
+    config: str
+    # Checkpoint directory (e.g., "checkpoints/pi0_aloha_sim/exp/10000"). If not provided, the model is randomly
+    # initialized, which is only useful to measure latency.
+    dir: str | None = None
+    # Batch size of the sampled observations.
+    batch_size: int = 1
+    # Number of timed calls per setting.
+    num_iters: int = 10
+    # Number of steps of the Euler baseline.
+    baseline_steps: int = 10
+    # Solvers to compare.
+    solvers: tuple[str, ...] = flow_sampling.SOLVERS
+    # Numbers of steps to compare.
+    num_steps: tuple[int, ...] = (2, 3, 4, 5)
+    # Timestep schedules to compare. See `flow_sampling.timestep`.
+    time_shifts: tuple[float, ...] = (1.0, 2.0)
+    # Early exit thresholds to compare. None disables the early exit. With an early exit, the number of velocity
+    # evaluations that is reported is an upper bound.
+    early_exit_thresholds: tuple[float | None, ...] = (None,)
+
+
+def _make_obs(model_config: _model.BaseModelConfig, batch_size: int, rng: jax.Array) -> _model.Observation:
+    obs = model_config.fake_obs(batch_size)
+    image_rng, state_rng = jax.random.split(rng)
+    images = {
+        name: jax.random.uniform(jax.random.fold_in(image_rng, i), image.shape, minval=-1.0, maxval=1.0)
+        for i, (name, image) in enumerate(obs.images.items())
+    }
+    state = jax.random.normal(state_rng, obs.state.shape)
+    return dataclasses.replace(obs, images=images, state=state)
+
+
+def main(args: Args) -> None:
+    train_config = _config.get_config(args.config)
+    rng = jax.random.key(0)
+    if args.dir is None:
+        model = train_config.model.create(rng)
+    else:
+        checkpoint_dir = download.maybe_download(args.dir)
+        model = train_config.model.load(_model.restore_params(checkpoint_dir / "params", dtype=jnp.bfloat16))
+    sample_actions = nnx_utils.module_jit(model.sample_actions, static_argnames=["solver"])
+
+    obs_rng, noise_rng = jax.random.split(rng)
+    obs = _make_obs(train_config.model, args.batch_size, obs_rng)
+    noise = jax.random.normal(noise_rng, (args.batch_size, model.action_horizon, model.action_dim))
+
+    def run(
+        solver: str, num_steps: int, time_shift: float, early_exit_threshold: float | None
+    ) -> tuple[np.ndarray, float]:
+        kwargs = {
+            "num_steps": num_steps,
+            "noise": noise,
+            "solver": solver,
+            "time_shift": time_shift,
+            "early_exit_threshold": early_exit_threshold,
+        }
+        # Compile outside of the timed calls.
+        actions = jax.block_until_ready(sample_actions(rng, obs, **kwargs))
+        start = time.perf_counter()
+        for _ in range(args.num_iters):
+            jax.block_until_ready(sample_actions(rng, obs, **kwargs))
+        return np.asarray(actions, dtype=np.float32), (time.perf_counter() - start) / args.num_iters
+
+    baseline, baseline_latency = run("euler", args.baseline_steps, 1.0, None)
+    print(f"{'solver':>8} {'steps':>5} {'shift':>5} {'exit':>6} {'evals':>5} {'latency':>10} {'mse':>10}")
+    print(
+        f"{'euler':>8} {args.baseline_steps:>5} {1.0:>5.1f} {'-':>6} {args.baseline_steps:>5} "
+        f"{baseline_latency * 1000:>8.1f}ms {0.0:>10.2e}"
+    )
+    for solver, num_steps, time_shift, threshold in itertools.product(
+        args.solvers, args.num_steps, args.time_shifts, args.early_exit_thresholds
+    ):
+        actions, latency = run(solver, num_steps, time_shift, threshold)
+        mse = float(np.mean(np.square(actions - baseline)))
+        evals = flow_sampling.num_function_evals(solver, num_steps)
+        exit_str = "-" if threshold is None else f"{threshold:g}"
+        print(
+            f"{solver:>8} {num_steps:>5} {time_shift:>5.1f} {exit_str:>6} {evals:>5} "
+            f"{latency * 1000:>8.1f}ms {mse:>10.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main(tyro.cli(Args))
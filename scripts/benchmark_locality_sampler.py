@@ -0,0 +1,103 @@
+"""Benchmarks shuffling a LeRobot video dataset with `EpisodeLocalitySampler`.
+
+Loads batches of a LeRobot dataset with uniformly shuffled frames and with `EpisodeLocalitySampler` for different window
+sizes and episodes per block. Frames are decoded with `LeRobotDatasetWithFrameCache`, so that workers reuse the decoded
+video segments of nearby frames. For each setting, reports:
+- the loaded frames per second and the hit rate of the frame cache,
+- the mean number of distinct episodes in a batch and the fraction of pairs of frames in a batch that come from the same
+  episode (over one epoch), as measures of the correlation of the samples in a batch.
+"""
+
+import copy
+import dataclasses
+import multiprocessing
+import time
+
+import lerobot.common.datasets.lerobot_dataset as lerobot_dataset
+import numpy as np
+import torch
+import tyro
+
+from openpi.training import data_loader as _data_loader
+from openpi.training import lerobot_dataset_with_frame_cache as _frame_cache
+
+
+@dataclasses.dataclass
+class Args:
+    # LeRobot repo id of a video dataset.
+    repo_id: str
+    # (window size, episodes per block) of the compared samplers.
+    settings: tuple[tuple[int, int], ...] = ((4, 8), (16, 8), (16, 32), (64, 32))
+    batch_size: int = 32
+    num_workers: int = 4
+    # Number of timed batches per setting.
+    num_batches: int = 50
+    # Number of decoded video segments that each worker caches.
+    max_segments: int = 64
+
+
+def batch_correlation(indices: np.ndarray, episode_index: np.ndarray, batch_size: int) -> tuple[float, float]:
+    """Returns the mean number of distinct episodes per batch and the fraction of same-episode pairs in a batch."""
+    num_batches = len(indices) // batch_size
+    batch_episodes = episode_index[indices[: num_batches * batch_size]].reshape(num_batches, batch_size)
+    num_episodes = np.mean([len(np.unique(episodes)) for episodes in batch_episodes])
+    # Pairs of different frames of the same batch.
+    num_same_episode = np.sum(batch_episodes[:, :, None] == batch_episodes[:, None, :]) - num_batches * batch_size
+    same_episode_pairs = num_same_episode / (num_batches * batch_size * (batch_size - 1))
+    return float(num_episodes), float(same_episode_pairs)
+
+
+def main(args: Args) -> None:
+    dataset_meta = lerobot_dataset.LeRobotDatasetMetadata(args.repo_id)
+    episode_lengths = [dataset_meta.episodes[i]["length"] for i in sorted(dataset_meta.episodes)]
+    episode_index = np.repeat(np.arange(len(episode_lengths)), episode_lengths)
+
+    samplers = {"uniform": None}
+    for window_size, episodes_per_block in args.settings:
+        samplers[f"window={window_size} block={episodes_per_block}"] = _data_loader.EpisodeLocalitySampler(
+            episode_lengths,
+            window_size=window_size,
+            episodes_per_block=episodes_per_block,
+            batch_size=args.batch_size,
+            num_workers=args.num_workers,
+        )
+
+    print(f"{'sampler':>24} {'frames/s':>9} {'hit rate':>9} {'episodes/batch':>15} {'same-episode pairs':>19}")
+    for name, sampler in samplers.items():
+        # New workers and caches for every sampler.
+        dataset = _frame_cache.LeRobotDatasetWithFrameCache(
+            args.repo_id, video_backend="pyav", max_segments=args.max_segments
+        )
+        loader = torch.utils.data.DataLoader(
+            dataset,
+            batch_size=args.batch_size,
+            shuffle=sampler is None,
+            sampler=sampler,
+            num_workers=args.num_workers,
+            multiprocessing_context=multiprocessing.get_context("spawn") if args.num_workers > 0 else None,
+            drop_last=True,
+        )
+        # The correlation is computed from the same epoch as the timed batches: a copy of the sampler produces the
+        # order of its next epoch without advancing it. The uniform shuffle is measured on an independent permutation.
+        indices = np.random.permutation(len(dataset)) if sampler is None else np.array(list(copy.deepcopy(sampler)))
+        num_episodes, same_episode_pairs = batch_correlation(indices, episode_index, args.batch_size)
+
+        data_iter = iter(loader)
+        # Exclude starting the workers.
+        next(data_iter)
+        dataset.frame_cache.stats(reset=True)
+        start = time.perf_counter()
+        for _ in range(args.num_batches):
+            next(data_iter)
+        throughput = args.num_batches * args.batch_size / (time.perf_counter() - start)
+        hits, misses = dataset.frame_cache.stats()
+        del data_iter
+
+        print(
+            f"{name:>24} {throughput:>9.1f} {hits / (hits + misses):>9.1%} {num_episodes:>15.1f} "
+            f"{same_episode_pairs:>19.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main(tyro.cli(Args))
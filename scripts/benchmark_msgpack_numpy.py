@@ -0,0 +1,99 @@
+"""Benchmarks the throughput of msgpack_numpy for typical robot observations.
+
+Compares the current implementation, which packs arrays through a `memoryview` into a reused buffer, with the previous
+implementation, which copied every array with `tobytes()` and allocated a new output buffer per message.
+"""
+
+from collections.abc import Callable, Iterator
+import contextlib
+import dataclasses
+import time
+
+import msgpack
+import numpy as np
+from openpi_client import msgpack_numpy
+import tyro
+
+
+@dataclasses.dataclass
+class Args:
+    # Number of camera images per observation.
+    num_cameras: int = 3
+    # Image height.
+    height: int = 480
+    # Image width.
+    width: int = 640
+    # Number of messages to pack and unpack per implementation.
+    num_iters: int = 200
+
+
+def _pack_array_tobytes(obj):
+    if isinstance(obj, np.ndarray):
+        return {
+            b"__ndarray__": True,
+            b"data": obj.tobytes(),
+            b"dtype": obj.dtype.str,
+            b"shape": obj.shape,
+        }
+    return msgpack_numpy.pack_array(obj)
+
+
+def _make_obs(args: Args) -> dict:
+    rng = np.random.default_rng(0)
+    return {
+        "images": {
+            f"cam_{i}": rng.integers(0, 256, size=(args.height, args.width, 3), dtype=np.uint8)
+            for i in range(args.num_cameras)
+        },
+        "state": rng.standard_normal(14).astype(np.float32),
+        "prompt": "pick up the cube",
+    }
+
+
+def _benchmark(name: str, pack: Callable[[dict], contextlib.AbstractContextManager], obs: dict, num_iters: int) -> None:
+    with pack(obs) as data:
+        num_bytes = len(data)
+
+    pack_time = 0.0
+    unpack_time = 0.0
+    for _ in range(num_iters):
+        start = time.perf_counter()
+        with pack(obs) as data:
+            pack_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            msgpack_numpy.unpackb(data)
+            unpack_time += time.perf_counter() - start
+
+    total_bytes = num_bytes * num_iters
+    print(
+        f"{name:>10}: {num_bytes / 1e6:.2f} MB/message, "
+        f"pack {total_bytes / pack_time / 1e9:.2f} GB/s ({pack_time / num_iters * 1000:.2f} ms), "
+        f"unpack {total_bytes / unpack_time / 1e9:.2f} GB/s ({unpack_time / num_iters * 1000:.2f} ms)"
+    )
+
+
+def main(args: Args) -> None:
+    obs = _make_obs(args)
+
+    @contextlib.contextmanager
+    def pack_tobytes(obj: dict) -> Iterator[bytes]:
+        yield msgpack.packb(obj, default=_pack_array_tobytes)
+
+    packer = msgpack_numpy.Packer(autoreset=False)
+
+    @contextlib.contextmanager
+    def pack_memoryview(obj: dict) -> Iterator[memoryview]:
+        try:
+            packer.pack(obj)
+            with packer.getbuffer() as buffer:
+                yield buffer
+        finally:
+            packer.reset()
+
+    _benchmark("tobytes", pack_tobytes, obs, args.num_iters)
+    _benchmark("memoryview", pack_memoryview, obs, args.num_iters)
+
+
+if __name__ == "__main__":
+    main(tyro.cli(Args))
@@ -16,10 +16,13 @@ import openpi.training.data_loader as _data_loader
 import openpi.transforms as transforms
 
 
-class RemoveStrings(transforms.DataTransformFn):
+class RemoveStrings(transforms.BatchedDataTransformFn):
     def __call__(self, x: dict) -> dict:
         return {k: v for k, v in x.items() if not np.issubdtype(np.asarray(v).dtype, np.str_)}
 
+    def batched(self, x: dict) -> dict:
+        return self(x)
+
 
 def create_torch_dataloader(
     data_config: _config.DataConfig,
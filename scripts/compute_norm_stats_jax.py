@@ -14,6 +14,7 @@ import numpy as np
 import tqdm
 import tyro
 
+import openpi.shared.compilation_cache as compilation_cache
 import openpi.shared.normalize as normalize
 import openpi.training.config as _config
 import openpi.training.data_loader as _data_loader
@@ -250,6 +251,8 @@ def main(config_name: str, max_frames: int | None = None, *, use_fast_stats: boo
     max_time_minutes = 120  # Maximum runtime in minutes
     start_time = time.time()
 
+    compilation_cache.initialize()
+
     # Print info about JAX devices
     print(f"JAX is using {jax.device_count()} devices: {jax.devices()}")
 
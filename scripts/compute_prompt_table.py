@@ -0,0 +1,39 @@
+"""Precompiles the annotated prompts of a LeRobot dataset.
+
+Builds the prompt of every annotated frame once and writes the unique prompts together with the prompt id of each frame
+to the annotation directory of the dataset (see `PromptTable`). `LeRobotDatasetWithAnnotations` memory-maps this table
+instead of building the prompts from the annotation files during training. Rerun the script when the annotations or the
+prompt template change, since the dataset ignores an outdated table.
+"""
+
+import dataclasses
+import logging
+
+from lerobot.common.datasets import lerobot_dataset
+import tyro
+
+from openpi.training import lerobot_dataset_with_annotations as _annotations
+
+
+@dataclasses.dataclass
+class Args:
+    # LeRobot repo id of the dataset.
+    repo_id: str
+
+
+def main(args: Args) -> None:
+    dataset_meta = lerobot_dataset.LeRobotDatasetMetadata(args.repo_id)
+    # Prompts whose annotation does not define the task are built with the first task of the episode. Frames with a
+    # different task fall back to building their prompt from the annotation file.
+    episode_tasks = {episode_index: episode["tasks"][0] for episode_index, episode in dataset_meta.episodes.items()}
+
+    path = _annotations.write_prompt_table(_annotations.get_annotation_dir(args.repo_id), episode_tasks)
+
+    table = _annotations.PromptTable(path)
+    num_episodes = sum(table.lookup(episode_index, 0) is not None for episode_index in episode_tasks)
+    logging.info(f"Wrote {len(table.prompts)} unique prompts of {num_episodes} annotated episodes to {path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, force=True)
+    main(tyro.cli(Args))
@@ -0,0 +1,109 @@
+"""Quantizes the weights of a Pi0 checkpoint and compares the quantized policy with the original one.
+
+The quantized checkpoint contains int8 Gemma kernels with per-channel scales (see `openpi.models.quantization`) and a copy
+of the original assets. It can be served with `scripts/serve_policy.py --weight-quantization int8`.
+
+If `--record-dir` is given, both policies are run on the observations that `serve_policy.py --record` saved there with
+the same noise, and the action error and latency of the quantized policy are reported.
+"""
+
+import dataclasses
+import logging
+import pathlib
+import shutil
+
+from flax import traverse_util
+import numpy as np
+import orbax.checkpoint as ocp
+import tyro
+
+from openpi.models import model as _model
+from openpi.models import quantization
+from openpi.policies import policy as _policy
+from openpi.policies import policy_config as _policy_config
+from openpi.shared import download
+from openpi.training import config as _config
+
+
+@dataclasses.dataclass
+class Args:
+    # Training config name of a Pi0 model (e.g., "pi0_aloha_sim").
+    config: str
+    # Checkpoint directory (e.g., "checkpoints/pi0_aloha_sim/exp/10000").
+    dir: str
+    # Directory to write the quantized checkpoint to.
+    output_dir: str
+    # Directory with observations recorded by `serve_policy.py --record`. If provided, the original and the quantized
+    # policy are compared on them.
+    record_dir: str | None = None
+    # Maximum number of recorded observations to compare on.
+    max_records: int = 100
+
+
+def quantize_checkpoint(checkpoint_dir: pathlib.Path, output_dir: pathlib.Path) -> None:
+    params = _model.restore_params(checkpoint_dir / "params", restore_type=np.ndarray)
+    quantized_params = quantization.quantize_params(params)
+
+    def num_bytes(params):
+        return sum(x.nbytes for x in traverse_util.flatten_dict(params).values())
+
+    logging.info(f"Params: {num_bytes(params) / 2**30:.2f} GiB -> {num_bytes(quantized_params) / 2**30:.2f} GiB")
+
+    with ocp.PyTreeCheckpointer() as ckptr:
+        ckptr.save((output_dir / "params").resolve(), {"params": quantized_params})
+    if (checkpoint_dir / "assets").exists():
+        shutil.copytree(checkpoint_dir / "assets", output_dir / "assets")
+
+
+def load_records(record_dir: pathlib.Path, max_records: int) -> list[dict]:
+    """Loads the observations recorded by `PolicyRecorder`."""
+    paths = sorted(record_dir.glob("step_*.npy"), key=lambda path: int(path.stem.removeprefix("step_")))
+    records = []
+    for path in paths[:max_records]:
+        data = np.load(path, allow_pickle=True).item()
+        inputs = {key.removeprefix("inputs/"): value for key, value in data.items() if key.startswith("inputs/")}
+        records.append(traverse_util.unflatten_dict(inputs, sep="/"))
+    return records
+
+
+def compare_policies(
+    policy: _policy.Policy, quantized_policy: _policy.Policy, records: list[dict], noise_shape: tuple[int, ...]
+) -> None:
+    rng = np.random.default_rng(0)
+    errors, latencies, quantized_latencies = [], [], []
+    # The first call compiles the models.
+    for i, obs in enumerate([records[0], *records]):
+        noise = rng.standard_normal(noise_shape).astype(np.float32)
+        outputs = policy.infer(obs, noise=noise)
+        quantized_outputs = quantized_policy.infer(obs, noise=noise)
+        if i == 0:
+            continue
+        errors.append(np.abs(np.asarray(quantized_outputs["actions"]) - np.asarray(outputs["actions"])))
+        latencies.append(outputs["policy_timing"]["infer_ms"])
+        quantized_latencies.append(quantized_outputs["policy_timing"]["infer_ms"])
+
+    print(f"Compared {len(records)} observations")
+    print(f"  action error: mean {np.mean(errors):.4g}, max {np.max(errors):.4g}")
+    print(f"  original latency: {np.mean(latencies):.1f}ms")
+    print(f"  quantized latency: {np.mean(quantized_latencies):.1f}ms")
+
+
+def main(args: Args) -> None:
+    checkpoint_dir = download.maybe_download(args.dir)
+    output_dir = pathlib.Path(args.output_dir)
+    quantize_checkpoint(checkpoint_dir, output_dir)
+
+    if args.record_dir is not None:
+        records = load_records(pathlib.Path(args.record_dir), args.max_records)
+        if not records:
+            raise ValueError(f"No recorded observations found in {args.record_dir}.")
+        train_config = _config.get_config(args.config)
+        policy = _policy_config.create_trained_policy(train_config, checkpoint_dir)
+        quantized_policy = _policy_config.create_trained_policy(train_config, output_dir, weight_quantization="int8")
+        noise_shape = (train_config.model.action_horizon, train_config.model.action_dim)
+        compare_policies(policy, quantized_policy, records, noise_shape)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, force=True)
+    main(tyro.cli(Args))
@@ -1,7 +1,9 @@
 import dataclasses
 import enum
+import functools
 import logging
 import socket
+from typing import Literal
 
 import tyro
 
@@ -45,12 +47,30 @@ class Args:
     # If provided, will be used in case the "prompt" key is not present in the data, or if the model doesn't have a default
     # prompt.
     default_prompt: str | None = None
+    # Keyword arguments of the model's `sample_actions` (e.g., `--sample-kwargs num_steps 5 solver heun`). The
+    # compilation cache warmed by `scripts/warm_compilation_cache.py` is only reused with the same kwargs.
+    sample_kwargs: dict[str, int | float | str] = dataclasses.field(default_factory=dict)
 
     # Port to serve the policy on.
     port: int = 8000
     # Record the policy's behavior for debugging.
     record: bool = False
 
+    # Maximum number of concurrent observations (from different connections) that are run through the model as a
+    # single batch. A value of 1 disables batching.
+    max_batch_size: int = 1
+    # Maximum time to wait for a batch to fill up before running inference, in milliseconds.
+    max_batch_wait_ms: float = 5.0
+    # Compile the model for all batch sizes that may be used before serving requests. The health check only passes
+    # once this has finished.
+    warmup: bool = True
+    # Number of camera frames whose image tokens are cached, so that unchanged frames (e.g., from static cameras) are
+    # not embedded again. A value of 0 disables the cache.
+    image_cache_size: int = 0
+    # If set, the weights of the model are quantized, which halves the memory of the Gemma weights. Checkpoints that
+    # are not quantized yet (see `scripts/quantize_checkpoint.py`) are quantized while they are loaded.
+    weight_quantization: Literal["int8"] | None = None
+
     # Specifies how to load the policy. If not provided, the default policy for the environment will be used.
     policy: Checkpoint | Default = dataclasses.field(default_factory=Default)
 
@@ -76,11 +96,23 @@ DEFAULT_CHECKPOINT: dict[EnvMode, Checkpoint] = {
 }
 
 
-def create_default_policy(env: EnvMode, *, default_prompt: str | None = None) -> _policy.Policy:
+def create_default_policy(
+    env: EnvMode,
+    *,
+    default_prompt: str | None = None,
+    sample_kwargs: dict[str, int | float | str] | None = None,
+    image_cache_size: int = 0,
+    weight_quantization: Literal["int8"] | None = None,
+) -> _policy.Policy:
     """Create a default policy for the given environment."""
     if checkpoint := DEFAULT_CHECKPOINT.get(env):
         return _policy_config.create_trained_policy(
-            _config.get_config(checkpoint.config), checkpoint.dir, default_prompt=default_prompt
+            _config.get_config(checkpoint.config),
+            checkpoint.dir,
+            default_prompt=default_prompt,
+            sample_kwargs=sample_kwargs,
+            image_cache_size=image_cache_size,
+            weight_quantization=weight_quantization,
         )
     raise ValueError(f"Unsupported environment mode: {env}")
 
@@ -90,16 +122,35 @@ def create_policy(args: Args) -> _policy.Policy:
     match args.policy:
         case Checkpoint():
             return _policy_config.create_trained_policy(
-                _config.get_config(args.policy.config), args.policy.dir, default_prompt=args.default_prompt
+                _config.get_config(args.policy.config),
+                args.policy.dir,
+                default_prompt=args.default_prompt,
+                sample_kwargs=args.sample_kwargs or None,
+                image_cache_size=args.image_cache_size,
+                weight_quantization=args.weight_quantization,
             )
         case Default():
-            return create_default_policy(args.env, default_prompt=args.default_prompt)
+            return create_default_policy(
+                args.env,
+                default_prompt=args.default_prompt,
+                sample_kwargs=args.sample_kwargs or None,
+                image_cache_size=args.image_cache_size,
+                weight_quantization=args.weight_quantization,
+            )
 
 
 def main(args: Args) -> None:
     policy = create_policy(args)
     policy_metadata = policy.metadata
 
+    warmup = None
+    if args.warmup:
+        # Batches are padded to the policy's batch buckets, so only buckets up to the first one that fits a full batch
+        # are ever used.
+        warmup_batch_sizes = [b for b in policy.batch_buckets if b < args.max_batch_size]
+        warmup_batch_sizes += [b for b in policy.batch_buckets if b >= args.max_batch_size][:1]
+        warmup = functools.partial(policy.warmup, warmup_batch_sizes)
+
     # Record the policy's behavior.
     if args.record:
         policy = _policy.PolicyRecorder(policy, "policy_records")
@@ -113,6 +164,9 @@ def main(args: Args) -> None:
         host="0.0.0.0",
         port=args.port,
         metadata=policy_metadata,
+        max_batch_size=args.max_batch_size,
+        max_batch_wait_ms=args.max_batch_wait_ms,
+        warmup=warmup,
     )
     server.serve_forever()
 
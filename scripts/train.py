@@ -8,7 +8,7 @@ Args:
     --wandb_enabled: Whether to enable Weights & Biases logging.
     --check_only: If True, just checks the data loading and exits.
     --use_annotation: Whether to use textual annotations for prompts.
-    --use_indices: Indices to extract from the state vector.
+    --use_indices: (start, end) ranges of the state and action dimensions to train on.
 
 Example:
 ```bash
@@ -19,7 +19,7 @@ XLA_PYTHON_CLIENT_MEM_FRACTION=0.9 CUDA_VISIBLE_DEVICES=0 uv run scripts/train.p
     --wandb-enabled [--no-wandb-enabled] \
     --check-only [--no-check-only] \
     --use-annotation [--no-use-annotation] \
-    --use-indices="[(0,8),(17,25)]"
+    --use-indices 0 8 17 25
 ```
 """
 
@@ -42,6 +42,7 @@ import wandb
 
 import openpi.models.model as _model
 import openpi.shared.array_typing as at
+import openpi.shared.compilation_cache as compilation_cache
 import openpi.shared.nnx_utils as nnx_utils
 import openpi.training.checkpoints as _checkpoints
 import openpi.training.config as _config
@@ -264,7 +265,7 @@ def main(config: _config.TrainConfig):
             f"Batch size {config.batch_size} must be divisible by the number of devices {jax.device_count()}."
         )
 
-    jax.config.update("jax_compilation_cache_dir", str(epath.Path("~/.cache/jax").expanduser()))
+    compilation_cache.initialize()
 
     rng = jax.random.key(config.seed)
     train_rng, init_rng = jax.random.split(rng)
@@ -0,0 +1,61 @@
+"""Pre-populates the persistent JAX compilation cache for a checkpoint.
+
+Run this once (e.g., when building a serving image or before a rolling restart) so that policy servers that load the
+same checkpoint read the compiled sampling functions from the cache instead of compiling them again. The policy is
+created with the same arguments as by `scripts/serve_policy.py`, so `--sample-kwargs`, `--default-prompt`,
+`--image-cache-size` and `--weight-quantization` must match the ones of the servers. The cache directory can be changed
+with the OPENPI_COMPILATION_CACHE_DIR environment variable.
+"""
+
+import dataclasses
+import logging
+from typing import Literal
+
+import tyro
+
+from openpi.policies import policy as _policy
+from openpi.policies import policy_config as _policy_config
+from openpi.training import config as _config
+
+
+@dataclasses.dataclass
+class Args:
+    """Arguments for the warm_compilation_cache script."""
+
+    # Training config name (e.g., "pi0_aloha_sim").
+    config: str
+    # Checkpoint directory (e.g., "checkpoints/pi0_aloha_sim/exp/10000").
+    dir: str
+    # Batch sizes to compile for. Should match the batch buckets used by the policy server.
+    batch_sizes: tuple[int, ...] = _policy.DEFAULT_BATCH_BUCKETS
+
+    # The following arguments are the same as for `scripts/serve_policy.py`.
+
+    # Default prompt of the policy.
+    default_prompt: str | None = None
+    # Keyword arguments of the model's `sample_actions` (e.g., `--sample-kwargs num_steps 5 solver heun`).
+    sample_kwargs: dict[str, int | float | str] = dataclasses.field(default_factory=dict)
+    # Number of camera frames whose image tokens are cached.
+    image_cache_size: int = 0
+    # If set, the weights of the model are quantized.
+    weight_quantization: Literal["int8"] | None = None
+
+
+def main(args: Args) -> None:
+    policy = _policy_config.create_trained_policy(
+        _config.get_config(args.config),
+        args.dir,
+        default_prompt=args.default_prompt,
+        sample_kwargs=args.sample_kwargs or None,
+        batch_buckets=args.batch_sizes,
+        image_cache_size=args.image_cache_size,
+        weight_quantization=args.weight_quantization,
+    )
+    compile_times = policy.warmup()
+    for batch_size, compile_time in compile_times.items():
+        logging.info("Batch size %d: %.2f s", batch_size, compile_time)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, force=True)
+    main(tyro.cli(Args))
@@ -0,0 +1,63 @@
+"""ODE solvers for sampling actions with flow matching.
+
+The models integrate the learned velocity field from noise at t=1 to the target distribution at t=0. Higher-order solvers
+evaluate the velocity more than once per step, but usually reach the accuracy of many Euler steps in far fewer steps.
+
+The functions in this module only use arithmetic on their inputs, so they work with Python numbers, JAX arrays (also
+inside of traced loops), and PyTorch tensors.
+"""
+
+from collections.abc import Callable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# Supported solvers. "euler" evaluates the velocity once per step, "midpoint" and "heun" evaluate it twice.
+SOLVERS = ("euler", "midpoint", "heun")
+
+
+def validate_solver(solver: str) -> None:
+    if solver not in SOLVERS:
+        raise ValueError(f"Unsupported solver: {solver}. Supported solvers: {SOLVERS}")
+
+
+def num_function_evals(solver: str, num_steps: int) -> int:
+    """Returns the number of velocity evaluations needed for `num_steps` steps."""
+    validate_solver(solver)
+    return num_steps if solver == "euler" else 2 * num_steps
+
+
+def timestep(step, num_steps, time_shift=1.0):
+    """Returns the time after `step` out of `num_steps` steps.
+
+    A `time_shift` of 1 results in uniform steps. Larger values take smaller steps close to the noise (t=1), where the
+    velocity changes the most, and smaller values take smaller steps close to the target (t=0).
+    """
+    t = 1 - step / num_steps
+    return time_shift * t / (1 + (time_shift - 1) * t)
+
+
+def solver_step(velocity: Callable[[T, float], T], x_t: T, time, next_time, solver: str) -> tuple[T, T]:
+    """Integrates `x_t` from `time` to `next_time`.
+
+    Args:
+        velocity: Computes the velocity at a given point and time.
+        x_t: The current point.
+        time: The current time.
+        next_time: The time to integrate to.
+        solver: One of `SOLVERS`.
+
+    Returns:
+        The point at `next_time` and the velocity at `x_t`.
+    """
+    dt = next_time - time
+    v_t = velocity(x_t, time)
+    if solver == "euler":
+        return x_t + dt * v_t, v_t
+    if solver == "midpoint":
+        v_mid = velocity(x_t + dt / 2 * v_t, time + dt / 2)
+        return x_t + dt * v_mid, v_t
+    if solver == "heun":
+        v_next = velocity(x_t + dt * v_t, next_time)
+        return x_t + dt / 2 * (v_t + v_next), v_t
+    raise ValueError(f"Unsupported solver: {solver}. Supported solvers: {SOLVERS}")
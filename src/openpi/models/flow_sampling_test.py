@@ -0,0 +1,49 @@
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from openpi.models import flow_sampling
+
+
+def _integrate(solver: str, num_steps: int, time_shift: float = 1.0) -> float:
+    # dx/dt = x has the solution x(t) = x(1) * exp(t - 1), so integrating from x(1) = 1 to t=0 results in exp(-1).
+    x = 1.0
+    for i in range(num_steps):
+        time = flow_sampling.timestep(i, num_steps, time_shift)
+        next_time = flow_sampling.timestep(i + 1, num_steps, time_shift)
+        x, _ = flow_sampling.solver_step(lambda x, t: x, x, time, next_time, solver)
+    return x
+
+
+def test_timestep():
+    np.testing.assert_allclose([flow_sampling.timestep(i, 4) for i in range(5)], [1.0, 0.75, 0.5, 0.25, 0.0])
+
+    for time_shift in (0.5, 3.0):
+        times = [flow_sampling.timestep(i, 4, time_shift) for i in range(5)]
+        assert times[0] == pytest.approx(1.0)
+        assert times[-1] == pytest.approx(0.0)
+        assert all(a > b for a, b in itertools.pairwise(times))
+
+    # Larger shifts take smaller steps close to the noise.
+    assert 1 - flow_sampling.timestep(1, 4, 3.0) < 1 - flow_sampling.timestep(1, 4, 1.0)
+
+
+@pytest.mark.parametrize("solver", flow_sampling.SOLVERS)
+def test_solver_converges(solver: str):
+    assert _integrate(solver, 100) == pytest.approx(math.exp(-1), abs=1e-2)
+
+
+def test_second_order_solvers():
+    euler_error = abs(_integrate("euler", 4) - math.exp(-1))
+    for solver in ("midpoint", "heun"):
+        # Four steps of a second order solver are more accurate than eight Euler steps with the same number of
+        # velocity evaluations.
+        assert abs(_integrate(solver, 4) - math.exp(-1)) < abs(_integrate("euler", 8) - math.exp(-1)) < euler_error
+        assert flow_sampling.num_function_evals(solver, 4) == 8
+
+
+def test_invalid_solver():
+    with pytest.raises(ValueError, match="Unsupported solver"):
+        flow_sampling.validate_solver("rk4")
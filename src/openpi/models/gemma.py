@@ -34,6 +34,7 @@ import flax.linen as nn
 import jax
 import jax.numpy as jnp
 
+from openpi.models import quantization
 import openpi.models.lora as lora
 import openpi.shared.array_typing as at
 import openpi.training.sharding as sharding
@@ -50,6 +51,8 @@ class Config:
     num_kv_heads: int
     head_dim: int
     lora_configs: dict[str, lora.LoRAConfig] = dataclasses.field(default_factory=dict)
+    # If set, the kernels of the attention and feed forward layers are quantized. Only supported for inference.
+    weight_quantization: quantization.WeightQuantization | None = None
 
 
 Variant = Literal["dummy", "gemma_300m", "gemma_300m_lora", "gemma_2b", "gemma_2b_lora"]
@@ -159,6 +162,8 @@ class Attention(nn.Module):
     """Attention module."""
 
     configs: Sequence[Config]
+    # If set, the attention weights are computed for chunks of this many queries at a time. See `Module`.
+    chunk_size: int | None = None
 
     @nn.compact
     def __call__(self, xs, positions, attn_mask, kv_cache):
@@ -179,6 +184,7 @@ class Attention(nn.Module):
                     name=_name("qkv_einsum", i),
                     init_fn=nn.initializers.lecun_normal(in_axis=-2, out_axis=-1, batch_axis=(0, 1)),
                     lora_config=config.lora_configs.get("attn"),
+                    weight_quantization=config.weight_quantization,
                 )
                 qkvs.append(qkv_einsum("BSD,3KDH->3BSKH", x))
             else:
@@ -187,6 +193,7 @@ class Attention(nn.Module):
                     name=_name("q_einsum", i),
                     init_fn=nn.initializers.lecun_normal(in_axis=-2, out_axis=-1, batch_axis=(0,)),
                     lora_config=config.lora_configs.get("attn"),
+                    weight_quantization=config.weight_quantization,
                 )
                 q = q_einsum("BTD,NDH->BTNH", x)
                 kv_einsum = lora.Einsum(
@@ -194,6 +201,7 @@ class Attention(nn.Module):
                     name=_name("kv_einsum", i),
                     init_fn=nn.initializers.lecun_normal(in_axis=-2, out_axis=-1, batch_axis=(0, 1)),
                     lora_config=config.lora_configs.get("attn"),
+                    weight_quantization=config.weight_quantization,
                 )
                 k, v = kv_einsum("BSD,2KDH->2BSKH", x)
                 qkvs.append((q, k, v))
@@ -208,26 +216,25 @@ class Attention(nn.Module):
         # should still be half-precision here (if input was half-precision)
         assert q.dtype == k.dtype == v.dtype == dtype
 
-        if kv_cache is not None:
-            cache_k, cache_v = kv_cache
-            k = jnp.concatenate([cache_k, k], axis=1)
-            v = jnp.concatenate([cache_v, v], axis=1)
-
         q = einops.rearrange(q, "B T (K G) H -> B T K G H", K=self.configs[0].num_kv_heads)
-        logits = jnp.einsum("BTKGH,BSKH->BKGTS", q, k, preferred_element_type=jnp.float32)
+        num_keys = k.shape[1] if kv_cache is None else kv_cache[0].shape[1] + k.shape[1]
 
-        if attn_mask.shape != (q.shape[0], 1, q.shape[1], k.shape[1]):
+        if attn_mask.shape != (q.shape[0], 1, q.shape[1], num_keys):
             raise ValueError(
                 f"Attention mask with shape {attn_mask.shape} but shapes for q and k are: {q.shape} and {k.shape}"
+                f" (with {num_keys - k.shape[1]} cached keys)"
             )
 
-        # big_neg = jnp.finfo(logits.dtype).min
-        big_neg = -2.3819763e38  # See gemma/modules.py
-        masked_logits = jnp.where(attn_mask[:, :, None, :, :], logits, big_neg)
-
-        probs = jax.nn.softmax(masked_logits, axis=-1).astype(dtype)
-
-        encoded = jnp.einsum("BKGTS,BSKH->BTKGH", probs, v)
+        if kv_cache is not None:
+            cache_k, cache_v = kv_cache
+            encoded = _cached_dot_product_attention(q, cache_k, cache_v, k, v, attn_mask)
+            # The full cache is only materialized if the caller uses it.
+            k = jnp.concatenate([cache_k, k], axis=1)
+            v = jnp.concatenate([cache_v, v], axis=1)
+        elif self.chunk_size is None or q.shape[1] <= self.chunk_size:
+            encoded = _dot_product_attention(q, k, v, attn_mask)
+        else:
+            encoded = _chunked_dot_product_attention(q, k, v, attn_mask, self.chunk_size)
         encoded = einops.rearrange(encoded, "B T K G H -> B T (K G) H")
 
         out = []
@@ -240,6 +247,7 @@ class Attention(nn.Module):
                     name=_name("attn_vec_einsum", i),
                     init_fn=nn.initializers.lecun_normal(in_axis=(-3, -2), out_axis=-1),
                     lora_config=config.lora_configs.get("attn"),
+                    weight_quantization=config.weight_quantization,
                 )
                 out.append(out_einsum("BTNH,NHD->BTD", encoded[:, start:end]))
                 start = end
@@ -288,13 +296,14 @@ class Block(nn.Module):
 
     dropout: float = 0.0
     dropout_bdims: tuple[int, ...] = ()
+    attn_chunk_size: int | None = None
 
     @nn.compact
     def __call__(self, xs, kv_cache, positions, attn_mask, adarms_cond, deterministic=True):  # noqa: FBT002
         xs = sharding.activation_sharding_constraint(xs)
         drop = nn.Dropout(self.dropout, self.dropout_bdims) if self.dropout else lambda x, _: x
 
-        attn = Attention(configs=self.configs, name="attn")
+        attn = Attention(configs=self.configs, chunk_size=self.attn_chunk_size, name="attn")
 
         pre_attn = []
         gates = []
@@ -321,6 +330,7 @@ class Block(nn.Module):
                     hidden_dim=config.mlp_dim,
                     name=_name("mlp", i),
                     lora_config=config.lora_configs.get("ffn"),
+                    weight_quantization=config.weight_quantization,
                 )(x)
             out.append(x)
             gates.append(gate if x is not None else None)
@@ -346,6 +356,10 @@ class Module(nn.Module):
     dropout: float = 0.0
     dropout_bdims: tuple[int, ...] = ()  # Every float is dropped independently.
     adarms: bool = False
+    # If set, attention is computed for chunks of this many queries at a time, so that only the attention weights of
+    # one chunk are materialized instead of the full [query, key] matrix. The weights of each chunk are recomputed in
+    # the backward pass. The result is the same as with full attention. Not used for queries that attend to a KV cache.
+    attn_chunk_size: int | None = None
 
     def setup(self):
         # all experts must have the same depth
@@ -378,6 +392,7 @@ class Module(nn.Module):
             configs=self.configs,
             dropout=self.dropout,
             dropout_bdims=self.dropout_bdims,
+            attn_chunk_size=self.attn_chunk_size,
         )
         self.final_norms = [RMSNorm(name=_name("final_norm", i)) for i in range(len(self.configs))]
 
@@ -421,6 +436,69 @@ class Module(nn.Module):
         )
 
 
+def _dot_product_attention(q, k, v, attn_mask):
+    """Computes attention from queries of shape BTKGH, keys and values of shape BSKH and a mask of shape B1TS."""
+    logits = jnp.einsum("BTKGH,BSKH->BKGTS", q, k, preferred_element_type=jnp.float32)
+
+    # big_neg = jnp.finfo(logits.dtype).min
+    big_neg = -2.3819763e38  # See gemma/modules.py
+    masked_logits = jnp.where(attn_mask[:, :, None, :, :], logits, big_neg)
+
+    probs = jax.nn.softmax(masked_logits, axis=-1).astype(q.dtype)
+
+    return jnp.einsum("BKGTS,BSKH->BTKGH", probs, v)
+
+
+def _cached_dot_product_attention(q, cache_k, cache_v, k, v, attn_mask):
+    """Same as `_dot_product_attention` with `cache_k` and `k` (and `cache_v` and `v`) concatenated.
+
+    The softmax is computed from the statistics of both parts, so the cache is never copied. Otherwise, decoding steps
+    with few queries and a long cache (e.g., every denoising step of pi0) copy the full cache of every layer.
+    """
+    # big_neg = jnp.finfo(logits.dtype).min
+    big_neg = -2.3819763e38  # See gemma/modules.py
+    cache_len = cache_k.shape[1]
+    cache_logits = jnp.einsum("BTKGH,BSKH->BKGTS", q, cache_k, preferred_element_type=jnp.float32)
+    cache_logits = jnp.where(attn_mask[:, :, None, :, :cache_len], cache_logits, big_neg)
+    logits = jnp.einsum("BTKGH,BSKH->BKGTS", q, k, preferred_element_type=jnp.float32)
+    logits = jnp.where(attn_mask[:, :, None, :, cache_len:], logits, big_neg)
+
+    logits_max = jax.lax.stop_gradient(
+        jnp.maximum(jnp.max(cache_logits, axis=-1, keepdims=True), jnp.max(logits, axis=-1, keepdims=True))
+    )
+    cache_weights = jnp.exp(cache_logits - logits_max)
+    weights = jnp.exp(logits - logits_max)
+    normalizer = jnp.sum(cache_weights, axis=-1, keepdims=True) + jnp.sum(weights, axis=-1, keepdims=True)
+
+    encoded = jnp.einsum(
+        "BKGTS,BSKH->BTKGH", (cache_weights / normalizer).astype(q.dtype), cache_v, preferred_element_type=jnp.float32
+    ) + jnp.einsum("BKGTS,BSKH->BTKGH", (weights / normalizer).astype(q.dtype), v, preferred_element_type=jnp.float32)
+    return encoded.astype(q.dtype)
+
+
+def _chunked_dot_product_attention(q, k, v, attn_mask, chunk_size):
+    """Same as `_dot_product_attention`, but processes the queries in chunks of `chunk_size`."""
+    num_queries = q.shape[1]
+    num_chunks = -(-num_queries // chunk_size)
+    padding = num_chunks * chunk_size - num_queries
+    # Padded queries attend to nothing and are removed from the result.
+    q = jnp.pad(q, ((0, 0), (0, padding), (0, 0), (0, 0), (0, 0)))
+    attn_mask = jnp.pad(attn_mask, ((0, 0), (0, 0), (0, padding), (0, 0)))
+
+    q_chunks = einops.rearrange(q, "B (C T) K G H -> C B T K G H", C=num_chunks)
+    mask_chunks = einops.rearrange(attn_mask, "B X (C T) S -> C B X T S", C=num_chunks)
+
+    # Only the inputs of each chunk are saved for the backward pass, not the attention weights.
+    @jax.checkpoint
+    def attend(chunk):
+        q_chunk, mask_chunk = chunk
+        return _dot_product_attention(q_chunk, k, v, mask_chunk)
+
+    encoded = jax.lax.map(attend, (q_chunks, mask_chunks))
+    encoded = einops.rearrange(encoded, "C B T K G H -> B (C T) K G H")
+    return encoded[:, :num_queries]
+
+
 def _apply_rope(x, *, positions, max_wavelength=10_000):
     """Applies RoPE positions [B, L] to x [B, L, H, D]."""
     freq_exponents = (2.0 / x.shape[-1]) * jnp.arange(x.shape[-1] // 2, dtype=jnp.float32)
@@ -29,11 +29,27 @@ import ml_collections
 import openpi.models.lora as lora
 import openpi.shared.array_typing as at
 
-Variant = Literal["gemma_2b", "gemma_2b_lora"]
+Variant = Literal["dummy", "gemma_2b", "gemma_2b_lora"]
 
 
 def get_config(variant):
     """Returns config for specified gemma variant."""
+    if variant == "dummy":
+        return ml_collections.ConfigDict(
+            {
+                "variant": variant,
+                "width": 64,
+                "depth": 4,
+                "mlp_dim": 128,
+                "num_heads": 8,
+                "num_kv_heads": 1,
+                "head_dim": 16,
+                "norm_eps": 1e-6,
+                "vocab_size": 257_152,
+                "scan": True,
+                "remat_policy": "nothing_saveable",
+            }
+        )
     if variant == "gemma_2b":
         return ml_collections.ConfigDict(
             {
@@ -173,13 +189,12 @@ class Attention(nn.Module):
         return idx, k_cache, v_cache
 
     def _update_cache(self, k, v, idx, k_cache, v_cache):
-        """Update KV cache with new values"""
-        assert k.shape[1] == 1, "Only support kv-cache updates of length 1"
+        """Update KV cache with new values, which are written at `idx`"""
         indices = (0, idx[0], 0, 0)
         cache_dtype = self.cache_dtype or k.dtype
         k_new = jax.lax.dynamic_update_slice(k_cache, k.astype(cache_dtype), indices)
         v_new = jax.lax.dynamic_update_slice(v_cache, v.astype(cache_dtype), indices)
-        idx_new = idx + 1
+        idx_new = idx + k.shape[1]
         return idx_new, k_new, v_new
 
     @nn.compact
@@ -0,0 +1,67 @@
+from flax import nnx
+import flax.nnx.bridge as nnx_bridge
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from openpi.models import gemma as _gemma
+from openpi.models import pi0
+
+
+def _create_llm(attn_chunk_size: int | None) -> nnx.Module:
+    config = _gemma.get_config("dummy")
+    llm = nnx_bridge.ToNNX(
+        _gemma.Module(configs=[config, config], embed_dtype="float32", attn_chunk_size=attn_chunk_size)
+    )
+    llm.lazy_init(rngs=nnx.Rngs(0), method="init", use_adarms=[False, False])
+    return llm
+
+
+def _make_inputs(batch_size: int, prefix_len: int, suffix_len: int):
+    rng = jax.random.key(1)
+    prefix = jax.random.normal(jax.random.fold_in(rng, 0), (batch_size, prefix_len, 64))
+    suffix = jax.random.normal(jax.random.fold_in(rng, 1), (batch_size, suffix_len, 64))
+    # Prefix-LM mask with padding at the end of the prefix of the first example.
+    input_mask = (
+        jnp.ones((batch_size, prefix_len + suffix_len), dtype=bool).at[0, prefix_len - 3 : prefix_len].set(False)
+    )
+    mask_ar = jnp.zeros((batch_size, prefix_len + suffix_len), dtype=bool).at[:, prefix_len].set(True)
+    mask = pi0.make_attn_mask(input_mask, mask_ar)
+    positions = jnp.cumsum(input_mask, axis=1) - 1
+    return [prefix, suffix], positions, mask
+
+
+@pytest.mark.parametrize("attn_chunk_size", [8, 16])
+def test_chunked_attention(attn_chunk_size: int):
+    llm = _create_llm(None)
+    chunked_llm = _create_llm(attn_chunk_size)
+    nnx.update(chunked_llm, nnx.state(llm))
+
+    embedded, positions, mask = _make_inputs(batch_size=2, prefix_len=30, suffix_len=10)
+
+    def loss(llm, embedded):
+        outputs, _ = llm(embedded, positions, mask)
+        return sum(jnp.sum(jnp.square(out)) for out in outputs)
+
+    expected_loss, expected_grads = jax.value_and_grad(loss, argnums=1)(llm, embedded)
+    chunked_loss, chunked_grads = jax.value_and_grad(loss, argnums=1)(chunked_llm, embedded)
+
+    np.testing.assert_allclose(chunked_loss, expected_loss, rtol=1e-5)
+    for chunked_grad, expected_grad in zip(chunked_grads, expected_grads, strict=True):
+        np.testing.assert_allclose(chunked_grad, expected_grad, rtol=1e-4, atol=1e-5)
+
+
+def test_kv_cache():
+    llm = _create_llm(None)
+    (prefix, suffix), positions, mask = _make_inputs(batch_size=2, prefix_len=30, suffix_len=10)
+    (_, expected), _ = llm([prefix, suffix], positions, mask)
+
+    _, kv_cache = llm([prefix, None], positions[:, :30], mask[:, :30, :30])
+    (prefix_out, suffix_out), (k_cache, v_cache) = llm(
+        [None, suffix], positions[:, 30:], mask[:, 30:], kv_cache=kv_cache
+    )
+    assert prefix_out is None
+    np.testing.assert_allclose(suffix_out, expected, rtol=1e-4, atol=1e-5)
+    # The returned cache contains both the prefix and the suffix.
+    assert k_cache.shape[2] == v_cache.shape[2] == 40
@@ -5,6 +5,7 @@ import flax.linen as nn
 import flax.struct as struct
 import jax.numpy as jnp
 
+from openpi.models import quantization
 import openpi.shared.array_typing as at
 
 
@@ -39,9 +40,11 @@ class Einsum(nn.Module):
     init_fn: nn.initializers.Initializer = nn.initializers.zeros
     # If not None, apply LoRA to the weight.
     lora_config: LoRAConfig | None = None
+    # If not None, the weight is quantized. See `quantization.quantize_params`.
+    weight_quantization: quantization.WeightQuantization | None = None
 
     def setup(self):
-        self.w = self.param("w", self.init_fn, self.shape)
+        self.w = _weight_param(self, "w", self.init_fn, self.shape, self.weight_quantization)
 
         if config := self.lora_config:
             # Setup LoRA parameters.
@@ -54,7 +57,7 @@ class Einsum(nn.Module):
     @nn.compact
     def __call__(self, eqn: str, x):
         dtype = x.dtype  # original dtype, could be half-precision
-        result = jnp.einsum(eqn, x, self.w.astype(dtype))
+        result = jnp.einsum(eqn, x, _weight(self.w, dtype))
 
         if config := self.lora_config:
             eqn_a, eqn_b = self._make_lora_eqns(eqn)
@@ -92,17 +95,23 @@ class FeedForward(nn.Module):
     hidden_dim: int
     # If not None, apply LoRA to the weight.
     lora_config: LoRAConfig | None = None
+    # If not None, the weights are quantized. See `quantization.quantize_params`.
+    weight_quantization: quantization.WeightQuantization | None = None
 
     def setup(self):
-        self.w_gating = self.param(
+        self.w_gating = _weight_param(
+            self,
             "gating_einsum",
             nn.initializers.lecun_normal(in_axis=-2, out_axis=-1, batch_axis=(0,)),
             (2, self.features, self.hidden_dim),
+            self.weight_quantization,
         )
-        self.w_linear = self.param(
+        self.w_linear = _weight_param(
+            self,
             "linear",
             nn.initializers.lecun_normal(in_axis=-2, out_axis=-1),
             (self.hidden_dim, self.features),
+            self.weight_quantization,
         )
         self.w_gating_lora = None
         self.w_linear_lora = None
@@ -123,21 +132,22 @@ class FeedForward(nn.Module):
     @nn.compact
     def __call__(self, x):
         dtype = x.dtype  # original dtype, could be half-precision
+        w_gating = _weight(self.w_gating, dtype)
         ff_gate = self._dot(
             x,
-            self.w_gating[0],
+            w_gating[0],
             None if self.w_gating_lora is None else (self.w_gating_lora[0][0], self.w_gating_lora[1][0]),
         )
         gate_value = nn.gelu(ff_gate)
 
         ff1 = self._dot(
             x,
-            self.w_gating[1],
+            w_gating[1],
             None if self.w_gating_lora is None else (self.w_gating_lora[0][1], self.w_gating_lora[1][1]),
         )
         activations = gate_value * ff1
 
-        outputs = self._dot(activations, self.w_linear, self.w_linear_lora)
+        outputs = self._dot(activations, _weight(self.w_linear, dtype), self.w_linear_lora)
         assert outputs.dtype == dtype
         return outputs
 
@@ -146,3 +156,30 @@ class FeedForward(nn.Module):
         if lora_weights is None:
             return base
         return base + jnp.dot(jnp.dot(x, lora_weights[0].astype(x.dtype)), lora_weights[1].astype(x.dtype))
+
+
+def _weight_param(
+    module: nn.Module,
+    name: str,
+    init_fn: nn.initializers.Initializer,
+    shape: tuple[int, ...],
+    weight_quantization: quantization.WeightQuantization | None,
+) -> at.Array | tuple[at.Array, at.Array]:
+    """Declares a weight param, or an int8 weight and its scales if the weight is quantized."""
+    if weight_quantization is None:
+        return module.param(name, init_fn, shape)
+    if weight_quantization != "int8":
+        raise ValueError(f"Unsupported weight quantization: {weight_quantization}")
+    # Quantized weights are always loaded from quantized params, so they are not initialized randomly.
+    scale_shape = (*shape[:-2], 1, shape[-1])
+    return (
+        module.param(name, nn.initializers.zeros, shape, jnp.int8),
+        module.param(f"{name}{quantization.SCALE_SUFFIX}", nn.initializers.ones, scale_shape),
+    )
+
+
+def _weight(w: at.Array | tuple[at.Array, at.Array], dtype: jnp.dtype) -> at.Array:
+    """Returns a weight declared by `_weight_param` in the given dtype."""
+    if isinstance(w, tuple):
+        return quantization.dequantize(*w, dtype)
+    return w.astype(dtype)
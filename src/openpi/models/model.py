@@ -298,7 +298,8 @@ def restore_params(
     Args:
         params_path: The local path to the checkpoint directory.
         restore_type: The type to restore the params as. Can be set to `np.ndarray` to load the params as a numpy array.
-        dtype: The dtype to restore all params as. If not provided, will use the original dtype from the checkpoint.
+        dtype: The dtype to restore all floating point params as. If not provided, will use the original dtype from the
+            checkpoint. Integer params (e.g., quantized weights) always keep their original dtype.
         sharding: The sharding to use for the params. If not provided, the params will be replicated across all devices.
 
     Returns:
@@ -319,7 +320,12 @@ def restore_params(
             ocp.args.PyTreeRestore(
                 item=item,
                 restore_args=jax.tree.map(
-                    lambda _: ocp.ArrayRestoreArgs(sharding=sharding, restore_type=restore_type, dtype=dtype), item
+                    lambda meta: ocp.ArrayRestoreArgs(
+                        sharding=sharding,
+                        restore_type=restore_type,
+                        dtype=dtype if jnp.issubdtype(meta.dtype, jnp.floating) else None,
+                    ),
+                    item,
                 ),
             ),
         )["params"]
@@ -24,6 +24,26 @@ def test_pi0_model():
     assert actions.shape == (batch_size, model.action_horizon, model.action_dim)
 
 
+@pytest.mark.parametrize("solver", ["midpoint", "heun"])
+def test_pi0_sample_actions_solvers(solver: str):
+    key = jax.random.key(0)
+    config = pi0_config.Pi0Config(paligemma_variant="dummy", action_expert_variant="dummy")
+    model = config.create(key)
+
+    obs = config.fake_obs(2)
+    noise = jax.random.normal(key, (2, model.action_horizon, model.action_dim))
+    sample_actions = nnx_utils.module_jit(model.sample_actions, static_argnames=["solver"])
+    actions = sample_actions(key, obs, num_steps=3, noise=noise, solver=solver, time_shift=2.0)
+    assert actions.shape == (2, model.action_horizon, model.action_dim)
+
+    # The exit threshold is never reached for a negative value, and always reached after two steps for a large one.
+    full = sample_actions(key, obs, num_steps=3, noise=noise, solver=solver, early_exit_threshold=-1.0)
+    early = sample_actions(key, obs, num_steps=3, noise=noise, solver=solver, early_exit_threshold=1e6)
+    reference = sample_actions(key, obs, num_steps=3, noise=noise, solver=solver)
+    assert jax.numpy.allclose(full, reference)
+    assert not jax.numpy.allclose(early, reference)
+
+
 def test_pi0_lora_model():
     key = jax.random.key(0)
     config = pi0_config.Pi0Config(paligemma_variant="gemma_2b_lora")
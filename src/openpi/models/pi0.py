@@ -1,3 +1,4 @@
+import dataclasses
 import logging
 
 import einops
@@ -7,11 +8,13 @@ import jax
 import jax.numpy as jnp
 from typing_extensions import override
 
+from openpi.models import flow_sampling
 from openpi.models import model as _model
 from openpi.models import pi0_config
 import openpi.models.gemma as _gemma
 import openpi.models.siglip as _siglip
 from openpi.shared import array_typing as at
+from openpi.shared import image_tools
 
 logger = logging.getLogger("openpi")
 
@@ -67,14 +70,19 @@ class Pi0(_model.BaseModel):
     def __init__(self, config: pi0_config.Pi0Config, rngs: nnx.Rngs):
         super().__init__(config.action_dim, config.action_horizon, config.max_token_len)
         self.pi05 = config.pi05
-        paligemma_config = _gemma.get_config(config.paligemma_variant)
-        action_expert_config = _gemma.get_config(config.action_expert_variant)
+        paligemma_config = dataclasses.replace(
+            _gemma.get_config(config.paligemma_variant), weight_quantization=config.weight_quantization
+        )
+        action_expert_config = dataclasses.replace(
+            _gemma.get_config(config.action_expert_variant), weight_quantization=config.weight_quantization
+        )
         # TODO: rewrite gemma in NNX. For now, use bridge.
         llm = nnx_bridge.ToNNX(
             _gemma.Module(
                 configs=[paligemma_config, action_expert_config],
                 embed_dtype=config.dtype,
                 adarms=config.pi05,
+                attn_chunk_size=config.attn_chunk_size,
             )
         )
         llm.lazy_init(rngs=rngs, method="init", use_adarms=[False, True] if config.pi05 else [False, False])
@@ -102,27 +110,42 @@ class Pi0(_model.BaseModel):
         # This attribute gets automatically set by model.train() and model.eval().
         self.deterministic = True
 
+    @at.typecheck
+    def embed_image(self, image: at.Float[at.Array, "b h w c"]) -> at.Float[at.Array, "b s emb"]:
+        """Computes the tokens of a single camera image.
+
+        Image tokens only depend on their image, so they can be computed separately and passed to `sample_actions`
+        (e.g., to reuse them for frames that did not change).
+        """
+        if image.shape[1:3] != _model.IMAGE_RESOLUTION:
+            image = image_tools.resize_with_pad(image, *_model.IMAGE_RESOLUTION)
+        image_tokens, _ = self.PaliGemma.img(image, train=False)
+        return image_tokens
+
     @at.typecheck
     def embed_prefix(
-        self, obs: _model.Observation
+        self, obs: _model.Observation, image_tokens: dict[str, at.Array] | None = None
     ) -> tuple[at.Float[at.Array, "b s emb"], at.Bool[at.Array, "b s"], at.Bool[at.Array, " s"]]:
         input_mask = []
         ar_mask = []
         tokens = []
         # embed images
         for name in obs.images:
-            image_tokens, _ = self.PaliGemma.img(obs.images[name], train=False)
+            if image_tokens is not None and name in image_tokens:
+                img_tokens = image_tokens[name]
+            else:
+                img_tokens = self.embed_image(obs.images[name])
 
-            tokens.append(image_tokens)
+            tokens.append(img_tokens)
             input_mask.append(
                 einops.repeat(
                     obs.image_masks[name],
                     "b -> b s",
-                    s=image_tokens.shape[1],
+                    s=img_tokens.shape[1],
                 )
             )
             # image tokens attend to each other
-            ar_mask += [False] * image_tokens.shape[1]
+            ar_mask += [False] * img_tokens.shape[1]
 
         # add language (aka tokenized inputs)
         if obs.tokenized_prompt is not None:
@@ -221,23 +244,41 @@ class Pi0(_model.BaseModel):
         *,
         num_steps: int | at.Int[at.Array, ""] = 10,
         noise: at.Float[at.Array, "b ah ad"] | None = None,
+        image_tokens: dict[str, at.Array] | None = None,
+        solver: str = "euler",
+        time_shift: float | at.Float[at.Array, ""] = 1.0,
+        early_exit_threshold: float | at.Float[at.Array, ""] | None = None,
     ) -> _model.Actions:
+        """Samples actions with flow matching.
+
+        Args:
+            rng: Random key used to sample the initial noise.
+            observation: The observation to condition on.
+            num_steps: Number of integration steps.
+            noise: Initial noise. Sampled from `rng` if not provided.
+            image_tokens: Maps camera names to precomputed outputs of `embed_image`, which are used instead of
+                embedding the corresponding images again.
+            solver: ODE solver to use. See `flow_sampling.SOLVERS`.
+            time_shift: Shifts the timestep schedule. See `flow_sampling.timestep`.
+            early_exit_threshold: If provided, sampling stops once the velocity of every sample changes by less than
+                this fraction of its norm between two steps. The trajectory is then close to a straight line, so the
+                remaining steps are replaced by a single step to t=0.
+        """
+        flow_sampling.validate_solver(solver)
         observation = _model.preprocess_observation(None, observation, train=False)
         # note that we use the convention more common in diffusion literature, where t=1 is noise and t=0 is the target
         # distribution. yes, this is the opposite of the pi0 paper, and I'm sorry.
-        dt = -1.0 / num_steps
         batch_size = observation.state.shape[0]
         if noise is None:
             noise = jax.random.normal(rng, (batch_size, self.action_horizon, self.action_dim))
 
         # first fill KV cache with a forward pass of the prefix
-        prefix_tokens, prefix_mask, prefix_ar_mask = self.embed_prefix(observation)
+        prefix_tokens, prefix_mask, prefix_ar_mask = self.embed_prefix(observation, image_tokens)
         prefix_attn_mask = make_attn_mask(prefix_mask, prefix_ar_mask)
         positions = jnp.cumsum(prefix_mask, axis=1) - 1
         _, kv_cache = self.PaliGemma.llm([prefix_tokens, None], mask=prefix_attn_mask, positions=positions)
 
-        def step(carry):
-            x_t, time = carry
+        def velocity(x_t, time):
             suffix_tokens, suffix_mask, suffix_ar_mask, adarms_cond = self.embed_suffix(
                 observation, x_t, jnp.broadcast_to(time, batch_size)
             )
@@ -266,14 +307,25 @@ class Pi0(_model.BaseModel):
                 adarms_cond=[None, adarms_cond],
             )
             assert prefix_out is None
-            v_t = self.action_out_proj(suffix_out[:, -self.action_horizon :])
+            return self.action_out_proj(suffix_out[:, -self.action_horizon :])
 
-            return x_t + dt * v_t, time + dt
+        def step(carry):
+            x_t, i, v_prev, converged = carry
+            time = flow_sampling.timestep(i, num_steps, time_shift)
+            next_time = flow_sampling.timestep(i + 1, num_steps, time_shift)
+            x_next, v_t = flow_sampling.solver_step(velocity, x_t, time, next_time, solver)
+            if early_exit_threshold is not None:
+                change = jnp.linalg.norm(v_t - v_prev, axis=(-2, -1))
+                converged = (i > 0) & jnp.all(change < early_exit_threshold * jnp.linalg.norm(v_prev, axis=(-2, -1)))
+                # The trajectory is close to a straight line, so the remaining steps are replaced by a single step.
+                x_next = jnp.where(converged, x_t - time * v_t, x_next)
+            return x_next, i + 1, v_t, converged
 
         def cond(carry):
-            x_t, time = carry
-            # robust to floating-point error
-            return time >= -dt / 2
+            _, i, _, converged = carry
+            return (i < num_steps) & ~converged
 
-        x_0, _ = jax.lax.while_loop(cond, step, (noise, 1.0))
+        x_0, *_ = jax.lax.while_loop(
+            cond, step, (noise, jnp.asarray(0), jnp.zeros_like(noise), jnp.zeros((), dtype=bool))
+        )
         return x_0
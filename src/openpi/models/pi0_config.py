@@ -1,5 +1,5 @@
 import dataclasses
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
 import flax.nnx as nnx
 import jax
@@ -7,6 +7,7 @@ import jax.numpy as jnp
 from typing_extensions import override
 
 from openpi.models import model as _model
+from openpi.models import quantization
 import openpi.models.gemma as _gemma
 from openpi.shared import array_typing as at
 import openpi.shared.nnx_utils as nnx_utils
@@ -31,6 +32,20 @@ class Pi0Config(_model.BaseModelConfig):
     pi05: bool = False
     # This config option is not used directly by the model, but it is read by the ModelTransformFactory.
     discrete_state_input: bool = None  # type: ignore
+    # If set, the JAX model computes attention for chunks of this many query tokens at a time. This reduces the memory
+    # of the attention weights for long prefixes (e.g., several cameras) at the cost of some throughput. See
+    # `gemma.Module`.
+    attn_chunk_size: int | None = None
+    # If set, the Gemma kernels of the JAX model are quantized for inference, which halves their memory. Unquantized
+    # checkpoints are quantized when they are loaded, or offline with `scripts/quantize_checkpoint.py`.
+    weight_quantization: quantization.WeightQuantization | None = None
+    # `torch.compile` mode of the PyTorch inference path. Modes other than "default" capture the denoising steps in
+    # CUDA graphs on GPUs. If None, the PyTorch model runs eagerly.
+    pytorch_compile_mode: Literal["default", "reduce-overhead", "max-autotune"] | None = "max-autotune"
+    # Attention implementation of the PyTorch model, used for training and inference. "sdpa" and "flex_attention" use
+    # fused kernels that do not materialize the attention weights, which reduces the memory and latency for long
+    # prompts. Policies created with `policy_config.create_trained_policy` use "sdpa" by default.
+    pytorch_attn_implementation: Literal["eager", "sdpa", "flex_attention"] = "eager"
 
     def __post_init__(self):
         if self.max_token_len is None:
@@ -3,10 +3,12 @@ import logging
 from typing import Any
 
 import einops
+from flax import struct
 import flax.nnx as nnx
 import flax.nnx.bridge as nnx_bridge
 import jax
 import jax.numpy as jnp
+import numpy as np
 from typing_extensions import override
 
 from openpi.models import model as _model
@@ -64,6 +66,35 @@ def left_to_right_align(x, input_mask, attn_mask):
     return x, input_mask, attn_mask
 
 
+def ngram_draft(history, length, ngram_size, num_draft_tokens):
+    """Drafts tokens by looking up the most recent earlier occurrence of the last `ngram_size` tokens.
+
+    Args:
+      history: int[B, T] tokens to look up. Negative tokens are invalid.
+      length: number of valid tokens at the start of `history`.
+      ngram_size: number of tokens that must match.
+      num_draft_tokens: number of tokens to draft.
+
+    Returns:
+      int[B, num_draft_tokens] tokens that followed the most recent earlier occurrence of the last `ngram_size` tokens
+      of `history[:, :length]`. If there is none, the last token is repeated.
+    """
+    batch_size, size = history.shape
+    ngram = jax.lax.dynamic_slice_in_dim(history, length - ngram_size, ngram_size, axis=1)
+    padded = jnp.pad(history, ((0, 0), (ngram_size - 1, num_draft_tokens)), constant_values=-1)
+    # match[:, p] is true if the n-gram ends at position p of history.
+    match = jnp.ones((batch_size, size), dtype=bool)
+    for i in range(ngram_size):
+        start = ngram_size - 1 - i
+        match &= padded[:, start : start + size] == ngram[:, start, None]
+    positions = jnp.arange(size)
+    end = jnp.max(jnp.where(match & (positions < length - 1), positions, -1), axis=1)
+
+    indices = end[:, None] + ngram_size + jnp.arange(num_draft_tokens)[None, :]
+    draft = jnp.take_along_axis(padded, indices, axis=1)
+    return jnp.maximum(jnp.where(end[:, None] >= 0, draft, ngram[:, -1:]), 0)
+
+
 def put_along_last_axis(arr, indices, values):
     """Like np.put_along_axis(..., axis=-1), since jax is missing it."""
     assert arr.ndim == indices.ndim == values.ndim, (arr.ndim, indices.ndim, values.ndim)
@@ -88,6 +119,13 @@ class Pi0FASTConfig(_model.BaseModelConfig):
     # Keyword arguments for the fast model tokenizer.
     fast_model_tokenizer_kwargs: dict[str, Any] | None = None
 
+    # Number of tokens that are drafted per decoding step when decoding greedily (temperature 0). The drafts are the
+    # tokens that followed the most recent earlier occurrence of the last `draft_ngram_size` tokens in the prompt and the
+    # decoded tokens. They are verified in a single forward pass together with the next token, so several tokens can be
+    # decoded per forward pass while the output stays the same as without drafting. 0 disables drafting.
+    num_draft_tokens: int = 0
+    draft_ngram_size: int = 2
+
     @property
     @override
     def model_type(self) -> _model.ModelType:
@@ -131,9 +169,32 @@ class Pi0FASTConfig(_model.BaseModelConfig):
         return nnx.Nothing
 
 
+@struct.dataclass
+class DecodeState:
+    """State of decoding a batch of sequences. See `Pi0FAST.prefill` and `Pi0FAST.decode`."""
+
+    rng: at.KeyArrayLike
+    # Logits of the next token.
+    last_logit: at.Float[at.Array, "b 1 v"]
+    # Decoded tokens, padded with zeros.
+    output_tokens: at.Float[at.Array, "b n"]
+    # KV cache of the prefix and the decoded tokens. The arrays have the layers as leading axis.
+    kv_cache: tuple[at.Int[at.Array, "l b"], at.Array, at.Array]
+    # Number of valid prefix tokens.
+    prefill_len: at.Int[at.Array, " b"]
+    # Prompt tokens that drafts are looked up from, with -1 for padding.
+    prompt_tokens: at.Int[at.Array, "b p"]
+    # Whether a sequence has decoded an EOS token.
+    finished: at.Bool[at.Array, " b"]
+    # Number of decoded tokens, which is the same for all sequences.
+    step: at.Int[at.Array, ""]
+
+
 class Pi0FAST(_model.BaseModel):
     def __init__(self, config: Pi0FASTConfig, rngs: nnx.Rngs):
         super().__init__(config.action_dim, config.action_horizon, config.max_token_len)
+        self.num_draft_tokens = config.num_draft_tokens
+        self.draft_ngram_size = config.draft_ngram_size
         paligemma_config = _gemma.get_config(config.paligemma_variant)
         # TODO: rewrite gemma in NNX. For now, use bridge.
         llm = nnx_bridge.ToNNX(
@@ -241,6 +302,13 @@ class Pi0FAST(_model.BaseModel):
         max_decoding_steps: int | at.Int[at.Array, ""] = 256,
         temperature: float = 0.0,
     ) -> _model.Actions:
+        state = self.prefill(rng, observation, max_decoding_steps=max_decoding_steps)
+        return self.decode(state, temperature=temperature).output_tokens
+
+    def prefill(
+        self, rng: at.KeyArrayLike, observation: _model.Observation, *, max_decoding_steps: int = 256
+    ) -> DecodeState:
+        """Fills the KV cache with the prefix and returns the state for decoding the first token."""
         # TODO: this is a hack to get the image keys.
         observation = _model.preprocess_observation(
             None, observation, train=False, image_keys=list(observation.images.keys())
@@ -256,58 +324,234 @@ class Pi0FAST(_model.BaseModel):
         )
         prefill_size = prefix_token_embeddings.shape[1]
         prefill_len = jnp.sum(prefix_mask, axis=-1)
-        prefix_start = prefill_size - prefill_len
+        # drafted tokens are written to the KV cache in blocks that may extend beyond the last decoding step
+        cache_size = prefill_size + max_decoding_steps + self.num_draft_tokens
 
         # first fill KV cache with a forward pass of the prefix
-        # pad attention mask to set the size of the KV cache (prefill_size + max_decoding_steps)
-        prefix_attn_mask = jnp.pad(prefix_attn_mask, ((0, 0), (0, 0), (0, max_decoding_steps)))
+        # pad attention mask to set the size of the KV cache
+        prefix_attn_mask = jnp.pad(prefix_attn_mask, ((0, 0), (0, 0), (0, cache_size - prefill_size)))
         prefix_positions = jnp.cumsum(prefix_mask, axis=-1) - 1
-        prefix_logits, kv_cache, _ = self.PaliGemma.llm(
-            embedded_prefix=prefix_token_embeddings, mask=prefix_attn_mask, positions=prefix_positions, decode=True
+        prefix_pre_logits, kv_cache, _ = self.PaliGemma.llm(
+            embedded_prefix=prefix_token_embeddings,
+            mask=prefix_attn_mask,
+            positions=prefix_positions,
+            decode=True,
+            return_prelogits=True,
         )
 
         # prepare decoding -- final logit decodes the first token
-        last_logit = prefix_logits[:, -1:]
-        output_tokens = jnp.zeros((last_logit.shape[0], max_decoding_steps))
-
-        def step(carry):
-            rng, last_logit, output_tokens, cache, _, step = carry
+        # only the final logit is computed, since the logits of all prefix tokens need a lot of memory
+        last_logit, _ = self.PaliGemma.llm(pre_logits=prefix_pre_logits[:, -1:])
+        batch_size = last_logit.shape[0]
+        return DecodeState(
+            rng=rng,
+            last_logit=last_logit,
+            output_tokens=jnp.zeros((batch_size, max_decoding_steps)),
+            kv_cache=kv_cache,
+            prefill_len=prefill_len,
+            prompt_tokens=jnp.where(observation.tokenized_prompt_mask, observation.tokenized_prompt, -1),
+            finished=jnp.zeros((batch_size,), dtype=bool),
+            step=jnp.zeros((), dtype=jnp.int32),
+        )
 
+    def decode(
+        self,
+        state: DecodeState,
+        *,
+        temperature: float = 0.0,
+        num_steps: int | at.Int[at.Array, ""] | None = None,
+    ) -> DecodeState:
+        """Decodes until every sequence has decoded an EOS token or `max_decoding_steps` tokens.
+
+        Each sequence is finished after its first EOS token, and all of its following tokens are 0.
+
+        Args:
+            state: State returned by `prefill` or a previous call of `decode`.
+            temperature: Sampling temperature. Drafts are only used for greedy decoding (temperature 0).
+            num_steps: If provided, decoding also stops once `num_steps` more tokens are decoded (or a few more, when
+                drafts are accepted), so that decoding can be continued after modifying the state on the host.
+        """
+        batch_size, max_decoding_steps = state.output_tokens.shape
+        cache_size = state.kv_cache[1].shape[2]
+        prefill_size = cache_size - max_decoding_steps - self.num_draft_tokens
+        prefix_start = prefill_size - state.prefill_len
+        end_step = max_decoding_steps if num_steps is None else jnp.minimum(state.step + num_steps, max_decoding_steps)
+
+        def decode_mask(step, num_tokens):
+            # token i of the decoded block attends to the prefix and all decoded tokens up to and including itself
+            keys = jnp.arange(cache_size)[None, None, :]
+            end = prefill_size + step + 1 + jnp.arange(num_tokens)[None, :, None]
+            return jnp.logical_and(keys >= prefix_start[:, None, None], keys < end)
+
+        def step(state):
             # Sample token from last logit
             # Split RNG for this step
-            rng, rng_step = jax.random.split(rng)
+            rng, rng_step = jax.random.split(state.rng)
             token = jax.lax.cond(
                 temperature > 0.0,
-                lambda _: jax.random.categorical(rng_step, last_logit / temperature, axis=-1),
-                lambda _: jnp.argmax(last_logit, axis=-1),
+                lambda _: jax.random.categorical(rng_step, state.last_logit / temperature, axis=-1),
+                lambda _: jnp.argmax(state.last_logit, axis=-1),
                 operand=None,
             )
-            output_tokens = put_along_last_axis(output_tokens, jnp.broadcast_to(step, (token.shape[0], 1)), token)
-
-            # Check for early stopping --> stop if all batch elements have EOS token
-            has_eos = jnp.any(token == PALIGEMMA_EOS_TOKEN, axis=-1)
-            all_eos = jnp.all(has_eos)
+            # Finished sequences are padded with zeros.
+            token = jnp.where(state.finished[:, None], 0, token)
+            output_tokens = put_along_last_axis(
+                state.output_tokens, jnp.broadcast_to(state.step, (batch_size, 1)), token
+            )
+            finished = state.finished | jnp.any(token == PALIGEMMA_EOS_TOKEN, axis=-1)
 
             # Decode one step
             token_embedding = self.PaliGemma.llm(token, embed_only=True)
-            positions = prefill_len[:, None] + step + 1
-            mask = jnp.logical_and(
-                jnp.arange(prefill_size + max_decoding_steps)[None, None, :] >= prefix_start[:, None, None],
-                jnp.arange(prefill_size + max_decoding_steps)[None, None, :]
-                < (jnp.broadcast_to(prefill_size + step + 1, (prefix_start.shape[0], 1, 1))),
-            )
+            positions = state.prefill_len[:, None] + state.step + 1
+            mask = decode_mask(state.step, 1)
             last_logit, kv_cache, _ = self.PaliGemma.llm(
-                embedded_prefix=token_embedding, mask=mask, positions=positions, decode=True, kv_cache=cache
+                embedded_prefix=token_embedding, mask=mask, positions=positions, decode=True, kv_cache=state.kv_cache
             )
 
-            return rng, last_logit, output_tokens, kv_cache, all_eos, step + 1
+            return state.replace(
+                rng=rng,
+                last_logit=last_logit,
+                output_tokens=output_tokens,
+                kv_cache=kv_cache,
+                finished=finished,
+                step=state.step + 1,
+            )
 
-        def cond(carry):
-            _, _, _, _, all_eos, step = carry
-            return (~all_eos) & (step < max_decoding_steps)
+        def cond(state):
+            # stop if all batch elements are finished
+            return (~jnp.all(state.finished)) & (state.step < end_step)
 
-        # Use lax.while_loop so we can jit the full decoding loop.
-        _, _, output_tokens, _, _, _ = jax.lax.while_loop(
-            cond, step, (rng, last_logit, output_tokens, kv_cache, False, 0)
-        )
-        return output_tokens
+        def decode():
+            # Use lax.while_loop so we can jit the full decoding loop.
+            return jax.lax.while_loop(cond, step, state)
+
+        if self.num_draft_tokens == 0:
+            return decode()
+
+        # Tokens that drafts are looked up from: the prompt, followed by the decoded tokens.
+        num_prompt_tokens = state.prompt_tokens.shape[1]
+
+        def speculative_step(carry):
+            state, history = carry
+            block_size = self.num_draft_tokens + 1
+
+            # The first token is always correct. The drafts are verified together with it in a single forward pass.
+            token = jnp.argmax(state.last_logit[:, 0], axis=-1)
+            history = jax.lax.dynamic_update_slice_in_dim(
+                history, token[:, None], num_prompt_tokens + state.step, axis=1
+            )
+            draft = ngram_draft(
+                history, num_prompt_tokens + state.step + 1, self.draft_ngram_size, self.num_draft_tokens
+            )
+            tokens = jnp.concatenate([token[:, None], draft], axis=1)
+
+            # Overwrite the cache entries of rejected drafts from the previous step.
+            idx, k_cache, v_cache = state.kv_cache
+            cache = (jnp.full_like(idx, prefill_size + state.step), k_cache, v_cache)
+            logits, cache, _ = self.PaliGemma.llm(
+                embedded_prefix=self.PaliGemma.llm(tokens, embed_only=True),
+                mask=decode_mask(state.step, block_size),
+                positions=state.prefill_len[:, None] + state.step + 1 + jnp.arange(block_size)[None, :],
+                decode=True,
+                kv_cache=cache,
+            )
+
+            # Tokens after the first EOS token of a sequence are padding, like all tokens of finished sequences.
+            is_eos = tokens == PALIGEMMA_EOS_TOKEN
+            is_padding = state.finished[:, None] | (jnp.cumsum(is_eos, axis=-1) - is_eos > 0)
+            # Accept the longest prefix of drafts that matches the greedy predictions in all unfinished batch elements.
+            matches = (jnp.argmax(logits[:, :-1], axis=-1) == draft) | is_padding[:, 1:]
+            num_accepted = jnp.min(jnp.sum(jnp.cumprod(matches, axis=-1), axis=-1))
+            num_tokens = jnp.minimum(num_accepted + 1, max_decoding_steps - state.step)
+            finished = state.finished | jnp.any(is_eos & (jnp.arange(block_size) < num_tokens), axis=-1)
+
+            history = jax.lax.dynamic_update_slice_in_dim(
+                history, jnp.where(is_padding, 0, tokens), num_prompt_tokens + state.step, axis=1
+            )
+            state = state.replace(
+                last_logit=jax.lax.dynamic_slice_in_dim(logits, num_tokens - 1, 1, axis=1),
+                kv_cache=cache,
+                finished=finished,
+                step=state.step + num_tokens,
+            )
+            return state, history
+
+        def decode_speculative():
+            history = jnp.concatenate(
+                [
+                    state.prompt_tokens,
+                    state.output_tokens.astype(jnp.int32),
+                    jnp.zeros((batch_size, self.num_draft_tokens), jnp.int32),
+                ],
+                axis=1,
+            )
+            state_, history = jax.lax.while_loop(lambda carry: cond(carry[0]), speculative_step, (state, history))
+            decoded = history[:, num_prompt_tokens : num_prompt_tokens + max_decoding_steps]
+            # Drafts beyond the last decoded token are not part of the output.
+            output_tokens = jnp.where(jnp.arange(max_decoding_steps) < state_.step, decoded, 0)
+            return state_.replace(output_tokens=output_tokens.astype(state.output_tokens.dtype))
+
+        # Drafts are only verified against greedy predictions.
+        return jax.lax.cond(temperature > 0.0, decode, decode_speculative)
+
+
+class CompactingDecoder:
+    """Decodes with a host-side loop that removes finished sequences from the batch.
+
+    `Pi0FAST.sample_actions` decodes all sequences of a batch until the last one is finished, so a single long sequence
+    keeps the whole batch busy. This decoder instead calls `Pi0FAST.decode` for `compact_every` tokens at a time and
+    then drops the finished sequences from the decoding state, including the KV cache. The batch is padded to a power of
+    two by repeating sequences to bound the number of compilations.
+
+    This is useful for large batches of sequences with very different lengths, and `Policy.infer_batch` uses it for
+    batches of more than one observation. The decoded tokens are the same as those of `Pi0FAST.sample_actions` for
+    greedy decoding.
+    """
+
+    def __init__(self, model: Pi0FAST, *, compact_every: int = 16):
+        if compact_every <= 0:
+            raise ValueError(f"compact_every must be positive, got {compact_every}.")
+        self._compact_every = compact_every
+        self._prefill = nnx_utils.module_jit(model.prefill, static_argnames=["max_decoding_steps"])
+        self._decode = nnx_utils.module_jit(model.decode)
+
+    def sample_actions(
+        self,
+        rng: at.KeyArrayLike,
+        observation: _model.Observation,
+        *,
+        max_decoding_steps: int = 256,
+        temperature: float = 0.0,
+    ) -> np.ndarray:
+        state = self._prefill(rng, observation, max_decoding_steps=max_decoding_steps)
+        output_tokens = np.zeros(state.output_tokens.shape, dtype=state.output_tokens.dtype)
+        # Index of the sequence in `output_tokens` for each row of the decoding state.
+        rows = np.arange(len(output_tokens))
+
+        while True:
+            state = self._decode(state, temperature=temperature, num_steps=self._compact_every)
+            # Rows that are repeated for padding are only read once.
+            unique_rows, first = np.unique(rows, return_index=True)
+            output_tokens[unique_rows] = np.asarray(state.output_tokens)[first]
+            finished = np.asarray(state.finished)[first]
+            if finished.all() or int(state.step) >= max_decoding_steps:
+                return output_tokens
+
+            keep = first[~finished]
+            batch_size = 1 << (len(keep) - 1).bit_length()
+            if batch_size < len(rows):
+                keep = np.pad(keep, (0, batch_size - len(keep)), mode="edge")
+                state = _take_rows(state, keep)
+                rows = rows[keep]
+
+
+def _take_rows(state: DecodeState, rows: np.ndarray) -> DecodeState:
+    """Gathers rows of all batched arrays of the state. The KV cache has the layers as leading axis."""
+    return state.replace(
+        last_logit=state.last_logit[rows],
+        output_tokens=state.output_tokens[rows],
+        kv_cache=jax.tree.map(lambda x: x[:, rows], state.kv_cache),
+        prefill_len=state.prefill_len[rows],
+        prompt_tokens=state.prompt_tokens[rows],
+        finished=state.finished[rows],
+    )
@@ -0,0 +1,89 @@
+import dataclasses
+
+import flax.nnx as nnx
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from openpi.models import pi0_fast
+from openpi.shared import nnx_utils
+
+
+def test_ngram_draft():
+    history = jnp.array(
+        [
+            [5, 6, 7, 8, 9, 5, 6, 0, 0],
+            [5, 6, 7, 5, 6, 3, 5, 6, 0],
+            [1, 2, 3, 4, 5, 6, 0, 0, 0],
+        ]
+    )
+    draft = pi0_fast.ngram_draft(history, jnp.array(7), ngram_size=2, num_draft_tokens=3)
+    # The most recent earlier occurrence of the last two tokens is continued. Without one, the last token is repeated.
+    np.testing.assert_array_equal(draft, [[7, 8, 9], [5, 5, 5], [0, 0, 0]])
+
+    draft = pi0_fast.ngram_draft(history, jnp.array(8), ngram_size=2, num_draft_tokens=2)
+    np.testing.assert_array_equal(draft, [[0, 0], [3, 5], [0, 0]])
+
+
+def test_speculative_decoding():
+    key = jax.random.key(0)
+    config = pi0_fast.Pi0FASTConfig(paligemma_variant="dummy", dtype="float32", max_token_len=32)
+    params = nnx.state(config.create(key)).to_pure_dict()
+    # The embeddings are initialized with zeros, which makes all logits equal.
+    embedder = params["PaliGemma"]["llm"]["embedder"]
+    embedder["input_embedding"] = 0.05 * jax.random.normal(key, embedder["input_embedding"].shape)
+    model = config.load(params)
+    draft_model = dataclasses.replace(config, num_draft_tokens=4).load(params)
+
+    obs = config.fake_obs(2)
+    obs = dataclasses.replace(
+        obs,
+        tokenized_prompt=jax.random.randint(key, obs.tokenized_prompt.shape, 2, 200),
+        tokenized_prompt_mask=jnp.ones_like(obs.tokenized_prompt_mask),
+    )
+
+    def sample_actions(model, **kwargs):
+        return nnx_utils.module_jit(model.sample_actions, static_argnames=["max_decoding_steps"])(
+            key, obs, max_decoding_steps=24, **kwargs
+        )
+
+    tokens = sample_actions(model)
+    assert len(np.unique(tokens)) > 2
+    np.testing.assert_array_equal(sample_actions(draft_model), tokens)
+
+    # Sampling with a temperature does not use drafts.
+    sampled_tokens = sample_actions(draft_model, temperature=1.0)
+    assert sampled_tokens.shape == tokens.shape
+
+
+def test_per_sequence_termination():
+    key = jax.random.key(0)
+    config = pi0_fast.Pi0FASTConfig(paligemma_variant="dummy", dtype="float32", max_token_len=32)
+    params = nnx.state(config.create(key)).to_pure_dict()
+    # Random embeddings, with a large one for EOS so that the sequences end after different numbers of tokens.
+    embedder = params["PaliGemma"]["llm"]["embedder"]
+    embedding = 0.05 * jax.random.normal(key, embedder["input_embedding"].shape)
+    eos_embedding = 0.3 * jax.random.normal(jax.random.key(1), embedding.shape[1:])
+    embedder["input_embedding"] = embedding.at[pi0_fast.PALIGEMMA_EOS_TOKEN].set(eos_embedding)
+    model = config.load(params)
+
+    obs = config.fake_obs(4)
+    obs = dataclasses.replace(
+        obs,
+        tokenized_prompt=jax.random.randint(key, obs.tokenized_prompt.shape, 2, 200),
+        tokenized_prompt_mask=jnp.ones_like(obs.tokenized_prompt_mask),
+    )
+    sample_actions = nnx_utils.module_jit(model.sample_actions, static_argnames=["max_decoding_steps"])
+    tokens = np.asarray(sample_actions(key, obs, max_decoding_steps=24))
+
+    # Sequences are padded with zeros after their first EOS token.
+    is_eos = tokens == pi0_fast.PALIGEMMA_EOS_TOKEN
+    assert np.all(np.sum(is_eos, axis=-1) <= 1)
+    lengths = np.where(is_eos.any(axis=-1), np.argmax(is_eos, axis=-1) + 1, tokens.shape[1])
+    assert len(np.unique(lengths)) > 2
+    assert np.all(tokens[np.arange(tokens.shape[1]) >= lengths[:, None]] == 0)
+
+    # Removing finished sequences from the batch does not change the decoded tokens, also with drafts.
+    draft_model = dataclasses.replace(config, num_draft_tokens=4).load(params)
+    decoder = pi0_fast.CompactingDecoder(draft_model, compact_every=4)
+    np.testing.assert_array_equal(decoder.sample_actions(key, obs, max_decoding_steps=24), tokens)
@@ -0,0 +1,87 @@
+"""Post-training weight-only quantization of the Gemma kernels.
+
+Quantized kernels are stored as int8 together with a scale per output channel, i.e., the maximum absolute value along
+the contracted (second to last) axis of the kernel divided by 127. The kernels are dequantized on the fly right before
+the matmul, so activations and the matmul itself keep their original precision while the weights only need half the
+memory of bfloat16 weights.
+
+Quantized models can only be used for inference.
+"""
+
+from collections.abc import Mapping
+import re
+from typing import Literal, TypeAlias
+
+from flax import traverse_util
+import jax.numpy as jnp
+import numpy as np
+
+import openpi.shared.array_typing as at
+
+WeightQuantization: TypeAlias = Literal["int8"]
+
+# Suffix of the names of the params holding the scales of a quantized kernel.
+SCALE_SUFFIX = "_scale"
+
+# Key paths of the quantized kernels of `lora.Einsum` and `lora.FeedForward`, relative to the Gemma module. LoRA weights
+# are not quantized.
+_KERNEL_PATTERN = re.compile(r"(.*/)?((q|kv|qkv|attn_vec)_einsum(_\d+)?/w|mlp(_\d+)?/(gating_einsum|linear))")
+
+
+def quantize(w: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Quantizes a kernel to int8 with one scale per output channel.
+
+    Returns:
+        The int8 kernel and the scales, which have the same shape as the kernel except for the second to last axis,
+        which is 1, and the same dtype as the kernel.
+    """
+    if w.ndim > 2:
+        # Quantize stacked kernels (e.g., of scanned layers) one at a time to limit the memory of the float32 copy.
+        quantized, scale = zip(*(quantize(x) for x in w), strict=True)
+        return np.stack(quantized), np.stack(scale)
+    w32 = np.asarray(w, dtype=np.float32)
+    scale = np.max(np.abs(w32), axis=-2, keepdims=True) / 127
+    scale = np.where(scale == 0, 1, scale)
+    quantized = np.clip(np.round(w32 / scale), -127, 127).astype(np.int8)
+    return quantized, scale.astype(w.dtype)
+
+
+def dequantize(quantized: at.Array, scale: at.Array, dtype: jnp.dtype) -> at.Array:
+    """Inverse of `quantize`. Used inside of the model, where it is fused with the following matmul."""
+    return quantized.astype(dtype) * scale.astype(dtype)
+
+
+def quantize_params(params: at.Params, *, scope: str = "PaliGemma/llm") -> at.Params:
+    """Quantizes the Gemma kernels of a pure dict of params.
+
+    The params are quantized on the host, so that the unquantized params never need to be on the device. Params that
+    are already quantized are returned unchanged, so this can be applied to every checkpoint that is loaded into a
+    quantized model.
+
+    Args:
+        params: Unquantized (or quantized) params, e.g., as returned by `model.restore_params`.
+        scope: Key path of the Gemma module in `params`. Only kernels inside of it are quantized.
+
+    Returns:
+        The params with every quantized kernel replaced by its int8 version and the scales added next to it, with the
+        kernel's name and `SCALE_SUFFIX` as their name.
+    """
+    flat_params = traverse_util.flatten_dict(params, sep="/")
+    quantized_params = {}
+    for path, value in flat_params.items():
+        if path.startswith(f"{scope}/") and _KERNEL_PATTERN.fullmatch(path[len(scope) + 1 :]):
+            if f"{path}{SCALE_SUFFIX}" in flat_params:
+                quantized_params[path] = value
+                continue
+            quantized_params[path], quantized_params[f"{path}{SCALE_SUFFIX}"] = quantize(np.asarray(value))
+        else:
+            quantized_params[path] = value
+
+    if not any(path.endswith(SCALE_SUFFIX) for path in quantized_params):
+        raise ValueError(f"No kernels to quantize found in {scope}.")
+    return traverse_util.unflatten_dict(quantized_params, sep="/")
+
+
+def is_quantized(params: Mapping) -> bool:
+    """Returns whether a pure dict of params contains quantized kernels."""
+    return any(path[-1].endswith(SCALE_SUFFIX) for path in traverse_util.flatten_dict(params))
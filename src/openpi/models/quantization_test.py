@@ -0,0 +1,75 @@
+import dataclasses
+
+from flax import nnx
+from flax import traverse_util
+import jax
+import jax.numpy as jnp
+import numpy as np
+import orbax.checkpoint as ocp
+
+from openpi.models import model as _model
+from openpi.models import pi0_config
+from openpi.models import quantization
+from openpi.shared import nnx_utils
+
+
+def test_quantize():
+    w = np.random.default_rng(0).standard_normal((3, 16, 8)).astype(np.float32)
+    quantized, scale = quantization.quantize(w)
+    assert quantized.dtype == np.int8
+    assert scale.shape == (3, 1, 8)
+    assert scale.dtype == np.float32
+
+    dequantized = quantization.dequantize(quantized, scale, jnp.float32)
+    assert np.all(np.abs(dequantized - w) <= scale / 2 + 1e-6)
+
+
+def test_quantize_params(tmp_path):
+    params = {
+        "PaliGemma": {
+            "llm": {
+                "layers": {
+                    "attn": {"q_einsum": {"w": np.ones((2, 4, 8)), "lora_a": np.ones((2, 4, 1))}},
+                    "mlp_1": {"gating_einsum": np.ones((2, 4, 8)), "linear": np.ones((8, 4))},
+                },
+                "embedder": {"input_embedding": np.ones((10, 4))},
+            },
+            "img": {"head": {"kernel": np.ones((4, 4))}},
+        }
+    }
+    quantized_params = quantization.quantize_params(params)
+    flat_params = traverse_util.flatten_dict(quantized_params, sep="/")
+    quantized_paths = {path for path, value in flat_params.items() if value.dtype == np.int8}
+    assert quantized_paths == {
+        "PaliGemma/llm/layers/attn/q_einsum/w",
+        "PaliGemma/llm/layers/mlp_1/gating_einsum",
+        "PaliGemma/llm/layers/mlp_1/linear",
+    }
+    assert {f"{path}{quantization.SCALE_SUFFIX}" for path in quantized_paths} < set(flat_params)
+    assert quantization.is_quantized(quantized_params)
+    assert not quantization.is_quantized(params)
+
+    # Quantized params are not quantized again, and keep their dtype when they are restored.
+    assert quantization.quantize_params(quantized_params) == quantized_params
+    with ocp.PyTreeCheckpointer() as ckptr:
+        ckptr.save(tmp_path / "params", {"params": quantized_params})
+    restored = _model.restore_params(tmp_path / "params", restore_type=np.ndarray, dtype=jnp.bfloat16)
+    assert restored["PaliGemma"]["llm"]["layers"]["attn"]["q_einsum"]["w"].dtype == np.int8
+    assert restored["PaliGemma"]["llm"]["layers"]["attn"]["q_einsum"]["w_scale"].dtype == jnp.bfloat16
+
+
+def test_quantized_model():
+    key = jax.random.key(0)
+    config = pi0_config.Pi0Config(paligemma_variant="dummy", action_expert_variant="dummy", dtype="float32")
+    model = config.create(key)
+
+    quantized_config = dataclasses.replace(config, weight_quantization="int8")
+    params = quantization.quantize_params(jax.tree.map(np.asarray, nnx.state(model).to_pure_dict()))
+    quantized_model = quantized_config.load(jax.tree.map(jnp.asarray, params))
+
+    obs = config.fake_obs(2)
+    noise = jax.random.normal(key, (2, model.action_horizon, model.action_dim))
+    actions = nnx_utils.module_jit(model.sample_actions)(key, obs, num_steps=3, noise=noise)
+    quantized_actions = nnx_utils.module_jit(quantized_model.sample_actions)(key, obs, num_steps=3, noise=noise)
+    np.testing.assert_allclose(quantized_actions, actions, atol=0.05)
+    assert not np.allclose(quantized_actions, actions, atol=1e-7)
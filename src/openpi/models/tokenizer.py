@@ -1,3 +1,4 @@
+import collections
 import logging
 import os
 
@@ -10,6 +11,89 @@ from transformers import AutoProcessor
 import openpi.models.utils.fsq_tokenizer as fsq_tokenizer
 import openpi.shared.download as download
 
+# Bin edges of the discretized state, see `PromptEncoder.encode_state_prompt`.
+_STATE_BINS = np.linspace(-1, 1, 256 + 1)[:-1]
+
+
+class PromptEncoder:
+    """Encodes prompts with a SentencePiece tokenizer.
+
+    The same prompts (e.g., task instructions) are encoded for many training samples and inference steps, so the tokens
+    of the most recently encoded texts are cached. Discretized states are encoded by looking up the tokens of each state
+    bin, which is only done if this gives the same tokens as encoding the whole prompt. This is checked when the encoder
+    is created.
+    """
+
+    def __init__(
+        self,
+        tokenizer: sentencepiece.SentencePieceProcessor,
+        *,
+        state_suffixes: tuple[str, ...] = (),
+        cache_size: int = 1024,
+    ):
+        self._tokenizer = tokenizer
+        self._cache_size = cache_size
+        self._cache: collections.OrderedDict[tuple[str, bool, bool], np.ndarray] = collections.OrderedDict()
+
+        # Tokens of " {bin}" for the bins -1 to 255, right-padded to the same length.
+        bin_tokens = [tokenizer.encode(f" {i}") for i in range(-1, 256)]
+        lengths = np.array([len(tokens) for tokens in bin_tokens])
+        self._bin_token_mask = np.arange(lengths.max()) < lengths[:, None]
+        self._bin_tokens = np.zeros(self._bin_token_mask.shape, dtype=int)
+        self._bin_tokens[self._bin_token_mask] = np.concatenate(bin_tokens)
+        self._use_bin_tokens = all(
+            self._is_concatenation(f", State: {i} {j}{suffix}", [", State:", f" {i}", f" {j}", suffix])
+            for i, j in zip(range(-1, 256), range(256), strict=False)
+            for suffix in state_suffixes
+        )
+        if not self._use_bin_tokens:
+            logging.warning("State tokens depend on their context, falling back to encoding the whole prompt.")
+
+    def encode(self, text: str, *, add_bos: bool = False, add_eos: bool = False) -> np.ndarray:
+        """Encodes a text. The returned tokens must not be modified, since they are cached."""
+        key = (text, add_bos, add_eos)
+        if (tokens := self._cache.get(key)) is not None:
+            self._cache.move_to_end(key)
+            return tokens
+
+        tokens = np.asarray(self._tokenizer.encode(text, add_bos=add_bos, add_eos=add_eos), dtype=int)
+        self._cache[key] = tokens
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def encode_state_prompt(self, prefix: str, state: np.ndarray, suffix: str) -> np.ndarray:
+        """Encodes `f"{prefix} {state_str}{suffix}"` with BOS, where `state_str` is the discretized state.
+
+        The state gets discretized into 256 bins (assumed range after normalization: [-1, 1]), whose numbers are joined
+        with spaces. `prefix` must end with "State:" and `suffix` must be one of the `state_suffixes`.
+        """
+        discretized_state = np.digitize(state, bins=_STATE_BINS) - 1
+        if not self._use_bin_tokens:
+            state_str = " ".join(map(str, discretized_state))
+            return np.asarray(self._tokenizer.encode(f"{prefix} {state_str}{suffix}", add_bos=True), dtype=int)
+        if len(discretized_state) == 0:
+            # Without bins, the space after the prefix is not part of any bin tokens.
+            return self.encode(f"{prefix} {suffix}", add_bos=True)
+
+        state_tokens = self._bin_tokens[discretized_state + 1][self._bin_token_mask[discretized_state + 1]]
+        return np.concatenate([self.encode(prefix, add_bos=True), state_tokens, self.encode(suffix)])
+
+    def _is_concatenation(self, text: str, parts: list[str]) -> bool:
+        return self._tokenizer.encode(text) == [token for part in parts for token in self._tokenizer.encode(part)]
+
+
+def _pad(tokens: np.ndarray, max_len: int) -> tuple[np.ndarray, int]:
+    """Pads or truncates tokens to `max_len` and returns them together with the number of tokens before padding."""
+    if len(tokens) > max_len:
+        logging.warning(
+            f"Token length ({len(tokens)}) exceeds max length ({max_len}), truncating. "
+            "Consider increasing the `max_token_len` in your model config if this happens frequently."
+        )
+    padded = np.zeros(max_len, dtype=int)
+    padded[: len(tokens)] = tokens[:max_len]
+    return padded, len(tokens)
+
 
 class PaligemmaTokenizer:
     def __init__(self, max_len: int = 48):
@@ -18,34 +102,19 @@ class PaligemmaTokenizer:
         path = download.maybe_download("gs://big_vision/paligemma_tokenizer.model", gs={"token": "anon"})
         with path.open("rb") as f:
             self._tokenizer = sentencepiece.SentencePieceProcessor(model_proto=f.read())
+        self._encoder = PromptEncoder(self._tokenizer, state_suffixes=(";\nAction: ",))
 
     def tokenize(self, prompt: str, state: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
         cleaned_text = prompt.strip().replace("_", " ").replace("\n", " ")
         if state is not None:
             # This is the Pi05 format, where the state is part of the discrete language input.
-            discretized_state = np.digitize(state, bins=np.linspace(-1, 1, 256 + 1)[:-1]) - 1
-            state_str = " ".join(map(str, discretized_state))
-            full_prompt = f"Task: {cleaned_text}, State: {state_str};\nAction: "
-            tokens = self._tokenizer.encode(full_prompt, add_bos=True)
+            tokens = self._encoder.encode_state_prompt(f"Task: {cleaned_text}, State:", state, ";\nAction: ")
         else:
             # This is the Pi0 format, where the state is part of the continuous action expert input.
             # tokenize "\n" separately as the "start of answer" token
-            tokens = self._tokenizer.encode(cleaned_text, add_bos=True) + self._tokenizer.encode("\n")
-        tokens_len = len(tokens)
-        if tokens_len < self._max_len:
-            padding = [False] * (self._max_len - tokens_len)
-            mask = [True] * tokens_len + padding
-            tokens = tokens + padding
-        else:
-            if len(tokens) > self._max_len:
-                logging.warning(
-                    f"Token length ({len(tokens)}) exceeds max length ({self._max_len}), truncating. "
-                    "Consider increasing the `max_token_len` in your model config if this happens frequently."
-                )
-            tokens = tokens[: self._max_len]
-            mask = [True] * self._max_len
-
-        return np.asarray(tokens), np.asarray(mask)
+            tokens = np.concatenate([self._encoder.encode(cleaned_text, add_bos=True), self._encoder.encode("\n")])
+        tokens, tokens_len = _pad(tokens, self._max_len)
+        return tokens, np.arange(self._max_len) < tokens_len
 
 
 class FASTTokenizer:
@@ -56,6 +125,7 @@ class FASTTokenizer:
         path = download.maybe_download("gs://big_vision/paligemma_tokenizer.model", gs={"token": "anon"})
         with path.open("rb") as f:
             self._paligemma_tokenizer = sentencepiece.SentencePieceProcessor(model_proto=f.read())
+        self._encoder = PromptEncoder(self._paligemma_tokenizer, state_suffixes=(";\n",))
 
         # Instantiate FAST tokenizer
         self._fast_tokenizer = AutoProcessor.from_pretrained(fast_tokenizer_path, trust_remote_code=True)
@@ -66,13 +136,8 @@ class FASTTokenizer:
     ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         cleaned_text = prompt.lower().strip().replace("_", " ")
 
-        # Convention: state gets discretized into 256 discrete bins (assumed range after normalization: [-1, 1])
-        discretized_state = np.digitize(state, bins=np.linspace(-1, 1, 256 + 1)[:-1]) - 1
-
         # Convention: prefix includes prompt and string-representation of state, followed by ';'
-        state_str = " ".join(map(str, discretized_state))
-        prefix = f"Task: {cleaned_text}, State: {state_str};\n"
-        prefix_tokens = self._paligemma_tokenizer.encode(prefix, add_bos=True)
+        prefix_tokens = self._encoder.encode_state_prompt(f"Task: {cleaned_text}, State:", state, ";\n")
 
         if actions is not None:
             # Tokenize actions with FAST tokenizer --> map to last tokens in PaliGemma vocab
@@ -80,41 +145,26 @@ class FASTTokenizer:
             action_tokens_in_pg = self._act_tokens_to_paligemma_tokens(action_tokens)
 
             # Convention: postfix contains 'Action:' followed by FAST tokens, followed by '|'
-            postfix_tokens = (
-                self._paligemma_tokenizer.encode("Action: ")
-                + action_tokens_in_pg.tolist()
-                + self._paligemma_tokenizer.encode("|", add_eos=True)
+            postfix_tokens = np.concatenate(
+                [
+                    self._encoder.encode("Action: "),
+                    action_tokens_in_pg,
+                    self._encoder.encode("|", add_eos=True),
+                ]
             )
         else:
-            postfix_tokens = []
+            postfix_tokens = np.zeros(0, dtype=int)
 
-        # Create output token sequence & masks
+        # Create output token sequence & masks, padded to max length
+        tokens, tokens_len = _pad(np.concatenate([prefix_tokens, postfix_tokens]), self._max_len)
+        positions = np.arange(self._max_len)
+        token_mask = positions < tokens_len
         # AR mask is 0 on prefix (bidirectional attention) and 1 on postfix (causal attention to all previous tokens)
-        tokens = prefix_tokens + postfix_tokens
-        token_mask = [True] * len(tokens)
-        ar_mask = [0] * len(prefix_tokens) + [1] * len(postfix_tokens)
-        loss_mask = [False] * len(prefix_tokens) + [True] * len(postfix_tokens)  # Loss on postfix only
+        is_postfix = token_mask & (positions >= len(prefix_tokens))
+        ar_mask = is_postfix.astype(int)
+        loss_mask = is_postfix  # Loss on postfix only
 
-        # Pad tokens to max length
-        tokens_len = len(tokens)
-        if tokens_len < self._max_len:
-            padding = [False] * (self._max_len - tokens_len)
-            tokens = tokens + padding
-            token_mask = token_mask + padding
-            ar_mask = ar_mask + padding
-            loss_mask = loss_mask + padding
-        else:
-            if len(tokens) > self._max_len:
-                logging.warning(
-                    f"Token length ({len(tokens)}) exceeds max length ({self._max_len}), truncating. "
-                    "Consider increasing the `max_token_len` in your model config if this happens frequently."
-                )
-            tokens = tokens[: self._max_len]
-            token_mask = token_mask[: self._max_len]
-            ar_mask = ar_mask[: self._max_len]
-            loss_mask = loss_mask[: self._max_len]
-
-        return np.asarray(tokens), np.asarray(token_mask), np.asarray(ar_mask), np.asarray(loss_mask)
+        return tokens, token_mask, ar_mask, loss_mask
 
     def extract_actions(self, tokens: np.ndarray, action_horizon: int, action_dim: int) -> np.ndarray:
         # Decode predicted output tokens
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 
 from openpi.models import tokenizer as _tokenizer
 
@@ -11,6 +12,20 @@ def test_tokenize():
     assert masks.shape == (10,)
 
 
+@pytest.mark.parametrize("state", [np.array([-1.5, -1.0, -0.3, 0.0, 0.5, 0.999, 1.0, 2.0]), np.zeros(0)])
+def test_tokenize_state(state: np.ndarray):
+    tokenizer = _tokenizer.PaligemmaTokenizer(max_len=100)
+    tokens, masks = tokenizer.tokenize("Pick up_the cup\n", state)
+
+    # Same as encoding the whole prompt.
+    discretized_state = np.digitize(state, bins=np.linspace(-1, 1, 256 + 1)[:-1]) - 1
+    state_str = " ".join(map(str, discretized_state))
+    prompt = f"Task: Pick up the cup, State: {state_str};\nAction: "
+    expected = tokenizer._tokenizer.encode(prompt, add_bos=True)  # noqa: SLF001
+    np.testing.assert_array_equal(tokens[masks], expected)
+    assert not masks[len(expected) :].any()
+
+
 def test_fast_tokenizer():
     prompt = "Hello, world!"
     state = np.random.rand(5).astype(np.float32)
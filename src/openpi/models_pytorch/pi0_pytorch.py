@@ -5,7 +5,10 @@ import torch
 from torch import Tensor
 from torch import nn
 import torch.nn.functional as F  # noqa: N812
+import torch.utils._pytree as pytree
+from transformers import DynamicCache
 
+import openpi.models.flow_sampling as _flow_sampling
 import openpi.models.gemma as _gemma
 from openpi.models_pytorch.gemma_pytorch import PaliGemmaWithExpertModel
 import openpi.models_pytorch.preprocessing_pytorch as _preprocessing
@@ -109,7 +112,21 @@ class PI0Pytorch(nn.Module):
             self.action_time_mlp_out = nn.Linear(action_expert_config.width, action_expert_config.width)
 
         torch.set_float32_matmul_precision("high")
-        self.sample_actions = torch.compile(self.sample_actions, mode="max-autotune")
+        # The attention implementation of both transformers. All of them accept the boolean 4D masks created by
+        # `_prepare_attention_masks_4d`, see `modeling_gemma.prefix_lm_attention_forward`.
+        for model in (
+            self.paligemma_with_expert.paligemma.language_model,
+            self.paligemma_with_expert.gemma_expert.model,
+        ):
+            model.config._attn_implementation = config.pytorch_attn_implementation  # noqa: SLF001
+        # The prefix pass and a single denoising step are compiled separately. The denoising step has static shapes
+        # and runs once or twice per integration step, so capturing it in a CUDA graph removes most of the per-step
+        # launch overhead. On CPUs, the compiled kernels still avoid the Python overhead of running the layers eagerly.
+        if config.pytorch_compile_mode is not None:
+            self._compute_prefix = torch.compile(self._compute_prefix, mode=config.pytorch_compile_mode)
+            self._denoise = torch.compile(self._denoise, mode=config.pytorch_compile_mode, dynamic=False)
+        # Buffers holding the inputs of `_denoise`, by the shapes of the inputs.
+        self._denoise_buffers = {}
 
         # Initialize gradient checkpointing flag
         self.gradient_checkpointing_enabled = False
@@ -154,9 +171,12 @@ class PI0Pytorch(nn.Module):
         return func(*args, **kwargs)
 
     def _prepare_attention_masks_4d(self, att_2d_masks):
-        """Helper method to prepare 4D attention masks for transformer."""
-        att_2d_masks_4d = att_2d_masks[:, None, :, :]
-        return torch.where(att_2d_masks_4d, 0.0, -2.3819763e38)
+        """Helper method to prepare 4D attention masks for transformer.
+
+        The masks stay boolean. Eager attention converts them to additive masks, while the fused implementations use
+        them directly.
+        """
+        return att_2d_masks[:, None, :, :]
 
     def _preprocess_observation(self, observation, *, train=True):
         """Helper method to preprocess observation."""
@@ -373,22 +393,69 @@ class PI0Pytorch(nn.Module):
         return F.mse_loss(u_t, v_t, reduction="none")
 
     @torch.no_grad()
-    def sample_actions(self, device, observation, noise=None, num_steps=10) -> Tensor:
-        """Do a full inference forward and compute the action (batch_size x num_steps x num_motors)"""
+    def sample_actions(
+        self,
+        device,
+        observation,
+        noise=None,
+        num_steps=10,
+        *,
+        solver="euler",
+        time_shift=1.0,
+        early_exit_threshold=None,
+    ) -> Tensor:
+        """Do a full inference forward and compute the action (batch_size x num_steps x num_motors)
+
+        See `Pi0.sample_actions` for the meaning of `solver`, `time_shift` and `early_exit_threshold`.
+        """
+        _flow_sampling.validate_solver(solver)
         bsize = observation.state.shape[0]
         if noise is None:
             actions_shape = (bsize, self.config.action_horizon, self.config.action_dim)
             noise = self.sample_noise(actions_shape, device)
 
         images, img_masks, lang_tokens, lang_masks, state = self._preprocess_observation(observation, train=False)
+        prefix_pad_masks, kv_cache = self._compute_prefix(images, img_masks, lang_tokens, lang_masks)
+
+        # The attention mask and positions of the suffix are the same for all denoising steps.
+        attention_mask, position_ids = self._prepare_suffix_masks(prefix_pad_masks)
+        inputs = self._static_inputs(
+            {
+                "state": state,
+                "attention_mask": attention_mask,
+                "position_ids": position_ids,
+                "kv_cache": kv_cache,
+                "x_t": noise,
+                "timestep": torch.zeros(bsize, dtype=torch.float32, device=device),
+            }
+        )
+
+        def velocity(x_t, time):
+            inputs["x_t"].copy_(x_t)
+            inputs["timestep"].fill_(time)
+            # Outputs of CUDA graphs are overwritten when the graph is replayed, so they are copied.
+            return self._denoise(**inputs).clone()
+
+        x_t = noise
+        v_prev = None
+        for i in range(num_steps):
+            time = _flow_sampling.timestep(i, num_steps, time_shift)
+            next_time = _flow_sampling.timestep(i + 1, num_steps, time_shift)
+            x_next, v_t = _flow_sampling.solver_step(velocity, x_t, time, next_time, solver)
+            if early_exit_threshold is not None and v_prev is not None:
+                change = torch.linalg.vector_norm(v_t - v_prev, dim=(-2, -1))
+                if torch.all(change < early_exit_threshold * torch.linalg.vector_norm(v_prev, dim=(-2, -1))):
+                    # The trajectory is close to a straight line, so the remaining steps are replaced by a single step.
+                    return x_t - time * v_t
+            x_t, v_prev = x_next, v_t
+        return x_t
 
+    def _compute_prefix(self, images, img_masks, lang_tokens, lang_masks):
+        """Run the prefix through the VLM. Returns the prefix padding mask and the key value cache of the prefix."""
         prefix_embs, prefix_pad_masks, prefix_att_masks = self.embed_prefix(images, img_masks, lang_tokens, lang_masks)
         prefix_att_2d_masks = make_att_2d_masks(prefix_pad_masks, prefix_att_masks)
         prefix_position_ids = torch.cumsum(prefix_pad_masks, dim=1) - 1
-
-        # Compute image and language key value cache
         prefix_att_2d_masks_4d = self._prepare_attention_masks_4d(prefix_att_2d_masks)
-        self.paligemma_with_expert.paligemma.language_model.config._attn_implementation = "eager"  # noqa: SLF001
 
         _, past_key_values = self.paligemma_with_expert.forward(
             attention_mask=prefix_att_2d_masks_4d,
@@ -397,26 +464,45 @@ class PI0Pytorch(nn.Module):
             inputs_embeds=[prefix_embs, None],
             use_cache=True,
         )
+        return prefix_pad_masks, past_key_values.to_legacy_cache()
+
+    def _prepare_suffix_masks(self, prefix_pad_masks):
+        """Compute the 4D attention mask and the position ids of the suffix tokens."""
+        batch_size, prefix_len = prefix_pad_masks.shape
+        device = prefix_pad_masks.device
+        # Same as the masks created in `embed_suffix`: image and language tokens do not attend to the state (Pi0 only)
+        # and action tokens, and the action tokens attend to each other.
+        suffix_att_masks = ([] if self.pi05 else [1]) + [1] + [0] * (self.config.action_horizon - 1)
+        suffix_len = len(suffix_att_masks)
+        suffix_pad_masks = torch.ones(batch_size, suffix_len, dtype=torch.bool, device=device)
+        suffix_att_masks = torch.tensor(suffix_att_masks, dtype=torch.bool, device=device)
+        suffix_att_masks = suffix_att_masks[None, :].expand(batch_size, suffix_len)
 
-        dt = -1.0 / num_steps
-        dt = torch.tensor(dt, dtype=torch.float32, device=device)
+        prefix_pad_2d_masks = prefix_pad_masks[:, None, :].expand(batch_size, suffix_len, prefix_len)
+        suffix_att_2d_masks = make_att_2d_masks(suffix_pad_masks, suffix_att_masks)
+        full_att_2d_masks = torch.cat([prefix_pad_2d_masks, suffix_att_2d_masks], dim=2)
 
-        x_t = noise
-        time = torch.tensor(1.0, dtype=torch.float32, device=device)
-        while time >= -dt / 2:
-            expanded_time = time.expand(bsize)
-            v_t = self.denoise_step(
-                state,
-                prefix_pad_masks,
-                past_key_values,
-                x_t,
-                expanded_time,
-            )
+        prefix_offsets = torch.sum(prefix_pad_masks, dim=-1)[:, None]
+        position_ids = prefix_offsets + torch.cumsum(suffix_pad_masks, dim=1) - 1
+        return self._prepare_attention_masks_4d(full_att_2d_masks), position_ids
 
-            # Euler step - use new tensor assignment instead of in-place operation
-            x_t = x_t + dt * v_t
-            time += dt
-        return x_t
+    def _static_inputs(self, inputs):
+        """Copy the inputs of `_denoise` into buffers that are reused by later calls with the same shapes.
+
+        CUDA graphs read their inputs from fixed addresses. Since the buffers are marked as static, compiled graphs read
+        them in place instead of copying all inputs (including the key value cache) before every replay.
+        """
+        leaves, spec = pytree.tree_flatten(inputs)
+        key = (str(spec), tuple((leaf.shape, leaf.dtype, leaf.device) for leaf in leaves))
+        if key not in self._denoise_buffers:
+            buffers = [torch.empty_like(leaf) for leaf in leaves]
+            for buffer in buffers:
+                torch._dynamo.mark_static_address(buffer)  # noqa: SLF001
+            self._denoise_buffers[key] = buffers
+        buffers = self._denoise_buffers[key]
+        for buffer, leaf in zip(buffers, leaves, strict=True):
+            buffer.copy_(leaf)
+        return pytree.tree_unflatten(buffers, spec)
 
     def denoise_step(
         self,
@@ -427,29 +513,19 @@ class PI0Pytorch(nn.Module):
         timestep,
     ):
         """Apply one denoising step of the noise `x_t` at a given timestep."""
-        suffix_embs, suffix_pad_masks, suffix_att_masks, adarms_cond = self.embed_suffix(state, x_t, timestep)
-
-        suffix_len = suffix_pad_masks.shape[1]
-        batch_size = prefix_pad_masks.shape[0]
-        prefix_len = prefix_pad_masks.shape[1]
-
-        prefix_pad_2d_masks = prefix_pad_masks[:, None, :].expand(batch_size, suffix_len, prefix_len)
+        attention_mask, position_ids = self._prepare_suffix_masks(prefix_pad_masks)
+        if isinstance(past_key_values, DynamicCache):
+            past_key_values = past_key_values.to_legacy_cache()
+        return self._denoise(state, attention_mask, position_ids, past_key_values, x_t, timestep)
 
-        suffix_att_2d_masks = make_att_2d_masks(suffix_pad_masks, suffix_att_masks)
-
-        full_att_2d_masks = torch.cat([prefix_pad_2d_masks, suffix_att_2d_masks], dim=2)
-
-        prefix_offsets = torch.sum(prefix_pad_masks, dim=-1)[:, None]
-        position_ids = prefix_offsets + torch.cumsum(suffix_pad_masks, dim=1) - 1
-
-        # Prepare attention masks
-        full_att_2d_masks_4d = self._prepare_attention_masks_4d(full_att_2d_masks)
-        self.paligemma_with_expert.gemma_expert.model.config._attn_implementation = "eager"  # noqa: SLF001
+    def _denoise(self, state, attention_mask, position_ids, kv_cache, x_t, timestep):
+        """Compute the velocity of `x_t` given precomputed suffix masks and the key value cache of the prefix."""
+        suffix_embs, _, _, adarms_cond = self.embed_suffix(state, x_t, timestep)
 
         outputs_embeds, _ = self.paligemma_with_expert.forward(
-            attention_mask=full_att_2d_masks_4d,
+            attention_mask=attention_mask,
             position_ids=position_ids,
-            past_key_values=past_key_values,
+            past_key_values=DynamicCache.from_legacy_cache(kv_cache),
             inputs_embeds=[None, suffix_embs],
             use_cache=False,
             adarms_cond=[None, adarms_cond],
@@ -0,0 +1,124 @@
+import dataclasses
+import types
+
+import jax
+import numpy as np
+import pytest
+import torch
+
+from openpi.models import model as _model
+from openpi.models import pi0_config
+
+# The model requires the patched transformers modules from `transformers_replace`.
+pytest.importorskip("transformers.models.siglip.check")
+
+from transformers.models.gemma import modeling_gemma
+
+from openpi.models_pytorch import pi0_pytorch
+
+
+def _create_model(compile_mode: str | None, attn_implementation: str = "eager") -> pi0_pytorch.PI0Pytorch:
+    config = pi0_config.Pi0Config(
+        paligemma_variant="dummy",
+        action_expert_variant="dummy",
+        dtype="float32",
+        pytorch_compile_mode=compile_mode,
+        pytorch_attn_implementation=attn_implementation,
+    )
+    torch.manual_seed(0)
+    model = pi0_pytorch.PI0Pytorch(config)
+    model.eval()
+    return model
+
+
+def _fake_obs(model: pi0_pytorch.PI0Pytorch, batch_size: int) -> _model.Observation:
+    obs = jax.tree.map(lambda x: torch.from_numpy(np.array(x)), model.config.fake_obs(batch_size))
+    generator = torch.Generator().manual_seed(0)
+    # The PyTorch model expects images in [channel, height, width] format.
+    images = {
+        name: torch.rand(image.permute(0, 3, 1, 2).shape, generator=generator) * 2 - 1
+        for name, image in obs.images.items()
+    }
+    return dataclasses.replace(obs, images=images)
+
+
+def test_sample_actions_reuses_buffers():
+    model = _create_model(None)
+    obs = _fake_obs(model, 2)
+    noise = torch.randn(2, model.config.action_horizon, model.config.action_dim)
+
+    first = model.sample_actions("cpu", obs, noise=noise, num_steps=2)
+    second = model.sample_actions("cpu", obs, noise=noise, num_steps=2)
+    torch.testing.assert_close(first, second)
+    assert len(model._denoise_buffers) == 1  # noqa: SLF001
+
+    model.sample_actions("cpu", _fake_obs(model, 1), num_steps=2)
+    assert len(model._denoise_buffers) == 2  # noqa: SLF001
+
+
+def test_denoise_step():
+    model = _create_model(None)
+    obs = _fake_obs(model, 2)
+    noise = torch.randn(2, model.config.action_horizon, model.config.action_dim)
+
+    # A single Euler step from t=1 to t=0 is exactly one denoising step.
+    actions = model.sample_actions("cpu", obs, noise=noise, num_steps=1)
+
+    images, img_masks, lang_tokens, lang_masks, state = model._preprocess_observation(obs, train=False)  # noqa: SLF001
+    prefix_pad_masks, kv_cache = model._compute_prefix(images, img_masks, lang_tokens, lang_masks)  # noqa: SLF001
+    with torch.no_grad():
+        v_t = model.denoise_step(state, prefix_pad_masks, kv_cache, noise, torch.ones(2))
+    torch.testing.assert_close(actions, noise - v_t)
+
+
+@pytest.mark.parametrize("implementation", ["sdpa", "flex_attention"])
+def test_prefix_lm_attention(implementation: str):
+    generator = torch.Generator().manual_seed(0)
+    batch_size, num_heads, num_kv_heads, seq_len, head_dim = 2, 8, 1, 40, 16
+    query = torch.randn(batch_size, num_heads, seq_len, head_dim, generator=generator)
+    key = torch.randn(batch_size, num_kv_heads, seq_len, head_dim, generator=generator)
+    value = torch.randn(batch_size, num_kv_heads, seq_len, head_dim, generator=generator)
+
+    # A prefix of 30 tokens with full attention followed by 10 causal tokens. The last 5 prefix tokens of the second
+    # example are padding, so their rows are fully masked.
+    pad_masks = torch.ones(batch_size, seq_len, dtype=torch.bool)
+    pad_masks[1, 25:30] = False
+    att_masks = torch.zeros(batch_size, seq_len, dtype=torch.bool)
+    att_masks[:, 30:] = True
+    mask = pi0_pytorch.make_att_2d_masks(pad_masks, att_masks)[:, None]
+
+    def attention(implementation):
+        config = types.SimpleNamespace(_attn_implementation=implementation)
+        module = types.SimpleNamespace(config=config, num_key_value_groups=num_heads // num_kv_heads, training=False)
+        output, _ = modeling_gemma.prefix_lm_attention_forward(module, query, key, value, mask, scaling=0.25)
+        return output
+
+    expected = attention("eager")
+    output = attention(implementation)
+    assert output.shape == (batch_size, seq_len, num_heads, head_dim)
+    assert not torch.isnan(output).any()
+    # The outputs of padding tokens are never used.
+    torch.testing.assert_close(output[pad_masks], expected[pad_masks], atol=1e-5, rtol=1e-5)
+
+
+def test_sample_actions_sdpa():
+    obs = _fake_obs(_create_model(None), 2)
+    noise = torch.randn(2, 50, 32)
+    expected = _create_model(None).sample_actions("cpu", obs, noise=noise, num_steps=2)
+    actions = _create_model(None, "sdpa").sample_actions("cpu", obs, noise=noise, num_steps=2)
+    torch.testing.assert_close(actions, expected, atol=1e-4, rtol=1e-4)
+
+
+@pytest.mark.manual
+def test_sample_actions_compiled():
+    # On CPUs, compiling takes several minutes and no CUDA graphs are used, but the compiled kernels must produce the
+    # same actions as the eager model.
+    eager_model = _create_model(None)
+    compiled_model = _create_model("reduce-overhead")
+    obs = _fake_obs(eager_model, 2)
+    noise = torch.randn(2, eager_model.config.action_horizon, eager_model.config.action_dim)
+
+    expected = eager_model.sample_actions("cpu", obs, noise=noise, num_steps=3, solver="heun")
+    for _ in range(2):
+        actions = compiled_model.sample_actions("cpu", obs, noise=noise, num_steps=3, solver="heun")
+        torch.testing.assert_close(actions, expected, atol=1e-4, rtol=1e-4)
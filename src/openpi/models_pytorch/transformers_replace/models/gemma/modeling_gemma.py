@@ -253,6 +253,73 @@ def eager_attention_forward(
     return attn_output, attn_weights
 
 
+# Attention implementations that accept the boolean prefix-LM block masks of openpi natively.
+PREFIX_LM_ATTENTION_IMPLEMENTATIONS = ("eager", "sdpa", "flex_attention")
+
+
+def prefix_lm_attention_forward(
+    module: nn.Module,
+    query: torch.Tensor,
+    key: torch.Tensor,
+    value: torch.Tensor,
+    attention_mask: Optional[torch.Tensor],
+    scaling: float,
+    dropout: float = 0.0,
+    **kwargs,
+):
+    """Attention with the implementation selected by `module.config._attn_implementation`.
+
+    `attention_mask` is a boolean `[batch, 1, query, key]` mask where True means that the query attends to the key.
+    Boolean masks are passed to the fused kernels as they are, instead of materializing an additive float mask of the
+    same size. Queries that cannot attend to any key (e.g., padding tokens) attend to all keys instead, which avoids
+    NaNs in the fused kernels. Their outputs differ from eager attention, but no other token attends to them. Other
+    masks are passed to the attention functions of `transformers`.
+    """
+    implementation = module.config._attn_implementation
+    if attention_mask is None or attention_mask.dtype != torch.bool:
+        if implementation == "eager":
+            return eager_attention_forward(module, query, key, value, attention_mask, scaling, dropout, **kwargs)
+        return ALL_ATTENTION_FUNCTIONS[implementation](
+            module, query, key, value, attention_mask, dropout=dropout, scaling=scaling, **kwargs
+        )
+
+    attention_mask = attention_mask[:, :, :, : key.shape[-2]]
+    if implementation == "eager":
+        additive_mask = torch.where(attention_mask, 0.0, -2.3819763e38)
+        return eager_attention_forward(module, query, key, value, additive_mask, scaling, dropout, **kwargs)
+
+    attention_mask = attention_mask | ~attention_mask.any(dim=-1, keepdim=True)
+    if implementation == "sdpa":
+        attn_output = nn.functional.scaled_dot_product_attention(
+            query,
+            repeat_kv(key, module.num_key_value_groups),
+            repeat_kv(value, module.num_key_value_groups),
+            attn_mask=attention_mask,
+            dropout_p=dropout if module.training else 0.0,
+            scale=scaling,
+        )
+    elif implementation == "flex_attention":
+        # Flex attention skips blocks of the mask that are fully masked out, e.g. the action tokens for image and
+        # language queries. It does not support dropout.
+        from torch.nn.attention.flex_attention import create_block_mask, flex_attention
+
+        mask = attention_mask[:, 0]
+
+        def mask_mod(batch_idx, head_idx, q_idx, kv_idx):
+            return mask[batch_idx, q_idx, kv_idx]
+
+        block_mask = create_block_mask(
+            mask_mod, B=mask.shape[0], H=None, Q_LEN=query.shape[-2], KV_LEN=key.shape[-2], device=query.device
+        )
+        attn_output = flex_attention(query, key, value, block_mask=block_mask, scale=scaling, enable_gqa=True)
+    else:
+        raise ValueError(
+            f"Unsupported attention implementation for prefix-LM masks: {implementation}. "
+            f"Supported implementations: {PREFIX_LM_ATTENTION_IMPLEMENTATIONS}"
+        )
+    return attn_output.transpose(1, 2).contiguous(), None
+
+
 class GemmaAttention(nn.Module):
     """Multi-headed attention from 'Attention Is All You Need' paper"""
 
@@ -309,8 +376,8 @@ class GemmaAttention(nn.Module):
                 key_states = torch.cat([past_key_value[self.layer_idx][0], key_states], dim=2)
                 value_states = torch.cat([past_key_value[self.layer_idx][1], value_states], dim=2)
 
-        attention_interface: Callable = eager_attention_forward
-        if self.config._attn_implementation != "eager":
+        attention_interface: Callable = prefix_lm_attention_forward
+        if self.config._attn_implementation not in PREFIX_LM_ATTENTION_IMPLEMENTATIONS:
             attention_interface = ALL_ATTENTION_FUNCTIONS[self.config._attn_implementation]
 
         attn_output, attn_weights = attention_interface(
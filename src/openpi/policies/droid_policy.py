@@ -22,22 +22,33 @@ def _parse_image(image) -> np.ndarray:
     image = np.asarray(image)
     if np.issubdtype(image.dtype, np.floating):
         image = (255 * image).astype(np.uint8)
-    if image.shape[0] == 3:
-        image = einops.rearrange(image, "c h w -> h w c")
+    if image.shape[-3] == 3:
+        image = einops.rearrange(image, "... c h w -> ... h w c")
     return image
 
 
 @dataclasses.dataclass(frozen=True)
-class DroidInputs(transforms.DataTransformFn):
+class DroidInputs(transforms.BatchedDataTransformFn):
     # Determines which model will be used.
     model_type: _model.ModelType
 
     def __call__(self, data: dict) -> dict:
+        return self._inputs(data, batched=False)
+
+    def batched(self, data: dict) -> dict:
+        inputs = self._inputs(data, batched=True)
+        batch_size = transforms.batch_size(data)
+        inputs["image_mask"] = {name: np.full(batch_size, mask) for name, mask in inputs["image_mask"].items()}
+        if "prompt" in inputs:
+            inputs["prompt"] = np.array([p.decode("utf-8") if isinstance(p, bytes) else p for p in inputs["prompt"]])
+        return inputs
+
+    def _inputs(self, data: dict, *, batched: bool) -> dict:
         gripper_pos = np.asarray(data["observation/gripper_position"])
-        if gripper_pos.ndim == 0:
+        if gripper_pos.ndim == int(batched):
             # Ensure gripper position is a 1D array, not a scalar, so we can concatenate with joint positions
-            gripper_pos = gripper_pos[np.newaxis]
-        state = np.concatenate([data["observation/joint_position"], gripper_pos])
+            gripper_pos = gripper_pos[..., np.newaxis]
+        state = np.concatenate([data["observation/joint_position"], gripper_pos], axis=-1)
 
         # Possibly need to parse images to uint8 (H,W,C) since LeRobot automatically
         # stores as float32 (C,H,W), gets skipped for policy inference
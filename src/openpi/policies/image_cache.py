@@ -0,0 +1,88 @@
+import collections
+from collections.abc import Callable
+import hashlib
+import time
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from openpi.shared import array_typing as at
+
+
+class ImageEmbeddingCache:
+    """Caches the image tokens of camera frames across inference calls.
+
+    Frames are identified by a hash of their pixels, so a camera whose frame did not change since an earlier call (e.g.,
+    a static camera or a missing camera that is filled with a constant image) is not embedded again. The cache only
+    covers the image tokens: the language tokens attend to the image tokens in every layer of the prefix, so the rest
+    of the prefix has to be recomputed whenever any image changes.
+    """
+
+    def __init__(self, embed_image: Callable[[at.Array], at.Array], max_size: int):
+        """Initialize the cache.
+
+        Args:
+            embed_image: Computes the tokens of a batch of images of a single camera (e.g., `Pi0.embed_image`).
+            max_size: Maximum number of frames to keep. The least recently used frames are evicted first.
+        """
+        if max_size < 1:
+            raise ValueError(f"max_size must be positive, got {max_size}")
+        self._embed_image = embed_image
+        self._max_size = max_size
+        self._entries: collections.OrderedDict[tuple[str, bytes], jax.Array] = collections.OrderedDict()
+        self.reset_stats()
+
+    def __call__(self, images: dict[str, np.ndarray], model_images: dict[str, at.Array]) -> dict[str, jax.Array]:
+        """Returns the image tokens for each camera.
+
+        Args:
+            images: The batched frames of each camera as received by the policy, used to identify the frames.
+            model_images: The same frames converted to the model's input format, used to compute missing tokens.
+        """
+        result = {}
+        for name, frames in images.items():
+            keys = [(name, _frame_hash(frame)) for frame in frames]
+            if all(key in self._entries for key in keys):
+                for key in keys:
+                    self._entries.move_to_end(key)
+                result[name] = jnp.stack([self._entries[key] for key in keys])
+                self._hits += len(keys)
+                continue
+
+            start_time = time.monotonic()
+            tokens = jax.block_until_ready(self._embed_image(model_images[name]))
+            self._embed_time += time.monotonic() - start_time
+            self._misses += len(keys)
+            for key, frame_tokens in zip(keys, tokens, strict=True):
+                self._entries[key] = frame_tokens
+                self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+            result[name] = tokens
+        return result
+
+    def reset_stats(self) -> None:
+        self._hits = 0
+        self._misses = 0
+        self._embed_time = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of frames whose tokens were found in the cache."""
+        total = self._hits + self._misses
+        return self._hits / total if total else 0.0
+
+    @property
+    def saved_time(self) -> float:
+        """Estimated embedding time saved by the cache in seconds, based on the average time per embedded frame."""
+        if not self._misses:
+            return 0.0
+        return self._hits * self._embed_time / self._misses
+
+
+def _frame_hash(frame: np.ndarray) -> bytes:
+    frame = np.ascontiguousarray(frame)
+    digest = hashlib.blake2b(memoryview(frame.reshape(-1).view(np.uint8)), digest_size=16)
+    digest.update(str((frame.shape, frame.dtype.str)).encode())
+    return digest.digest()
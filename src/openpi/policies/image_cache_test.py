@@ -0,0 +1,79 @@
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from openpi.policies import image_cache as _image_cache
+
+
+class _CountingEmbed:
+    def __init__(self):
+        self.num_calls = 0
+
+    def __call__(self, images):
+        self.num_calls += 1
+        # One token per image holding the mean pixel value.
+        return jnp.mean(images, axis=(1, 2, 3))[:, None, None]
+
+
+def _frames(*values: int) -> np.ndarray:
+    return np.stack([np.full((4, 4, 3), value, dtype=np.uint8) for value in values])
+
+
+def _model_images(frames: np.ndarray) -> jnp.ndarray:
+    return jnp.asarray(frames, dtype=jnp.float32)
+
+
+def test_cache_hit():
+    embed = _CountingEmbed()
+    cache = _image_cache.ImageEmbeddingCache(embed, max_size=8)
+
+    frames = _frames(1, 2)
+    first = cache({"cam": frames}, {"cam": _model_images(frames)})
+    second = cache({"cam": frames}, {"cam": _model_images(frames)})
+
+    assert embed.num_calls == 1
+    assert second["cam"].shape == (2, 1, 1)
+    np.testing.assert_array_equal(first["cam"], second["cam"])
+    assert cache.hit_rate == 0.5
+
+
+def test_cache_miss_recomputes_camera():
+    embed = _CountingEmbed()
+    cache = _image_cache.ImageEmbeddingCache(embed, max_size=8)
+
+    static = _frames(5)
+    cache(
+        {"static": static, "wrist": _frames(1)}, {"static": _model_images(static), "wrist": _model_images(_frames(1))}
+    )
+    result = cache(
+        {"static": static, "wrist": _frames(2)}, {"static": _model_images(static), "wrist": _model_images(_frames(2))}
+    )
+
+    # Only the wrist camera changed.
+    assert embed.num_calls == 3
+    np.testing.assert_allclose(result["wrist"], [[[2.0]]])
+    np.testing.assert_allclose(result["static"], [[[5.0]]])
+
+
+def test_cache_eviction():
+    embed = _CountingEmbed()
+    cache = _image_cache.ImageEmbeddingCache(embed, max_size=2)
+
+    for value in (1, 2, 1, 3):
+        frames = _frames(value)
+        cache({"cam": frames}, {"cam": _model_images(frames)})
+    assert embed.num_calls == 3
+
+    # Frame 2 was the least recently used and has been evicted.
+    frames = _frames(2)
+    cache({"cam": frames}, {"cam": _model_images(frames)})
+    assert embed.num_calls == 4
+
+    cache.reset_stats()
+    assert cache.hit_rate == 0.0
+    assert cache.saved_time == 0.0
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError, match="max_size"):
+        _image_cache.ImageEmbeddingCache(_CountingEmbed(), max_size=0)
@@ -1,4 +1,4 @@
-from collections.abc import Sequence
+from collections.abc import Callable, Sequence
 import logging
 import pathlib
 import time
@@ -15,11 +15,17 @@ from typing_extensions import override
 
 from openpi import transforms as _transforms
 from openpi.models import model as _model
+from openpi.models import pi0_fast as _pi0_fast
+from openpi.policies import image_cache as _image_cache
 from openpi.shared import array_typing as at
 from openpi.shared import nnx_utils
 
 BasePolicy: TypeAlias = _base_policy.BasePolicy
 
+# Batch sizes that batched inference is padded to. Using a small fixed set of sizes avoids recompiling the model for
+# every new batch size.
+DEFAULT_BATCH_BUCKETS = (1, 2, 4, 8, 16)
+
 
 class Policy(BasePolicy):
     def __init__(
@@ -33,6 +39,9 @@ class Policy(BasePolicy):
         metadata: dict[str, Any] | None = None,
         pytorch_device: str = "cpu",
         is_pytorch: bool = False,
+        batch_buckets: Sequence[int] = DEFAULT_BATCH_BUCKETS,
+        fake_obs: Callable[[int], _model.Observation] | None = None,
+        image_cache_size: int = 0,
     ):
         """Initialize the Policy.
 
@@ -46,7 +55,17 @@ class Policy(BasePolicy):
             pytorch_device: Device to use for PyTorch models (e.g., "cpu", "cuda:0").
                           Only relevant when is_pytorch=True.
             is_pytorch: Whether the model is a PyTorch model. If False, assumes JAX model.
+            batch_buckets: Batch sizes used by `infer_batch`. Batches are padded to the smallest bucket that fits them
+                and batches larger than the largest bucket are split. Batches of more than one observation of a
+                `Pi0FAST` model are decoded with a `CompactingDecoder`, which removes finished sequences from the
+                batch, so the buckets should be powers of two to avoid compiling the decoder for further sizes.
+            fake_obs: Creates fake model inputs for a given batch size (e.g., `BaseModelConfig.fake_obs`). Required
+                by `warmup`.
+            image_cache_size: If positive, the image tokens of up to this many camera frames are cached and reused
+                for identical frames in later calls. Only supported for JAX models that implement `embed_image`.
         """
+        if not batch_buckets or min(batch_buckets) < 1:
+            raise ValueError(f"Batch buckets must be positive, got {batch_buckets}")
         self._model = model
         self._input_transform = _transforms.compose(transforms)
         self._output_transform = _transforms.compose(output_transforms)
@@ -54,64 +73,195 @@ class Policy(BasePolicy):
         self._metadata = metadata or {}
         self._is_pytorch_model = is_pytorch
         self._pytorch_device = pytorch_device
+        self._batch_buckets = tuple(sorted(set(batch_buckets)))
+        self._fake_obs = fake_obs
+        self._image_cache: _image_cache.ImageEmbeddingCache | None = None
 
         if self._is_pytorch_model:
+            if image_cache_size > 0:
+                raise ValueError("The image cache is not supported for PyTorch models.")
             self._model = self._model.to(pytorch_device)
             self._model.eval()
             self._sample_actions = model.sample_actions
+            self._sample_actions_batched = self._sample_actions
         else:
             # JAX model setup
-            self._sample_actions = nnx_utils.module_jit(model.sample_actions)
+            # String kwargs (e.g., the solver) select code paths and cannot be traced.
+            static_argnames = [key for key, value in self._sample_kwargs.items() if isinstance(value, str)]
+            self._sample_actions = nnx_utils.module_jit(model.sample_actions, static_argnames=static_argnames)
+            self._sample_actions_batched = self._sample_actions
+            if isinstance(model, _pi0_fast.Pi0FAST):
+                # The sequences of a batch end after different numbers of tokens. Without compaction, the whole batch
+                # is decoded until its longest sequence is finished.
+                self._sample_actions_batched = _pi0_fast.CompactingDecoder(model).sample_actions
             self._rng = rng or jax.random.key(0)
+            if image_cache_size > 0:
+                if not hasattr(model, "embed_image"):
+                    raise ValueError(f"The image cache is not supported for {type(model).__name__}.")
+                self._image_cache = _image_cache.ImageEmbeddingCache(
+                    nnx_utils.module_jit(model.embed_image), image_cache_size
+                )
 
     @override
     def infer(self, obs: dict, *, noise: np.ndarray | None = None) -> dict:  # type: ignore[misc]
         # Make a copy since transformations may modify the inputs in place.
         inputs = jax.tree.map(lambda x: x, obs)
         inputs = self._input_transform(inputs)
+        # Make a batch of size one.
+        inputs = jax.tree.map(lambda x: np.asarray(x)[np.newaxis, ...], inputs)
+
+        if noise is not None and noise.ndim == 2:  # If noise is (action_horizon, action_dim), add batch dimension
+            noise = noise[None, ...]  # Make it (1, action_horizon, action_dim)
+
+        outputs, model_time = self._sample_batch(inputs, noise=noise)
+        outputs = jax.tree.map(lambda x: x[0, ...], outputs)
+
+        outputs = self._output_transform(outputs)
+        outputs["policy_timing"] = self._policy_timing(model_time)
+        return outputs
+
+    def infer_batch(self, obs_batch: Sequence[dict], *, noise: np.ndarray | None = None) -> list[dict]:
+        """Infer actions for several observations with a single call to the model.
+
+        The input transforms are applied to each observation separately, the results are stacked along a new batch
+        dimension and `sample_actions` is called once. The batch is padded to the smallest of the policy's batch
+        buckets so that the model is only compiled for a fixed set of batch sizes. The outputs are then split and the
+        output transforms are applied to each sample separately.
+
+        Args:
+            obs_batch: The observations to run inference on. All observations must produce model inputs with the same
+                shapes after the input transforms.
+            noise: Optional noise of shape (batch_size, action_horizon, action_dim).
+
+        Returns:
+            The outputs for each observation, in the same order as `obs_batch`.
+        """
+        batch_size = len(obs_batch)
+        if batch_size > self._batch_buckets[-1]:
+            # Split batches that don't fit into the largest bucket.
+            chunk_size = self._batch_buckets[-1]
+            return [
+                result
+                for start in range(0, batch_size, chunk_size)
+                for result in self.infer_batch(
+                    obs_batch[start : start + chunk_size],
+                    noise=None if noise is None else noise[start : start + chunk_size],
+                )
+            ]
+        if batch_size == 0:
+            return []
+
+        # Make a copy since transformations may modify the inputs in place.
+        inputs = [self._input_transform(jax.tree.map(lambda x: x, obs)) for obs in obs_batch]
+        inputs = jax.tree.map(lambda *xs: np.stack([np.asarray(x) for x in xs], axis=0), *inputs)
+
+        padded_size = next(b for b in self._batch_buckets if b >= batch_size)
+        inputs = jax.tree.map(lambda x: _pad_batch(x, padded_size), inputs)
+        if noise is not None:
+            noise = _pad_batch(noise, padded_size)
+
+        outputs, model_time = self._sample_batch(inputs, noise=noise)
+
+        results = []
+        for i in range(batch_size):
+            result = self._output_transform(jax.tree.map(lambda x: x[i, ...], outputs))  # noqa: B023
+            result["policy_timing"] = self._policy_timing(
+                model_time, batch_size=batch_size, padded_batch_size=padded_size
+            )
+            results.append(result)
+        return results
+
+    def warmup(self, batch_sizes: Sequence[int] | None = None) -> dict[int, float]:
+        """Compiles the model for each batch size by running it on fake inputs.
+
+        The first call to the model for a new input shape triggers compilation, which can take tens of seconds. Calling
+        this method once after loading moves that cost out of the first real inference calls.
+
+        Args:
+            batch_sizes: The batch sizes to compile for. Defaults to the policy's batch buckets.
+
+        Returns:
+            The time in seconds spent on the first call for each batch size, which is dominated by compilation.
+        """
+        if self._fake_obs is None:
+            raise ValueError("Warmup requires the policy to be created with `fake_obs`.")
+
+        compile_times = {}
+        for batch_size in batch_sizes or self._batch_buckets:
+            inputs = jax.tree.map(np.asarray, self._fake_obs(batch_size).to_dict())
+            # Transformed observations carry uint8 images, so the fake images are converted to match their dtype and
+            # layout. Otherwise, the model would be compiled for inputs that are never seen at inference time.
+            inputs["image"] = {k: np.zeros(v.shape, np.uint8) for k, v in inputs["image"].items()}
+
+            start_time = time.monotonic()
+            self._sample_batch(inputs)
+            compile_times[batch_size] = time.monotonic() - start_time
+            logging.info("Warmed up batch size %d in %.2f s", batch_size, compile_times[batch_size])
+        if self._image_cache is not None:
+            self._image_cache.reset_stats()
+        return compile_times
+
+    def _sample_batch(self, inputs: dict, *, noise: np.ndarray | None = None) -> tuple[dict, float]:
+        """Runs the model on already transformed and batched inputs.
+
+        Returns the batched outputs as numpy arrays together with the model time in seconds.
+        """
+        # The frames as received are used to look up cached image tokens.
+        images = {name: inputs["image"][name] for name in _model.IMAGE_KEYS if name in inputs["image"]}
         if not self._is_pytorch_model:
-            # Make a batch and convert to jax.Array.
-            inputs = jax.tree.map(lambda x: jnp.asarray(x)[np.newaxis, ...], inputs)
+            # Convert to jax.Array.
+            inputs = jax.tree.map(jnp.asarray, inputs)
             self._rng, sample_rng_or_pytorch_device = jax.random.split(self._rng)
         else:
             # Convert inputs to PyTorch tensors and move to correct device
-            inputs = jax.tree.map(lambda x: torch.from_numpy(np.array(x)).to(self._pytorch_device)[None, ...], inputs)
+            inputs = jax.tree.map(lambda x: torch.from_numpy(np.array(x)).to(self._pytorch_device), inputs)
             sample_rng_or_pytorch_device = self._pytorch_device
 
         # Prepare kwargs for sample_actions
         sample_kwargs = dict(self._sample_kwargs)
         if noise is not None:
             noise = torch.from_numpy(noise).to(self._pytorch_device) if self._is_pytorch_model else jnp.asarray(noise)
-
-            if noise.ndim == 2:  # If noise is (action_horizon, action_dim), add batch dimension
-                noise = noise[None, ...]  # Make it (1, action_horizon, action_dim)
             sample_kwargs["noise"] = noise
 
         observation = _model.Observation.from_dict(inputs)
-        print('obs:')
-        print(observation)
-        exit()
+        sample_actions = self._sample_actions_batched if observation.state.shape[0] > 1 else self._sample_actions
         start_time = time.monotonic()
+        if self._image_cache is not None:
+            sample_kwargs["image_tokens"] = self._image_cache(images, observation.images)
         outputs = {
             "state": inputs["state"],
-            "action": self._sample_actions(sample_rng_or_pytorch_device, observation, **sample_kwargs),
+            "action": sample_actions(sample_rng_or_pytorch_device, observation, **sample_kwargs),
         }
-        model_time = time.monotonic() - start_time
         if self._is_pytorch_model:
-            outputs = jax.tree.map(lambda x: np.asarray(x[0, ...].detach().cpu()), outputs)
+            outputs = jax.tree.map(lambda x: np.asarray(x.detach().cpu()), outputs)
         else:
-            outputs = jax.tree.map(lambda x: np.asarray(x[0, ...]), outputs)
+            outputs = jax.tree.map(np.asarray, outputs)
+        model_time = time.monotonic() - start_time
+        return outputs, model_time
 
-        outputs = self._output_transform(outputs)
-        outputs["policy_timing"] = {
-            "infer_ms": model_time * 1000,
-        }
-        return outputs
+    def _policy_timing(self, model_time: float, **kwargs) -> dict[str, float]:
+        timing = {"infer_ms": model_time * 1000, **kwargs}
+        if self._image_cache is not None:
+            timing["image_cache_hit_rate"] = self._image_cache.hit_rate
+            timing["image_cache_saved_ms"] = self._image_cache.saved_time * 1000
+        return timing
 
     @property
     def metadata(self) -> dict[str, Any]:
         return self._metadata
 
+    @property
+    def batch_buckets(self) -> tuple[int, ...]:
+        """The batch sizes that `infer_batch` pads to."""
+        return self._batch_buckets
+
+
+def _pad_batch(x: np.ndarray, batch_size: int) -> np.ndarray:
+    """Pads the leading batch dimension to `batch_size` by repeating the last element."""
+    if (pad := batch_size - x.shape[0]) <= 0:
+        return x
+    return np.concatenate([x, np.repeat(x[-1:], pad, axis=0)], axis=0)
+
 
 class PolicyRecorder(_base_policy.BasePolicy):
     """Records the policy's behavior to disk."""
@@ -127,7 +277,21 @@ class PolicyRecorder(_base_policy.BasePolicy):
     @override
     def infer(self, obs: dict) -> dict:  # type: ignore[misc]
         results = self._policy.infer(obs)
+        self._record(obs, results)
+        return results
 
+    def infer_batch(self, obs_batch: Sequence[dict]) -> list[dict]:
+        """Runs batched inference on the wrapped policy and records every sample as a separate step."""
+        if hasattr(self._policy, "infer_batch"):
+            results = self._policy.infer_batch(obs_batch)
+        else:
+            results = [self._policy.infer(obs) for obs in obs_batch]
+
+        for obs, result in zip(obs_batch, results, strict=True):
+            self._record(obs, result)
+        return results
+
+    def _record(self, obs: dict, results: dict) -> None:
         data = {"inputs": obs, "outputs": results}
         data = flax.traverse_util.flatten_dict(data, sep="/")
 
@@ -135,4 +299,3 @@ class PolicyRecorder(_base_policy.BasePolicy):
         self._record_step += 1
 
         np.save(output_path, np.asarray(data))
-        return results
@@ -1,12 +1,18 @@
+from collections.abc import Sequence
+import dataclasses
 import logging
 import os
 import pathlib
-from typing import Any
+from typing import Any, Literal
 
+import jax
 import jax.numpy as jnp
+import numpy as np
 
 import openpi.models.model as _model
+import openpi.models.quantization as _quantization
 import openpi.policies.policy as _policy
+import openpi.shared.compilation_cache as compilation_cache
 import openpi.shared.download as download
 from openpi.training import checkpoints as _checkpoints
 from openpi.training import config as _config
@@ -22,6 +28,10 @@ def create_trained_policy(
     default_prompt: str | None = None,
     norm_stats: dict[str, transforms.NormStats] | None = None,
     pytorch_device: str | None = None,
+    batch_buckets: Sequence[int] = _policy.DEFAULT_BATCH_BUCKETS,
+    image_cache_size: int = 0,
+    weight_quantization: _quantization.WeightQuantization | None = None,
+    pytorch_attn_implementation: Literal["eager", "sdpa", "flex_attention"] | None = "sdpa",
 ) -> _policy.Policy:
     """Create a policy from a trained checkpoint.
 
@@ -37,6 +47,13 @@ def create_trained_policy(
             from the checkpoint directory.
         pytorch_device: Device to use for PyTorch models (e.g., "cpu", "cuda", "cuda:0").
                       If None and is_pytorch=True, will use "cuda" if available, otherwise "cpu".
+        batch_buckets: The batch sizes that batched inference is padded to. See `Policy.infer_batch`.
+        image_cache_size: Number of camera frames whose image tokens are cached across calls. A value of 0
+            disables the cache. Only supported for JAX models.
+        weight_quantization: If set, overrides the weight quantization of the model config. Unquantized checkpoints
+            are quantized while they are loaded. Only supported for JAX Pi0 models.
+        pytorch_attn_implementation: If set, overrides the attention implementation of PyTorch Pi0 models (see
+            `Pi0Config.pytorch_attn_implementation`), which defaults to eager attention for training.
 
     Note:
         The function automatically detects whether the model is PyTorch-based by checking for the
@@ -49,12 +66,39 @@ def create_trained_policy(
     weight_path = os.path.join(checkpoint_dir, "model.safetensors")
     is_pytorch = os.path.exists(weight_path)
 
+    if weight_quantization is not None:
+        if is_pytorch or not hasattr(train_config.model, "weight_quantization"):
+            raise ValueError(f"Weight quantization is not supported for {type(train_config.model).__name__} models.")
+        train_config = dataclasses.replace(
+            train_config, model=dataclasses.replace(train_config.model, weight_quantization=weight_quantization)
+        )
+
+    if (
+        is_pytorch
+        and pytorch_attn_implementation is not None
+        and hasattr(train_config.model, "pytorch_attn_implementation")
+    ):
+        train_config = dataclasses.replace(
+            train_config,
+            model=dataclasses.replace(train_config.model, pytorch_attn_implementation=pytorch_attn_implementation),
+        )
+
     logging.info("Loading model...")
     if is_pytorch:
         model = train_config.model.load_pytorch(train_config, weight_path)
         model.paligemma_with_expert.to_bfloat16_for_selected_params("bfloat16")
     else:
-        model = train_config.model.load(_model.restore_params(checkpoint_dir / "params", dtype=jnp.bfloat16))
+        # Reuse the compiled sampling functions of previous processes that served the same model.
+        compilation_cache.initialize(
+            compilation_cache.cache_key(train_config.model, dtype=jnp.bfloat16, sample_kwargs=sample_kwargs)
+        )
+        if getattr(train_config.model, "weight_quantization", None) is None:
+            params = _model.restore_params(checkpoint_dir / "params", dtype=jnp.bfloat16)
+        else:
+            # Quantize on the host, so that the unquantized params are never on the device.
+            params = _model.restore_params(checkpoint_dir / "params", restore_type=np.ndarray, dtype=jnp.bfloat16)
+            params = jax.tree.map(jnp.asarray, _quantization.quantize_params(params))
+        model = train_config.model.load(params)
     data_config = train_config.data.create(train_config.assets_dirs, train_config.model)
     if norm_stats is None:
         # We are loading the norm stats from the checkpoint instead of the config assets dir to make sure
@@ -91,4 +135,7 @@ def create_trained_policy(
         metadata=train_config.policy_metadata,
         is_pytorch=is_pytorch,
         pytorch_device=pytorch_device if is_pytorch else None,
+        batch_buckets=batch_buckets,
+        fake_obs=train_config.model.fake_obs,
+        image_cache_size=image_cache_size,
     )
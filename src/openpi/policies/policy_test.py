@@ -1,11 +1,192 @@
+import dataclasses
+
+from flax import nnx
+import jax
+import jax.numpy as jnp
+import numpy as np
 from openpi_client import action_chunk_broker
 import pytest
+import torch
 
+from openpi.models import model as _model
+from openpi.models import pi0_fast
 from openpi.policies import aloha_policy
+from openpi.policies import policy as _policy
 from openpi.policies import policy_config as _policy_config
 from openpi.training import config as _config
 
 
+class _StateModel(nnx.Module):
+    """Returns the state repeated along the action horizon. Records the batch size whenever it is traced."""
+
+    def __init__(self, action_horizon: int = 5):
+        self.action_horizon = action_horizon
+        # The jitted function runs on a copy of the module, so traces are recorded through a shared static callable.
+        self.traced_batch_sizes = []
+        self._on_trace = self.traced_batch_sizes.append
+
+    def sample_actions(self, rng, observation: _model.Observation, **kwargs) -> _model.Actions:
+        self._on_trace(observation.state.shape[0])
+        return jnp.repeat(observation.state[:, None, :], self.action_horizon, axis=1)
+
+
+class _TorchStateModel(torch.nn.Module):
+    def __init__(self, action_horizon: int = 5):
+        super().__init__()
+        self.action_horizon = action_horizon
+        self.batch_sizes = []
+
+    def sample_actions(self, device, observation: _model.Observation, **kwargs) -> torch.Tensor:
+        self.batch_sizes.append(observation.state.shape[0])
+        return observation.state[:, None, :].repeat(1, self.action_horizon, 1)
+
+
+class _ImageModel(nnx.Module):
+    """Adds the mean pixel value of the base image to the state. Records the batch size of every embedded batch."""
+
+    def __init__(self, action_horizon: int = 5):
+        self.action_horizon = action_horizon
+        self.embedded_batch_sizes = []
+        self._on_embed = self.embedded_batch_sizes.append
+
+    def embed_image(self, image):
+        self._on_embed(image.shape[0])
+        return jnp.mean(image, axis=(1, 2, 3))[:, None, None]
+
+    def sample_actions(self, rng, observation: _model.Observation, *, image_tokens=None, **kwargs) -> _model.Actions:
+        if image_tokens is None:
+            image_tokens = {"base_0_rgb": self.embed_image(observation.images["base_0_rgb"])}
+        state = observation.state + image_tokens["base_0_rgb"][:, 0]
+        return jnp.repeat(state[:, None, :], self.action_horizon, axis=1)
+
+
+def _make_example(value: float) -> dict:
+    return {
+        "image": {"base_0_rgb": np.zeros((8, 8, 3), dtype=np.float32)},
+        "image_mask": {"base_0_rgb": np.True_},
+        "state": np.full((4,), value, dtype=np.float32),
+    }
+
+
+def test_infer_batch():
+    model = _StateModel()
+    policy = _policy.Policy(model, batch_buckets=(1, 4))
+
+    results = policy.infer_batch([_make_example(i) for i in range(3)])
+    assert len(results) == 3
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result["action"], np.full((5, 4), i))
+        assert result["policy_timing"]["batch_size"] == 3
+        assert result["policy_timing"]["padded_batch_size"] == 4
+
+    # Batches within the same bucket and single inference calls do not trigger additional compilations.
+    policy.infer_batch([_make_example(i) for i in range(2)])
+    policy.infer(_make_example(0))
+    policy.infer(_make_example(1))
+    # One compilation each for the batch size 4 and 1 buckets.
+    assert model.traced_batch_sizes == [4, 1]
+
+
+def test_infer_batch_split():
+    policy = _policy.Policy(_StateModel(), batch_buckets=(2,))
+
+    results = policy.infer_batch([_make_example(i) for i in range(5)])
+    assert [float(r["action"][0, 0]) for r in results] == [0, 1, 2, 3, 4]
+    assert [r["policy_timing"]["batch_size"] for r in results] == [2, 2, 2, 2, 1]
+
+
+def test_infer_batch_pytorch():
+    model = _TorchStateModel()
+    policy = _policy.Policy(model, is_pytorch=True, batch_buckets=(1, 4))
+
+    results = policy.infer_batch([_make_example(i) for i in range(3)])
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result["action"], np.full((5, 4), i))
+    assert model.batch_sizes == [4]
+
+
+def test_infer_batch_pi0_fast(monkeypatch):
+    decoded_batch_sizes = []
+    sample_actions = pi0_fast.CompactingDecoder.sample_actions
+
+    def record_sample_actions(self, rng, observation, **kwargs):
+        decoded_batch_sizes.append(observation.state.shape[0])
+        return sample_actions(self, rng, observation, **kwargs)
+
+    monkeypatch.setattr(pi0_fast.CompactingDecoder, "sample_actions", record_sample_actions)
+
+    key = jax.random.key(0)
+    config = pi0_fast.Pi0FASTConfig(paligemma_variant="dummy", dtype="float32", max_token_len=32)
+    model = config.create(key)
+    obs = config.fake_obs(3)
+    obs = dataclasses.replace(
+        obs,
+        tokenized_prompt=jax.random.randint(key, obs.tokenized_prompt.shape, 2, 200),
+        tokenized_prompt_mask=jnp.ones_like(obs.tokenized_prompt_mask),
+    )
+    examples = [jax.tree.map(lambda x, i=i: np.asarray(x[i]), obs.to_dict()) for i in range(3)]
+    policy = _policy.Policy(model, batch_buckets=(1, 4))
+
+    # Batches are decoded with a `CompactingDecoder`, which decodes the same tokens as single inference calls.
+    results = policy.infer_batch(examples)
+    assert decoded_batch_sizes == [4]
+    for example, result in zip(examples, results, strict=True):
+        np.testing.assert_array_equal(result["action"], policy.infer(example)["action"])
+    assert decoded_batch_sizes == [4]
+
+
+def test_warmup():
+    model = _StateModel()
+    fake_obs = _model.Observation.from_dict(jax.tree.map(lambda x: x[None], _make_example(0)))
+
+    def make_fake_obs(batch_size: int) -> _model.Observation:
+        return jax.tree.map(lambda x: np.repeat(x, batch_size, axis=0), fake_obs)
+
+    policy = _policy.Policy(model, batch_buckets=(1, 2, 4), fake_obs=make_fake_obs)
+    assert set(policy.warmup()) == {1, 2, 4}
+    assert model.traced_batch_sizes == [1, 2, 4]
+
+    # Inference does not trigger any further compilation.
+    policy.infer(_make_example(1))
+    policy.infer_batch([_make_example(i) for i in range(3)])
+    assert model.traced_batch_sizes == [1, 2, 4]
+
+
+def test_warmup_requires_fake_obs():
+    with pytest.raises(ValueError, match="fake_obs"):
+        _policy.Policy(_StateModel()).warmup()
+
+
+def test_image_cache():
+    model = _ImageModel()
+    policy = _policy.Policy(model, image_cache_size=4)
+    reference = _policy.Policy(_ImageModel())
+
+    example = _make_example(1.0)
+    example["image"]["base_0_rgb"] = np.full((8, 8, 3), 0.5, dtype=np.float32)
+    first = policy.infer(example)
+    second = policy.infer(example)
+
+    np.testing.assert_allclose(first["action"], np.full((5, 4), 1.5))
+    np.testing.assert_allclose(second["action"], reference.infer(example)["action"])
+    # The embedding is traced once and the second call is served from the cache.
+    assert len(model.embedded_batch_sizes) == 1
+    assert second["policy_timing"]["image_cache_hit_rate"] == 0.5
+
+
+def test_image_cache_unsupported():
+    with pytest.raises(ValueError, match="image cache"):
+        _policy.Policy(_StateModel(), image_cache_size=4)
+    with pytest.raises(ValueError, match="image cache"):
+        _policy.Policy(_TorchStateModel(), is_pytorch=True, pytorch_device="cpu", image_cache_size=4)
+
+
+def test_infer_matches_infer_batch():
+    policy = _policy.Policy(_StateModel())
+    example = _make_example(2.0)
+    np.testing.assert_array_equal(policy.infer(example)["action"], policy.infer_batch([example])[0]["action"])
+
+
 @pytest.mark.manual
 def test_infer():
     config = _config.get_config("pi0_aloha_sim")
@@ -1,11 +1,16 @@
 import asyncio
+from collections.abc import Awaitable, Callable
+import concurrent.futures
+import contextlib
 import http
 import logging
 import time
 import traceback
 
 from openpi_client import base_policy as _base_policy
+from openpi_client import image_codec as _image_codec
 from openpi_client import msgpack_numpy
+from openpi_client import websocket_client_policy as _websocket_client_policy
 import websockets.asyncio.server as _server
 import websockets.frames
 
@@ -16,6 +21,25 @@ class WebsocketPolicyServer:
     """Serves a policy using the websocket protocol. See websocket_client_policy.py for a client implementation.
 
     Currently only implements the `load` and `infer` methods.
+
+    Inference runs on a dedicated thread so that the event loop keeps serving other connections, health checks and
+    keepalive pings while the model is busy. At most `max_pending_requests` requests may be waiting for or running
+    inference at any time; additional requests wait before being queued. Each connection buffers at most
+    `max_queued_messages` incoming messages, so a client that sends faster than it is served is throttled by TCP
+    instead of growing the server's memory.
+
+    If `max_batch_size` is larger than one, observations that arrive concurrently on different connections are
+    collected for up to `max_batch_wait_ms` and passed to the policy's `infer_batch` method as a single batch.
+
+    Clients that tag their requests with a request ID may send several requests over a connection without waiting for
+    the responses. Up to `max_in_flight_requests` of them are processed concurrently (and may be batched together), and
+    each response carries the ID of its request. Requests without an ID are answered strictly in order.
+
+    Clients may send compressed images. The supported formats are announced in the metadata that is sent when a
+    connection is opened, and images are decoded in a worker thread before they are passed to the policy.
+
+    If `warmup` is provided, it is run on the inference thread before any request is served (e.g., to compile the
+    model). Until it has finished, the `/healthz` endpoint reports the server as unavailable.
     """
 
     def __init__(
@@ -24,67 +48,281 @@ class WebsocketPolicyServer:
         host: str = "0.0.0.0",
         port: int | None = None,
         metadata: dict | None = None,
+        *,
+        max_batch_size: int = 1,
+        max_batch_wait_ms: float = 5.0,
+        max_pending_requests: int = 64,
+        max_queued_messages: int = 2,
+        max_in_flight_requests: int = 4,
+        warmup: Callable[[], object] | None = None,
     ) -> None:
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}")
+        if max_pending_requests < max_batch_size:
+            raise ValueError(
+                f"max_pending_requests ({max_pending_requests}) must be at least max_batch_size ({max_batch_size})"
+            )
+        if max_in_flight_requests < 1:
+            raise ValueError(f"max_in_flight_requests must be positive, got {max_in_flight_requests}")
         self._policy = policy
         self._host = host
         self._port = port
         self._metadata = metadata or {}
+        self._max_batch_size = max_batch_size
+        self._max_batch_wait_ms = max_batch_wait_ms
+        self._max_pending_requests = max_pending_requests
+        self._max_queued_messages = max_queued_messages
+        self._max_in_flight_requests = max_in_flight_requests
+        self._warmup = warmup
+        self._ready = warmup is None
+        self._batcher: _RequestBatcher | None = None
+        self._inference_executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._pending_requests: asyncio.Semaphore | None = None
         logging.getLogger("websockets.server").setLevel(logging.INFO)
 
     def serve_forever(self) -> None:
         asyncio.run(self.run())
 
     async def run(self):
-        async with _server.serve(
-            self._handler,
-            self._host,
-            self._port,
-            compression=None,
-            max_size=None,
-            process_request=_health_check,
-        ) as server:
-            await server.serve_forever()
+        # A single thread makes sure that inference calls never run concurrently on the model.
+        self._inference_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="policy-inference"
+        )
+        self._pending_requests = asyncio.Semaphore(self._max_pending_requests)
+
+        batcher_task = None
+        if self._max_batch_size > 1:
+            self._batcher = _RequestBatcher(self._run_inference, self._max_batch_size, self._max_batch_wait_ms)
+            batcher_task = asyncio.create_task(self._batcher.run())
+
+        warmup_task = None
+        if self._warmup is not None:
+            # Runs on the inference thread, so requests that arrive in the meantime wait until the warmup is done.
+            warmup_task = asyncio.create_task(self._run_warmup())
+
+        try:
+            async with _server.serve(
+                self._handler,
+                self._host,
+                self._port,
+                compression=None,
+                max_size=None,
+                max_queue=self._max_queued_messages,
+                process_request=self._health_check,
+            ) as server:
+                await server.serve_forever()
+        finally:
+            if batcher_task is not None:
+                batcher_task.cancel()
+            if warmup_task is not None:
+                warmup_task.cancel()
+            self._inference_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_warmup(self) -> None:
+        assert self._warmup is not None
+        logger.info("Warming up the policy...")
+        start_time = time.monotonic()
+        await asyncio.get_running_loop().run_in_executor(self._inference_executor, self._warmup)
+        logger.info(f"Warmup finished in {time.monotonic() - start_time:.1f}s")
+        self._ready = True
+
+    def _health_check(self, connection: _server.ServerConnection, request: _server.Request) -> _server.Response | None:
+        if request.path == "/healthz":
+            if not self._ready:
+                return connection.respond(http.HTTPStatus.SERVICE_UNAVAILABLE, "Warming up\n")
+            return connection.respond(http.HTTPStatus.OK, "OK\n")
+        # Continue with the normal request handling.
+        return None
+
+    async def _infer(self, obs: dict) -> dict:
+        assert self._pending_requests is not None
+        async with self._pending_requests:
+            if self._batcher is not None:
+                return await self._batcher.submit(obs)
+            (result,) = await self._run_inference([obs])
+            return result
+
+    async def _run_inference(self, obs_batch: list[dict]) -> list[dict]:
+        """Runs inference on the dedicated inference thread without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._inference_executor, _infer_batch, self._policy, obs_batch)
 
     async def _handler(self, websocket: _server.ServerConnection):
         logger.info(f"Connection from {websocket.remote_address} opened")
-        packer = msgpack_numpy.Packer()
-
-        await websocket.send(packer.pack(self._metadata))
+        # The packer's buffer is reused for every response to avoid allocating a new buffer per request. It is shared by
+        # all requests of the connection, so responses are sent one at a time.
+        packer = msgpack_numpy.Packer(autoreset=False)
+        send_lock = asyncio.Lock()
+        in_flight_requests = asyncio.Semaphore(self._max_in_flight_requests)
+        tasks: set[asyncio.Task] = set()
+        # Each response reports the total time of the previous request on the connection as "prev_total_ms", since
+        # its own total time includes sending it. Pipelined requests overlap, so the previous request may still be in
+        # flight, in which case the time is not reported. Total times are kept by the index of the request until the
+        # next request reads them, and the indices of requests whose time will not be read are kept in `unreported`.
+        total_times: dict[int, float] = {}
+        unreported: set[int] = set()
+        num_requests = 0
 
-        prev_total_time = None
-        while True:
+        async def handle_request(obs: dict, decode_time: float, start_time: float, index: int) -> None:
             try:
-                start_time = time.monotonic()
-                obs = msgpack_numpy.unpackb(await websocket.recv())
+                request_id = obs.pop(_websocket_client_policy.REQUEST_ID_KEY, None)
 
                 infer_time = time.monotonic()
-                action = self._policy.infer(obs)
+                action = await self._infer(obs)
                 infer_time = time.monotonic() - infer_time
 
                 action["server_timing"] = {
                     "infer_ms": infer_time * 1000,
+                    "decode_ms": decode_time * 1000,
                 }
-                if prev_total_time is not None:
-                    # We can only record the last total time since we also want to include the send time.
+                if (prev_total_time := total_times.pop(index - 1, None)) is not None:
                     action["server_timing"]["prev_total_ms"] = prev_total_time * 1000
+                elif index > 0:
+                    unreported.add(index - 1)
+                if request_id is not None:
+                    action[_websocket_client_policy.REQUEST_ID_KEY] = request_id
 
-                await websocket.send(packer.pack(action))
-                prev_total_time = time.monotonic() - start_time
+                async with send_lock:
+                    try:
+                        await asyncio.to_thread(packer.pack, action)
+                        with packer.getbuffer() as buffer:
+                            await websocket.send(buffer)
+                    finally:
+                        packer.reset()
+            finally:
+                if index in unreported:
+                    unreported.remove(index)
+                else:
+                    total_times[index] = time.monotonic() - start_time
 
+        async def handle_pipelined_request(obs: dict, decode_time: float, start_time: float, index: int) -> None:
+            try:
+                await handle_request(obs, decode_time, start_time, index)
             except websockets.ConnectionClosed:
-                logger.info(f"Connection from {websocket.remote_address} closed")
-                break
+                pass
             except Exception:
-                await websocket.send(traceback.format_exc())
-                await websocket.close(
-                    code=websockets.frames.CloseCode.INTERNAL_ERROR,
-                    reason="Internal server error. Traceback included in previous frame.",
-                )
-                raise
-
-
-def _health_check(connection: _server.ServerConnection, request: _server.Request) -> _server.Response | None:
-    if request.path == "/healthz":
-        return connection.respond(http.HTTPStatus.OK, "OK\n")
-    # Continue with the normal request handling.
-    return None
+                logger.exception("Error while handling request")
+                with contextlib.suppress(websockets.ConnectionClosed):
+                    await _send_error(websocket)
+            finally:
+                in_flight_requests.release()
+
+        await websocket.send(
+            msgpack_numpy.packb(
+                {
+                    **self._metadata,
+                    _image_codec.METADATA_KEY: list(_image_codec.FORMATS),
+                    _websocket_client_policy.MAX_IN_FLIGHT_REQUESTS_KEY: self._max_in_flight_requests,
+                }
+            )
+        )
+
+        try:
+            while True:
+                # Stop reading requests while too many are in flight, so that the client is throttled.
+                await in_flight_requests.acquire()
+                start_time = time.monotonic()
+                # (De)serializing large observations takes long enough to stall other connections, so it runs in a
+                # worker thread.
+                obs, decode_time = await asyncio.to_thread(_unpack_observation, await websocket.recv())
+                index = num_requests
+                num_requests += 1
+
+                if _websocket_client_policy.REQUEST_ID_KEY in obs:
+                    task = asyncio.create_task(handle_pipelined_request(obs, decode_time, start_time, index))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                else:
+                    try:
+                        await handle_request(obs, decode_time, start_time, index)
+                    finally:
+                        in_flight_requests.release()
+
+        except websockets.ConnectionClosed:
+            logger.info(f"Connection from {websocket.remote_address} closed")
+        except Exception:
+            await _send_error(websocket)
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class _RequestBatcher:
+    """Collects observations from concurrent connections and runs them through the policy as a single batch.
+
+    A batch is started by the first pending observation and is closed once it holds `max_batch_size` observations or
+    `max_batch_wait_ms` have passed since it was started, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        run_inference: Callable[[list[dict]], Awaitable[list[dict]]],
+        max_batch_size: int,
+        max_batch_wait_ms: float,
+    ) -> None:
+        self._run_inference = run_inference
+        self._max_batch_size = max_batch_size
+        self._max_batch_wait = max_batch_wait_ms / 1000
+        self._queue: asyncio.Queue[tuple[dict, asyncio.Future]] = asyncio.Queue()
+
+    async def submit(self, obs: dict) -> dict:
+        """Queues a single observation and waits for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((obs, future))
+        return await future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_batch_wait
+            while len(batch) < self._max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+
+            obs_batch = [obs for obs, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = await self._run_inference(obs_batch)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results, strict=True):
+                # The connection may have been closed while waiting for the batch.
+                if not future.done():
+                    future.set_result(result)
+
+
+async def _send_error(websocket: _server.ServerConnection) -> None:
+    await websocket.send(traceback.format_exc())
+    await websocket.close(
+        code=websockets.frames.CloseCode.INTERNAL_ERROR,
+        reason="Internal server error. Traceback included in previous frame.",
+    )
+
+
+def _unpack_observation(data: bytes) -> tuple[dict, float]:
+    """Unpacks an observation and decodes its compressed images. Returns the observation and the decode time."""
+    obs = msgpack_numpy.unpackb(data)
+    start_time = time.monotonic()
+    obs = _image_codec.decode_images(obs)
+    return obs, time.monotonic() - start_time
+
+
+def _infer_batch(policy: _base_policy.BasePolicy, obs_batch: list[dict]) -> list[dict]:
+    # Wrapped policies (e.g., when recording) may not implement batched inference.
+    if len(obs_batch) > 1 and hasattr(policy, "infer_batch"):
+        return policy.infer_batch(obs_batch)
+    return [policy.infer(obs) for obs in obs_batch]
@@ -0,0 +1,229 @@
+import asyncio
+import concurrent.futures
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+from openpi_client import base_policy as _base_policy
+from openpi_client import image_codec as _image_codec
+from openpi_client import websocket_client_policy as _websocket_client_policy
+import pytest
+
+from openpi.serving import websocket_policy_server as _server
+
+
+class _EchoPolicy(_base_policy.BasePolicy):
+    """Returns the observation state as the action and records the batch sizes it was called with."""
+
+    def __init__(self, infer_delay: float = 0.0) -> None:
+        self.batch_sizes: list[int] = []
+        self._infer_delay = infer_delay
+
+    def infer(self, obs: dict) -> dict:
+        return self.infer_batch([obs])[0]
+
+    def infer_batch(self, obs_batch: list[dict]) -> list[dict]:
+        self.batch_sizes.append(len(obs_batch))
+        time.sleep(self._infer_delay)
+        return [{"actions": np.asarray(obs["state"]) * 2} for obs in obs_batch]
+
+
+class _RecordingPolicy(_base_policy.BasePolicy):
+    """Records the observations it receives."""
+
+    def __init__(self) -> None:
+        self.observations: list[dict] = []
+
+    def infer(self, obs: dict) -> dict:
+        self.observations.append(obs)
+        return {"actions": np.zeros((4,))}
+
+
+class _FailingPolicy(_base_policy.BasePolicy):
+    def infer(self, obs: dict) -> dict:
+        raise ValueError("Policy failed")
+
+
+def _get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(server: _server.WebsocketPolicyServer, port: int) -> None:
+    threading.Thread(target=lambda: asyncio.run(server.run()), daemon=True).start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.01)
+    raise TimeoutError("Server did not start.")
+
+
+def test_unbatched():
+    port = _get_free_port()
+    policy = _EchoPolicy()
+    _start_server(_server.WebsocketPolicyServer(policy, host="127.0.0.1", port=port), port)
+
+    client = _websocket_client_policy.WebsocketClientPolicy(host="127.0.0.1", port=port)
+    for i in range(3):
+        result = client.infer({"state": np.full((4,), i, dtype=np.float32)})
+        np.testing.assert_array_equal(result["actions"], np.full((4,), 2 * i))
+
+    assert policy.batch_sizes == [1, 1, 1]
+
+
+@pytest.mark.parametrize("num_clients", [1, 4])
+def test_batched(num_clients: int):
+    port = _get_free_port()
+    policy = _EchoPolicy(infer_delay=0.05)
+    server = _server.WebsocketPolicyServer(
+        policy, host="127.0.0.1", port=port, max_batch_size=num_clients, max_batch_wait_ms=1000
+    )
+    _start_server(server, port)
+
+    clients = [_websocket_client_policy.WebsocketClientPolicy(host="127.0.0.1", port=port) for _ in range(num_clients)]
+
+    def run_client(i: int) -> np.ndarray:
+        return clients[i].infer({"state": np.full((4,), i, dtype=np.float32)})["actions"]
+
+    with concurrent.futures.ThreadPoolExecutor(num_clients) as executor:
+        results = list(executor.map(run_client, range(num_clients)))
+
+    # Every client receives the result for its own observation.
+    for i, actions in enumerate(results):
+        np.testing.assert_array_equal(actions, np.full((4,), 2 * i))
+    assert policy.batch_sizes == [num_clients]
+
+
+def test_batch_wait_timeout():
+    port = _get_free_port()
+    policy = _EchoPolicy()
+    server = _server.WebsocketPolicyServer(policy, host="127.0.0.1", port=port, max_batch_size=8, max_batch_wait_ms=10)
+    _start_server(server, port)
+
+    # A single client must not wait for the batch to fill up.
+    client = _websocket_client_policy.WebsocketClientPolicy(host="127.0.0.1", port=port)
+    start = time.monotonic()
+    client.infer({"state": np.zeros((4,), dtype=np.float32)})
+    assert time.monotonic() - start < 1.0
+    assert policy.batch_sizes == [1]
+
+
+def test_health_check_during_inference():
+    port = _get_free_port()
+    policy = _EchoPolicy(infer_delay=1.0)
+    _start_server(_server.WebsocketPolicyServer(policy, host="127.0.0.1", port=port), port)
+
+    client = _websocket_client_policy.WebsocketClientPolicy(host="127.0.0.1", port=port)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        future = executor.submit(client.infer, {"state": np.zeros((4,), dtype=np.float32)})
+        # Wait until the inference has started.
+        while not policy.batch_sizes:
+            time.sleep(0.01)
+
+        # The event loop must keep answering while the policy is busy.
+        start = time.monotonic()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=5) as response:
+            assert response.status == 200
+        assert time.monotonic() - start < 0.5
+        assert not future.done()
+
+        future.result()
+
+
+def test_health_check_during_warmup():
+    port = _get_free_port()
+    policy = _EchoPolicy()
+    warmup_started = threading.Event()
+    warmup_done = threading.Event()
+
+    def warmup():
+        warmup_started.set()
+        warmup_done.wait()
+
+    _start_server(_server.WebsocketPolicyServer(policy, host="127.0.0.1", port=port, warmup=warmup), port)
+    warmup_started.wait()
+
+    with pytest.raises(urllib.error.HTTPError) as exc_info:
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=5)
+    assert exc_info.value.code == 503
+
+    # Requests that arrive during the warmup are served once it has finished.
+    client = _websocket_client_policy.WebsocketClientPolicy(host="127.0.0.1", port=port)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        future = executor.submit(client.infer, {"state": np.zeros((4,), dtype=np.float32)})
+        time.sleep(0.1)
+        assert not future.done()
+
+        warmup_done.set()
+        future.result(timeout=5)
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=5) as response:
+        assert response.status == 200
+
+
+def test_image_codecs():
+    port = _get_free_port()
+    policy = _RecordingPolicy()
+    _start_server(_server.WebsocketPolicyServer(policy, host="127.0.0.1", port=port), port)
+
+    client = _websocket_client_policy.WebsocketClientPolicy(
+        host="127.0.0.1",
+        port=port,
+        image_codecs={"images/cam_high": _image_codec.ImageCodec("png")},
+    )
+    assert set(client.get_server_metadata()[_image_codec.METADATA_KEY]) == set(_image_codec.FORMATS)
+
+    images = {
+        "cam_high": np.random.randint(256, size=(48, 64, 3), dtype=np.uint8),
+        "cam_low": np.random.randint(256, size=(48, 64, 3), dtype=np.uint8),
+    }
+    result = client.infer({"images": images, "state": np.zeros((4,), dtype=np.float32)})
+
+    # The policy receives the decoded images.
+    (obs,) = policy.observations
+    np.testing.assert_array_equal(obs["images"]["cam_high"], images["cam_high"])
+    np.testing.assert_array_equal(obs["images"]["cam_low"], images["cam_low"])
+    assert "decode_ms" in result["server_timing"]
+    assert "encode_ms" in result["client_timing"]
+
+
+def test_pipelined_requests():
+    port = _get_free_port()
+    policy = _EchoPolicy(infer_delay=0.05)
+    server = _server.WebsocketPolicyServer(
+        policy, host="127.0.0.1", port=port, max_batch_size=4, max_batch_wait_ms=1000, max_in_flight_requests=4
+    )
+    _start_server(server, port)
+
+    # A single connection can have several requests in flight, which are batched together.
+    client = _websocket_client_policy.WebsocketClientPolicy(host="127.0.0.1", port=port)
+    futures = [client.infer_async({"state": np.full((4,), i, dtype=np.float32)}) for i in range(4)]
+    for i, future in enumerate(futures):
+        result = future.result(timeout=5)
+        np.testing.assert_array_equal(result["actions"], np.full((4,), 2 * i))
+        assert _websocket_client_policy.REQUEST_ID_KEY not in result
+        # The previous requests were still in flight when the responses were created.
+        assert "prev_total_ms" not in result["server_timing"]
+    assert policy.batch_sizes == [4]
+
+    # Blocking calls still work on the same connection, and report the total time of the last pipelined request.
+    result = client.infer({"state": np.ones((4,), dtype=np.float32)})
+    np.testing.assert_array_equal(result["actions"], np.full((4,), 2))
+    assert result["server_timing"]["prev_total_ms"] > 0
+
+
+def test_pipelined_request_error():
+    port = _get_free_port()
+    _start_server(_server.WebsocketPolicyServer(_FailingPolicy(), host="127.0.0.1", port=port), port)
+
+    client = _websocket_client_policy.WebsocketClientPolicy(host="127.0.0.1", port=port)
+    future = client.infer_async({"state": np.zeros((4,), dtype=np.float32)})
+    with pytest.raises(RuntimeError, match="Policy failed"):
+        future.result(timeout=5)
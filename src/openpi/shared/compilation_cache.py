@@ -0,0 +1,69 @@
+"""Shared configuration of JAX's persistent compilation cache.
+
+Compiling the sampling functions of large models takes tens of seconds. With the persistent cache enabled, compiled
+executables are written to disk and reused by later processes, so restarted training jobs and policy servers start
+warm. All entry points should call `initialize` before running any JAX computation.
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+from typing import Any
+
+import jax
+from jax.experimental.compilation_cache import compilation_cache as _jax_compilation_cache
+import numpy as np
+
+# Environment variable to control the cache directory, ~/.cache/jax will be used by default.
+_OPENPI_COMPILATION_CACHE_DIR = "OPENPI_COMPILATION_CACHE_DIR"
+DEFAULT_CACHE_DIR = "~/.cache/jax"
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir(key: str | None = None) -> pathlib.Path:
+    """Returns the cache directory, optionally namespaced by a key created with `cache_key`."""
+    cache_dir = pathlib.Path(os.getenv(_OPENPI_COMPILATION_CACHE_DIR, DEFAULT_CACHE_DIR)).expanduser().resolve()
+    if key is not None:
+        cache_dir = cache_dir / key
+    return cache_dir
+
+
+def cache_key(model_config: Any, *, dtype: Any, sample_kwargs: dict[str, Any] | None = None) -> str:
+    """Creates a cache key for the compiled sampling functions of a model.
+
+    XLA already includes the full computation in the key of each cache entry. This key groups the entries that belong
+    to one model in their own directory, so that the cache for a checkpoint can be pre-populated, shipped and cleaned
+    up independently of other models.
+
+    Args:
+        model_config: The model config. Its repr must cover all fields that affect the model's computation, which is
+            the case for the dataclass based configs.
+        dtype: The dtype of the model parameters.
+        sample_kwargs: The kwargs passed to `sample_actions`.
+    """
+    sample_kwargs = sample_kwargs or {}
+    components = [
+        repr(model_config),
+        str(np.dtype(dtype)),
+        repr(sorted(sample_kwargs.items())),
+        jax.__version__,
+    ]
+    digest = hashlib.sha256("\n".join(components).encode()).hexdigest()[:16]
+    return f"{type(model_config).__name__.lower()}-{digest}"
+
+
+def initialize(key: str | None = None) -> pathlib.Path:
+    """Enables the persistent compilation cache and returns its directory.
+
+    Args:
+        key: Optional key created with `cache_key`. If provided, the cache is stored in a subdirectory for that key.
+    """
+    cache_dir = get_cache_dir(key)
+    if jax.config.jax_compilation_cache_dir != str(cache_dir):
+        _jax_compilation_cache.set_cache_dir(str(cache_dir))
+        # JAX only reads the cache directory once, so it must be reset to pick up a new directory.
+        _jax_compilation_cache.reset_cache()
+    logger.info(f"Using JAX compilation cache at {cache_dir}")
+    return cache_dir
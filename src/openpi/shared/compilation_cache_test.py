@@ -0,0 +1,47 @@
+import pathlib
+
+import jax
+from jax.experimental.compilation_cache import compilation_cache as jax_compilation_cache
+import jax.numpy as jnp
+import pytest
+
+from openpi.models import pi0_config
+import openpi.shared.compilation_cache as compilation_cache
+
+
+@pytest.fixture(autouse=True)
+def set_cache_dir(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("OPENPI_COMPILATION_CACHE_DIR", str(tmp_path))
+    prev_cache_dir = jax.config.jax_compilation_cache_dir
+    yield
+    jax.config.update("jax_compilation_cache_dir", prev_cache_dir)
+    jax_compilation_cache.reset_cache()
+
+
+def test_cache_key():
+    config = pi0_config.Pi0Config()
+    key = compilation_cache.cache_key(config, dtype=jnp.bfloat16, sample_kwargs={"num_steps": 10})
+
+    assert key.startswith("pi0config-")
+    assert key == compilation_cache.cache_key(
+        pi0_config.Pi0Config(), dtype=jnp.bfloat16, sample_kwargs={"num_steps": 10}
+    )
+    assert key != compilation_cache.cache_key(config, dtype=jnp.float32, sample_kwargs={"num_steps": 10})
+    assert key != compilation_cache.cache_key(config, dtype=jnp.bfloat16, sample_kwargs={"num_steps": 5})
+    assert key != compilation_cache.cache_key(
+        pi0_config.Pi0Config(action_horizon=10), dtype=jnp.bfloat16, sample_kwargs={"num_steps": 10}
+    )
+
+
+def test_initialize(tmp_path: pathlib.Path):
+    cache_dir = compilation_cache.initialize("test-key")
+    assert cache_dir == tmp_path / "test-key"
+    assert jax.config.jax_compilation_cache_dir == str(cache_dir)
+
+    prev_min_compile_time = jax.config.jax_persistent_cache_min_compile_time_secs
+    jax.config.update("jax_persistent_cache_min_compile_time_secs", 0)
+    try:
+        jax.jit(lambda x: x * 3 + 1)(jnp.ones(7))
+    finally:
+        jax.config.update("jax_persistent_cache_min_compile_time_secs", prev_min_compile_time)
+    assert any(cache_dir.iterdir())
@@ -90,6 +90,20 @@ class DataConfig:
     # If true, will use the LeRobot dataset task to define the prompt.
     prompt_from_task: bool = False
 
+    # Number of decoded video segments (the frames from one keyframe to the next) that each data loader worker caches.
+    # Zero disables the cache. Only used for LeRobot video datasets, see `LeRobotDatasetWithFrameCache`.
+    video_cache_segments: int = 0
+    # If set, the frames of each video are decoded once, resized with padding to `video_cache_image_size`, and stored in
+    # memory-mapped files in this directory. Replaces the cache of decoded segments.
+    video_cache_dir: str | None = None
+    video_cache_image_size: tuple[int, int] = (224, 224)
+
+    # If greater than zero, shuffled LeRobot datasets are sampled in windows of this many consecutive frames of an
+    # episode, which lets data loader workers reuse decoded video frames. See `EpisodeLocalitySampler`.
+    shuffle_window_size: int = 0
+    # Number of episodes whose windows are shuffled together if `shuffle_window_size` is set.
+    shuffle_episodes_per_block: int = 8
+
     # Only used for RLDS data loader (ie currently only used for DROID).
     rlds_data_dir: str | None = None
     # Action space for DROID dataset.
@@ -528,6 +542,7 @@ class TrainConfig:
 
     check_only: bool = False
     use_annotation: bool = False
+    # (start, end) ranges of the state and action dimensions to train on, e.g. `--use-indices 0 8 17 25`.
     use_indices: List[Tuple[int, int]] | None = None
 
     @property
@@ -550,6 +565,9 @@ class TrainConfig:
     def __post_init__(self) -> None:
         if self.resume and self.overwrite:
             raise ValueError("Cannot resume and overwrite at the same time.")
+        if self.use_indices is not None:
+            # Validates the index ranges.
+            _transforms.make_gather_index(self.use_indices)
 
 
 # Use `get_config` if you need to get a config by name in your code.
@@ -1,4 +1,5 @@
 from collections.abc import Iterator, Sequence
+import functools
 import logging
 import multiprocessing
 import os
@@ -15,6 +16,7 @@ import openpi.models.model as _model
 import openpi.training.config as _config
 from openpi.training.droid_rlds_dataset import DroidRldsDataset
 from openpi.training.lerobot_dataset_with_annotations import LeRobotDatasetWithAnnotations
+import openpi.training.lerobot_dataset_with_frame_cache as _frame_cache
 import openpi.transforms as _transforms
 
 T_co = TypeVar("T_co", covariant=True)
@@ -72,24 +74,16 @@ class IterableTransformedDataset(IterableDataset[T_co]):
         is_batched: bool = False,
     ):
         self._dataset = dataset
+        self._transforms = transforms
         self._transform = _transforms.compose(transforms)
         self._is_batched = is_batched
 
     def __iter__(self):
         for sample in self._dataset:
             if self._is_batched:
-                # Transforms are designed to be applied to individual samples. So we need to split the batch into
-                # individual samples and apply the transform to each sample individually.
-                batch_size = next(v.shape[0] for v in sample.values())
-
-                # Split batch into individual samples using tree_map
-                individual_samples = [jax.tree.map(lambda x: x[i], sample) for i in range(batch_size)]  # noqa: B023
-
-                # Transform each sample
-                transformed = [self._transform(s) for s in individual_samples]
-
-                # Recombine batch with tree_map
-                yield jax.tree.map(lambda *x: np.stack(x, axis=0), *transformed)
+                # Batches are transformed at once if all transforms support it. Otherwise, the batch is split into
+                # individual samples that are transformed separately.
+                yield _transforms.apply_batched(self._transforms, sample)
             else:
                 yield self._transform(sample)
 
@@ -128,8 +122,87 @@ class FakeDataset(Dataset):
         return self._num_samples
 
 
+class EpisodeLocalitySampler(torch.utils.data.Sampler[int]):
+    """Shuffles the frames of a dataset while keeping frames of the same episode close together.
+
+    Every epoch, the episodes are shuffled and grouped into blocks of `episodes_per_block` episodes. The frames of each
+    block are split into windows of `window_size` consecutive frames of an episode, and the windows of a block are
+    emitted in random order, each with its frames in random order. Each block is assigned to one data loader worker, and
+    the batches are ordered such that `torch.utils.data.DataLoader`, which assigns the i-th batch to worker
+    `i % num_workers`, lets each worker load the frames of its own blocks. This way, a worker reuses decoded video
+    segments and annotation files for the frames of a window.
+
+    Larger windows and fewer episodes per block increase this reuse, but also the correlation of the samples in a batch.
+    With `window_size=1` and all episodes in one block, frames are shuffled uniformly.
+
+    The frames of each episode must be contiguous in the dataset, in the order of `episode_lengths`.
+    """
+
+    def __init__(
+        self,
+        episode_lengths: Sequence[int],
+        *,
+        window_size: int,
+        episodes_per_block: int,
+        batch_size: int,
+        num_workers: int = 0,
+        seed: int = 0,
+    ):
+        if window_size < 1 or episodes_per_block < 1:
+            raise ValueError(f"{window_size=} and {episodes_per_block=} must be positive.")
+        self._episode_lengths = np.asarray(episode_lengths)
+        self._episode_starts = np.cumsum(self._episode_lengths) - self._episode_lengths
+        self._window_size = window_size
+        self._episodes_per_block = episodes_per_block
+        self._batch_size = batch_size
+        self._num_workers = max(num_workers, 1)
+        self._seed = seed
+        self._epoch = 0
+
+    def __len__(self) -> int:
+        return int(np.sum(self._episode_lengths))
+
+    def __iter__(self) -> Iterator[int]:
+        rng = np.random.default_rng([self._seed, self._epoch])
+        self._epoch += 1
+
+        # Frames of the blocks of each worker. Blocks are assigned to the worker with the fewest frames.
+        worker_frames = [[] for _ in range(self._num_workers)]
+        worker_num_frames = np.zeros(self._num_workers, dtype=int)
+        episodes = rng.permutation(len(self._episode_lengths))
+        for block_start in range(0, len(episodes), self._episodes_per_block):
+            windows = []
+            for episode in episodes[block_start : block_start + self._episodes_per_block]:
+                frames = self._episode_starts[episode] + np.arange(self._episode_lengths[episode])
+                windows.extend(np.split(frames, range(self._window_size, len(frames), self._window_size)))
+            worker = np.argmin(worker_num_frames)
+            worker_frames[worker].extend(rng.permutation(windows[i]) for i in rng.permutation(len(windows)))
+            worker_num_frames[worker] += sum(len(window) for window in windows)
+
+        # Interleave the batches of the workers. Once a worker has no batches left, the remaining batches of the other
+        # workers are assigned to it.
+        worker_batches = []
+        remainders = []
+        for worker_windows in worker_frames:
+            frames = np.concatenate(worker_windows) if worker_windows else np.zeros(0, dtype=int)
+            num_batches = len(frames) // self._batch_size
+            full_batches = frames[: num_batches * self._batch_size].reshape(num_batches, self._batch_size)
+            # Reversed, so that the next batch of a worker is popped from the end.
+            worker_batches.append(list(full_batches[::-1]))
+            remainders.append(frames[num_batches * self._batch_size :])
+        batches = []
+        while any(worker_batches):
+            for worker in range(self._num_workers):
+                source = worker
+                if not worker_batches[source]:
+                    source = max(range(self._num_workers), key=lambda w: len(worker_batches[w]))
+                if worker_batches[source]:
+                    batches.append(worker_batches[source].pop())
+        yield from (int(i) for i in np.concatenate([*batches, *remainders]))
+
+
 def create_torch_dataset(
-    data_config: _config.DataConfig, action_horizon: int, model_config: _model.BaseModelConfig, use_annotation: bool = False, use_indices = None
+    data_config: _config.DataConfig, action_horizon: int, model_config: _model.BaseModelConfig, use_annotation: bool = False, use_indices: Sequence[tuple[int, int]] | None = None
 ) -> Dataset:
     """Create a dataset for training."""
     repo_id = data_config.repo_id
@@ -139,7 +212,15 @@ def create_torch_dataset(
         return FakeDataset(model_config, num_samples=1024)
 
     dataset_meta = lerobot_dataset.LeRobotDatasetMetadata(repo_id)
-    dataset = lerobot_dataset.LeRobotDataset(
+    dataset_cls = lerobot_dataset.LeRobotDataset
+    if data_config.video_cache_segments > 0 or data_config.video_cache_dir is not None:
+        dataset_cls = functools.partial(
+            _frame_cache.LeRobotDatasetWithFrameCache,
+            max_segments=data_config.video_cache_segments,
+            cache_dir=data_config.video_cache_dir,
+            image_size=data_config.video_cache_image_size,
+        )
+    dataset = dataset_cls(
         data_config.repo_id,
         delta_timestamps={
             key: [t / dataset_meta.fps for t in range(action_horizon)] for key in data_config.action_sequence_keys
@@ -147,8 +228,6 @@ def create_torch_dataset(
         video_backend='pyav',
     )
 
-    if use_indices is not None:
-        use_indices = eval(use_indices)
     dataset = LeRobotDatasetWithAnnotations(dataset, use_annotation=use_annotation, use_indices=use_indices)
 
     if data_config.prompt_from_task:
@@ -290,7 +369,7 @@ def create_torch_data_loader(
     seed: int = 0,
     framework: str = "jax",
     use_annotation: bool = False,
-    use_indices = None,
+    use_indices: Sequence[tuple[int, int]] | None = None,
 ) -> DataLoader[tuple[_model.Observation, _model.Actions]]:
     """Create a data loader for training.
 
@@ -332,6 +411,17 @@ def create_torch_data_loader(
     else:
         local_batch_size = batch_size // jax.process_count()
 
+    if sampler is None and shuffle and data_config.shuffle_window_size > 0 and data_config.repo_id != "fake":
+        dataset_meta = lerobot_dataset.LeRobotDatasetMetadata(data_config.repo_id)
+        sampler = EpisodeLocalitySampler(
+            [dataset_meta.episodes[i]["length"] for i in sorted(dataset_meta.episodes)],
+            window_size=data_config.shuffle_window_size,
+            episodes_per_block=data_config.shuffle_episodes_per_block,
+            batch_size=local_batch_size,
+            num_workers=num_workers,
+            seed=seed,
+        )
+
     logging.info(f"local_batch_size: {local_batch_size}")
     data_loader = TorchDataLoader(
         dataset,
@@ -470,6 +560,7 @@ class TorchDataLoader:
                 try:
                     batch = next(data_iter)
                 except StopIteration:
+                    _frame_cache.log_cache_stats()
                     break  # We've exhausted the dataset. Create a new iterator and start over.
                 num_items += 1
                 # For JAX, convert to sharded arrays; for PyTorch, return torch tensors
@@ -1,10 +1,14 @@
 import dataclasses
 
 import jax
+import numpy as np
 
+from openpi.models import model as _model
 from openpi.models import pi0_config
+from openpi.policies import droid_policy
 from openpi.training import config as _config
 from openpi.training import data_loader as _data_loader
+import openpi.transforms as _transforms
 
 
 def test_torch_data_loader():
@@ -47,6 +51,25 @@ def test_torch_data_loader_parallel():
         assert all(x.shape[0] == 4 for x in jax.tree.leaves(batch))
 
 
+def test_episode_locality_sampler():
+    episode_lengths = [10, 7, 13, 5, 9, 12]
+    episode_index = np.repeat(np.arange(len(episode_lengths)), episode_lengths)
+    sampler = _data_loader.EpisodeLocalitySampler(
+        episode_lengths, window_size=4, episodes_per_block=2, batch_size=4, num_workers=2
+    )
+
+    indices = list(sampler)
+    assert sorted(indices) == list(range(len(sampler)))
+    # A new order every epoch.
+    assert list(sampler) != indices
+
+    # The batches of each worker come from its own blocks of episodes, except for the last ones.
+    batches = np.array(indices[:40]).reshape(-1, 2, 4)
+    worker_episodes = [set(episode_index[batches[:4, worker]].flat) for worker in range(2)]
+    assert not worker_episodes[0] & worker_episodes[1]
+    assert all(len(episodes) <= 4 for episodes in worker_episodes)
+
+
 def test_with_fake_dataset():
     config = _config.get_config("debug")
 
@@ -82,3 +105,41 @@ def test_with_real_dataset():
 
     for _, actions in batches:
         assert actions.shape == (config.batch_size, config.model.action_horizon, config.model.action_dim)
+
+
+def test_iterable_transformed_dataset_batched():
+    rng = np.random.default_rng(0)
+    batches = [
+        {
+            "observation/exterior_image_1_left": rng.integers(256, size=(4, 16, 16, 3), dtype=np.uint8),
+            "observation/wrist_image_left": rng.integers(256, size=(4, 16, 16, 3), dtype=np.uint8),
+            "observation/joint_position": rng.random((4, 7)),
+            "observation/gripper_position": rng.random((4, 1)),
+            "actions": rng.random((4, 10, 8)),
+            "prompt": np.array([b"pick up the cup", b"open the drawer", b"pick up the cup", b""]),
+        }
+        for _ in range(2)
+    ]
+    # Tokenization is skipped since the tokenizer may not be available.
+    transforms = [
+        droid_policy.DroidInputs(model_type=_model.ModelType.PI0),
+        _transforms.DeltaActions(_transforms.make_bool_mask(7, -1)),
+        _transforms.Normalize({"state": _transforms.NormStats(mean=np.full(8, 0.5), std=np.full(8, 0.3))}),
+        _transforms.ResizeImages(8, 8),
+        _transforms.PadStatesAndActions(32),
+    ]
+
+    # Falls back to transforming each sample if a transform does not support batches.
+    unbatched = list(
+        _data_loader.IterableTransformedDataset(
+            jax.tree.map(np.copy, batches), [*transforms, lambda data: data], is_batched=True
+        )
+    )
+    batched = list(_data_loader.IterableTransformedDataset(batches, transforms, is_batched=True))
+
+    assert len(batched) == 2
+    assert batched[0]["state"].shape == (4, 32)
+    assert batched[0]["image"]["base_0_rgb"].shape == (4, 8, 8, 3)
+    assert batched[0]["image_mask"]["right_wrist_0_rgb"].tolist() == [False] * 4
+    assert batched[0]["prompt"].tolist() == ["pick up the cup", "open the drawer", "pick up the cup", ""]
+    jax.tree.map(np.testing.assert_array_equal, batched, unbatched)
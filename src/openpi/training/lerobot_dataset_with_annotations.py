@@ -12,21 +12,35 @@ annotated_dataset = LeRobotDatasetWithAnnotations(base_dataset, use_annotation=T
 for data in annotated_dataset:
     print(data['prompt'])  # Annotated prompt for the task
 ``` 
+
+The prompts can be precompiled with `scripts/compute_prompt_table.py`, so that they are not built from the annotation
+files during training.
 """
 
+import hashlib
 import json
+import logging
 import numpy as np
 import os
 import re
+import shutil
 import torch
 from typing import List, Tuple, Optional
 
 from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
 
+import openpi.transforms as _transforms
+
 
 # Template for constructing prompts from annotations
 _PROMPT_TEMPLATE = 'scene: {scene_description}. task: {task}, {subtask}. movement: {movement_summary_left} {movement_summary_right}. '
 
+# Keys of the values that are filled into the prompt template
+_PROMPT_KEYS = tuple(re.findall(r'\{(.*?)\}', _PROMPT_TEMPLATE))
+
+# Directory of the precompiled prompts in the annotation directory, see `write_prompt_table`
+_PROMPT_TABLE_DIR = 'prompt_table'
+
 # Mapping of special symbols to unique tokens
 _SPECIAL_SYMBOLS = {
     ': ': '<colon>',
@@ -44,11 +58,246 @@ def _get_default_lerobot_root():
     return os.path.expanduser('~/.cache/huggingface/lerobot')
 
 
-def _extract_indices(state, indices):
-    states = []
-    for start, end in indices:
-        states.append(state[..., start:end])
-    return np.concatenate(states, axis=-1)
+def get_annotation_dir(repo_id: str) -> str:
+    """Returns the directory of the episode annotation files of a dataset."""
+    return os.path.join(_get_default_lerobot_root(), repo_id, 'annotations')
+
+
+def _replace_special_symbols(text):
+    for symbol, replacement in _SPECIAL_SYMBOLS.items():
+        text = text.replace(symbol, replacement)
+    return text
+
+
+def _remove_symbols(text):
+    for symbol in [',', '.', ':', ';', '!', '?']:
+        text = text.replace(symbol, ' ')
+    return text
+
+
+def _remove_stop_words(text):
+    if not text.startswith(' '):
+        text = ' ' + text
+    if not text.endswith(' '):
+        text = text + ' '
+    for stop_word in _STOP_WORDS:
+        text = text.replace(f' {stop_word} ', ' ')
+    return text.strip()
+
+
+def _recover_special_symbols(text):
+    for symbol, replacement in _SPECIAL_SYMBOLS.items():
+        text = text.replace(replacement, symbol)
+    return text
+
+
+def _clear_text(text):
+    for symbol in [',', '.', ':', ';', '!', '?']:
+        text = text.replace(f' {symbol} ', symbol + ' ')
+    while '  ' in text:
+        text = text.replace('  ', ' ')
+    return text.strip()
+
+
+def _make_prompt(item, annotation):
+    prompt = _PROMPT_TEMPLATE
+    prompt = _replace_special_symbols(prompt).lower()
+
+    keys = re.findall(r'\{(.*?)\}', prompt)
+    for key in keys:
+        if key in annotation:
+            value = annotation[key]
+        else:
+            value = item[key]
+        value = _remove_symbols(value).lower()
+        if not value.startswith(' '):
+            value = ' ' + value
+        if not value.endswith(' '):
+            value = value + ' '
+        prompt = prompt.replace(f'{{{key}}}', value)
+
+    prompt = _remove_stop_words(prompt)
+    prompt = _recover_special_symbols(prompt)
+    prompt = _clear_text(prompt)
+    return prompt
+
+
+class _AnnotationIndex:
+    """
+    Annotations of a dataset, indexed by episode and frame.
+
+    The annotation file of an episode is loaded when one of its frames is looked up for the first time. Only the
+    values that are used in prompts are kept, and identical annotations (e.g., of the frames of the same subtask) are
+    stored once in a table that frames refer to by id.
+    """
+
+    def __init__(self, annotation_dir: str):
+        self._annotation_dir = annotation_dir
+        # Annotation id of each frame, by episode index.
+        self._episodes: dict[int, np.ndarray] = {}
+        # Unique annotations, restricted to the prompt keys.
+        self.annotations: list[dict[str, str]] = []
+        self._annotation_ids: dict[tuple[tuple[str, str], ...], int] = {}
+
+    def lookup(self, episode_index: int, frame_index: int) -> int:
+        """Returns the id of the annotation of a frame in `annotations`."""
+        return int(self.episode(episode_index)[frame_index])
+
+    def episode(self, episode_index: int) -> np.ndarray:
+        """Returns the ids of the annotations of all frames of an episode."""
+        if (annotation_ids := self._episodes.get(episode_index)) is None:
+            annotation_ids = self._episodes[episode_index] = self._load_episode(episode_index)
+        return annotation_ids
+
+    def _load_episode(self, episode_index: int) -> np.ndarray:
+        annotation_path = os.path.join(self._annotation_dir, f'episode_{episode_index:06d}.json')
+        with open(annotation_path, 'r') as f:
+            annotations = json.load(f)
+
+        annotation_ids = np.empty(len(annotations), dtype=np.int32)
+        for frame_index, annotation in enumerate(annotations):
+            key = tuple((k, annotation[k]) for k in _PROMPT_KEYS if k in annotation)
+            if (annotation_id := self._annotation_ids.get(key)) is None:
+                annotation_id = self._annotation_ids[key] = len(self.annotations)
+                self.annotations.append(dict(key))
+            annotation_ids[frame_index] = annotation_id
+        return annotation_ids
+
+
+class PromptTable:
+    """
+    Precompiled prompts of an annotated dataset, written by `write_prompt_table`.
+
+    The unique prompts are stored together with the prompt id of each frame. The arrays are memory-mapped, so that data
+    loader workers share their pages instead of holding their own copies. Pickling a table (e.g., for a spawned worker)
+    only pickles its path, and the arrays are mapped again when it is unpickled.
+
+    The table also records the prompt template and the modification times of the annotation files it was built from,
+    see `is_up_to_date`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        def load(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+        self.prompts = load('prompts')
+        # Task that each prompt was built with, if it was not defined by the annotation.
+        self.tasks = load('tasks')
+        self.task_from_item = load('task_from_item')
+        # Prompt ids of the frames of episode `i` are `prompt_ids[episode_offsets[i]:episode_offsets[i + 1]]`.
+        self._episode_offsets = load('episode_offsets')
+        self._prompt_ids = load('prompt_ids')
+
+    def __reduce__(self):
+        return (PromptTable, (self.path,))
+
+    def is_up_to_date(self) -> bool:
+        """Returns whether the prompt template and the annotation files are unchanged since the table was written."""
+        try:
+            with open(os.path.join(self.path, 'metadata.json')) as f:
+                metadata = json.load(f)
+            episode_indices = [int(i) for i in metadata['annotation_mtimes']]
+            return metadata == _prompt_table_metadata(os.path.dirname(self.path), episode_indices)
+        except FileNotFoundError:
+            # Tables without metadata or with deleted annotation files.
+            return False
+
+    def lookup(self, episode_index: int, frame_index: int) -> int | None:
+        """Returns the id of the prompt of a frame, or None if its episode is not in the table."""
+        if episode_index + 1 >= len(self._episode_offsets):
+            return None
+        start, end = self._episode_offsets[episode_index], self._episode_offsets[episode_index + 1]
+        if start == end:
+            return None
+        if not 0 <= frame_index < end - start:
+            raise IndexError(f'Frame {frame_index} is not annotated in episode {episode_index}.')
+        return int(self._prompt_ids[start + frame_index])
+
+    def get_prompt(self, item) -> str | None:
+        """Returns the prompt of an item, or None if the table does not contain it."""
+        prompt_id = self.lookup(int(item['episode_index']), int(item['frame_index']))
+        if prompt_id is None:
+            return None
+        # The prompt is only valid if the item has the task that the prompt was built with.
+        if self.task_from_item[prompt_id] and self.tasks[prompt_id] != item['task']:
+            return None
+        return str(self.prompts[prompt_id])
+
+
+def _prompt_table_metadata(annotation_dir: str, episode_indices: list[int]) -> dict:
+    """Returns what the prompts of a `PromptTable` depend on, other than the tasks of the dataset."""
+    prompt_config = json.dumps([_PROMPT_TEMPLATE, _SPECIAL_SYMBOLS, _STOP_WORDS])
+    return {
+        'prompt_config_hash': hashlib.sha256(prompt_config.encode()).hexdigest(),
+        'annotation_mtimes': {
+            str(i): os.stat(os.path.join(annotation_dir, f'episode_{i:06d}.json')).st_mtime_ns for i in episode_indices
+        },
+    }
+
+
+def write_prompt_table(annotation_dir: str, episode_tasks: dict[int, str]) -> str:
+    """
+    Builds the prompts of all annotated frames and writes them to a `PromptTable` in the annotation directory.
+
+    Params:
+    - annotation_dir: Directory of the episode annotation files.
+    - episode_tasks: Task of each episode, used for prompts whose annotation does not define the task. Episodes
+      without an annotation file are skipped.
+
+    Returns the path of the table.
+    """
+    annotated_episodes = [
+        i for i in sorted(episode_tasks) if os.path.exists(os.path.join(annotation_dir, f'episode_{i:06d}.json'))
+    ]
+    # Taken before the annotations are read, so that files that change in the meantime make the table outdated.
+    metadata = _prompt_table_metadata(annotation_dir, annotated_episodes)
+
+    index = _AnnotationIndex(annotation_dir)
+    prompts, tasks, task_from_item = [], [], []
+    prompt_ids_by_key: dict[tuple[int, str], int] = {}
+    episode_offsets = np.zeros(max(episode_tasks, default=-1) + 2, dtype=np.int64)
+    episode_prompt_ids = []
+    for episode_index in range(len(episode_offsets) - 1):
+        num_frames = 0
+        if str(episode_index) in metadata['annotation_mtimes']:
+            task = episode_tasks[episode_index]
+            annotation_ids = index.episode(episode_index)
+            prompt_ids = np.empty(len(annotation_ids), dtype=np.uint32)
+            for frame_index, annotation_id in enumerate(annotation_ids):
+                annotation = index.annotations[annotation_id]
+                key = (int(annotation_id), task if 'task' not in annotation else '')
+                if (prompt_id := prompt_ids_by_key.get(key)) is None:
+                    prompt_id = prompt_ids_by_key[key] = len(prompts)
+                    prompts.append(_make_prompt({'task': task}, annotation))
+                    tasks.append(key[1])
+                    task_from_item.append('task' not in annotation)
+                prompt_ids[frame_index] = prompt_id
+            episode_prompt_ids.append(prompt_ids)
+            num_frames = len(prompt_ids)
+        episode_offsets[episode_index + 1] = episode_offsets[episode_index] + num_frames
+
+    arrays = {
+        'prompts': np.array(prompts, dtype=str),
+        'tasks': np.array(tasks, dtype=str),
+        'task_from_item': np.array(task_from_item, dtype=bool),
+        'episode_offsets': episode_offsets,
+        'prompt_ids': np.concatenate(episode_prompt_ids) if episode_prompt_ids else np.zeros(0, dtype=np.uint32),
+    }
+
+    # Write to a temporary directory first, so that a table is never partially written.
+    path = os.path.join(annotation_dir, _PROMPT_TABLE_DIR)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+    with open(os.path.join(tmp_path, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    return path
 
 
 class LeRobotDatasetWithAnnotations(torch.utils.data.Dataset):
@@ -71,6 +320,24 @@ class LeRobotDatasetWithAnnotations(torch.utils.data.Dataset):
         self.lerobot_dataset = lerobot_dataset
         self.use_annotation = use_annotation
         self.use_indices = use_indices
+        # Indices of the dimensions of the state and action vectors that are selected by `use_indices`.
+        self._gather_index = _transforms.make_gather_index(use_indices) if use_indices is not None else None
+        # Precompiled prompts, if `write_prompt_table` was run for the dataset and the annotations are unchanged since.
+        self._prompt_table: PromptTable | None = None
+        if use_annotation:
+            prompt_table_path = os.path.join(get_annotation_dir(self.lerobot_dataset.repo_id), _PROMPT_TABLE_DIR)
+            if os.path.isdir(prompt_table_path):
+                prompt_table = PromptTable(prompt_table_path)
+                if prompt_table.is_up_to_date():
+                    self._prompt_table = prompt_table
+                else:
+                    logging.warning(
+                        f'Prompt table {prompt_table_path} is outdated, building prompts from the annotation files. '
+                        'Run scripts/compute_prompt_table.py to update it.')
+        # Built lazily, so that each data loader worker loads the annotations it needs.
+        self._annotation_index: _AnnotationIndex | None = None
+        # Prompts by annotation id and the values of the prompt keys that are taken from the item.
+        self._prompts: dict[tuple[int, tuple], str] = {}
     
     def __len__(self):
         return len(self.lerobot_dataset)
@@ -82,77 +349,25 @@ class LeRobotDatasetWithAnnotations(torch.utils.data.Dataset):
 
         item['prompt'] = self._parse_annotation(item, episode_index, frame_index)
 
-        if self.use_indices is not None:
-            item['observation.state'] = _extract_indices(item['observation.state'], self.use_indices)
-            item['action'] = _extract_indices(item['action'], self.use_indices)
+        if self._gather_index is not None:
+            item['observation.state'] = np.take(np.asarray(item['observation.state']), self._gather_index, axis=-1)
+            item['action'] = np.take(np.asarray(item['action']), self._gather_index, axis=-1)
 
         return item
     
     def _parse_annotation(self, item, episode_index, frame_index):
         if not self.use_annotation:
             return item['task']
+
+        if self._prompt_table is not None and (prompt := self._prompt_table.get_prompt(item)) is not None:
+            return prompt
         
-        annotation_path = os.path.join(
-            _get_default_lerobot_root(), 
-            self.lerobot_dataset.repo_id, 
-            'annotations', 
-            f'episode_{episode_index:06d}.json')
-        
-        with open(annotation_path, 'r') as f:
-            annotations = json.load(f)
-        annotation = annotations[frame_index]
+        if self._annotation_index is None:
+            self._annotation_index = _AnnotationIndex(get_annotation_dir(self.lerobot_dataset.repo_id))
+        annotation_id = self._annotation_index.lookup(int(episode_index), int(frame_index))
+        annotation = self._annotation_index.annotations[annotation_id]
 
-        return self._make_prompt(item, annotation)
-    
-    def _replace_special_symbols(self, text):
-        for symbol, replacement in _SPECIAL_SYMBOLS.items():
-            text = text.replace(symbol, replacement)
-        return text
-    
-    def _remove_symbols(self, text):
-        for symbol in [',', '.', ':', ';', '!', '?']:
-            text = text.replace(symbol, ' ')
-        return text
-    
-    def _remove_stop_words(self, text):
-        if not text.startswith(' '):
-            text = ' ' + text
-        if not text.endswith(' '):
-            text = text + ' '
-        for stop_word in _STOP_WORDS:
-            text = text.replace(f' {stop_word} ', ' ')
-        return text.strip()
-
-    def _recover_special_symbols(self, text):
-        for symbol, replacement in _SPECIAL_SYMBOLS.items():
-            text = text.replace(replacement, symbol)
-        return text
-    
-    def _clear_text(self, text):
-        for symbol in [',', '.', ':', ';', '!', '?']:
-            text = text.replace(f' {symbol} ', symbol + ' ')
-        while '  ' in text:
-            text = text.replace('  ', ' ')
-        return text.strip()
-
-    def _make_prompt(self, item, annotation):
-        prompt = _PROMPT_TEMPLATE
-        prompt = self._replace_special_symbols(prompt).lower()
-
-        keys = re.findall(r'\{(.*?)\}', prompt)
-        for key in keys:
-            if key in annotation:
-                value = annotation[key]
-            else:
-                value = item[key]
-            value = self._remove_symbols(value).lower()
-            if not value.startswith(' '):
-                value = ' ' + value
-            if not value.endswith(' '):
-                value = value + ' '
-            prompt = prompt.replace(f'{{{key}}}', value)
-
-        prompt = self._remove_stop_words(prompt)
-        prompt = self._recover_special_symbols(prompt)
-        prompt = self._clear_text(prompt)
-        return prompt
\ No newline at end of file
+        key = (annotation_id, tuple(item[k] for k in _PROMPT_KEYS if k not in annotation))
+        if (prompt := self._prompts.get(key)) is None:
+            prompt = self._prompts[key] = _make_prompt(item, annotation)
+        return prompt
@@ -0,0 +1,111 @@
+import json
+import os
+import pickle
+
+from openpi.training import lerobot_dataset_with_annotations as _annotations
+
+
+class _FakeDataset:
+    repo_id = "fake/repo"
+
+    def __init__(self, frames):
+        self._frames = frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, idx):
+        episode_index, frame_index = self._frames[idx]
+        return {"episode_index": episode_index, "frame_index": frame_index, "task": "Pick up the cup."}
+
+
+def test_annotation_prompts(tmp_path, monkeypatch):
+    monkeypatch.setattr(_annotations, "_get_default_lerobot_root", lambda: str(tmp_path))
+    annotation_dir = tmp_path / "fake/repo/annotations"
+    annotation_dir.mkdir(parents=True)
+    annotation = {
+        "scene_description": "A table with a cup.",
+        "subtask": "reach the cup",
+        "movement_summary_left": "move left arm forward",
+        "movement_summary_right": "keep right arm still",
+    }
+    episodes = [
+        [annotation, annotation, {**annotation, "subtask": "grasp the cup"}],
+        [{**annotation, "task": "Open the drawer."}],
+    ]
+    for episode_index, annotations in enumerate(episodes):
+        with (annotation_dir / f"episode_{episode_index:06d}.json").open("w") as f:
+            json.dump(annotations, f)
+
+    dataset = _annotations.LeRobotDatasetWithAnnotations(
+        _FakeDataset([(0, 0), (0, 1), (0, 2), (1, 0)]), use_annotation=True
+    )
+    prompts = [dataset[i]["prompt"] for i in range(len(dataset))]
+    assert prompts == [
+        "scene: table with cup. task: pick up cup, reach cup. movement: move left arm forward keep right arm still.",
+        "scene: table with cup. task: pick up cup, reach cup. movement: move left arm forward keep right arm still.",
+        "scene: table with cup. task: pick up cup, grasp cup. movement: move left arm forward keep right arm still.",
+        "scene: table with cup. task: open drawer, reach cup. movement: move left arm forward keep right arm still.",
+    ]
+
+    # Annotations are only loaded once per episode.
+    for path in annotation_dir.iterdir():
+        path.unlink()
+    assert [dataset[i]["prompt"] for i in range(len(dataset))] == prompts
+
+
+def test_prompt_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(_annotations, "_get_default_lerobot_root", lambda: str(tmp_path))
+    annotation_dir = tmp_path / "fake/repo/annotations"
+    annotation_dir.mkdir(parents=True)
+    annotation = {
+        "scene_description": "A table with a cup.",
+        "subtask": "reach the cup",
+        "movement_summary_left": "move left arm forward",
+        "movement_summary_right": "keep right arm still",
+    }
+    episodes = {
+        0: [annotation, annotation, {**annotation, "subtask": "grasp the cup"}],
+        2: [{**annotation, "task": "Open the drawer."}],
+    }
+    for episode_index, annotations in episodes.items():
+        with (annotation_dir / f"episode_{episode_index:06d}.json").open("w") as f:
+            json.dump(annotations, f)
+
+    frames = [(0, 0), (0, 1), (0, 2), (2, 0)]
+    expected_prompts = [
+        _annotations.LeRobotDatasetWithAnnotations(_FakeDataset(frames), use_annotation=True)[i]["prompt"]
+        for i in range(len(frames))
+    ]
+
+    path = _annotations.write_prompt_table(
+        str(annotation_dir), {0: "Pick up the cup.", 1: "Pick up the cup.", 2: "Pick up the cup."}
+    )
+    table = _annotations.PromptTable(path)
+    assert len(table.prompts) == 3
+    assert table.lookup(1, 0) is None
+    assert table.is_up_to_date()
+
+    # The table is outdated when the prompt template or an annotation file changes.
+    with monkeypatch.context() as m:
+        m.setattr(_annotations, "_PROMPT_TEMPLATE", "task: {task}.")
+        assert not table.is_up_to_date()
+    stat = os.stat(annotation_dir / "episode_000002.json")
+    with (annotation_dir / "episode_000002.json").open("w") as f:
+        json.dump([{**annotation, "task": "Close the drawer."}], f)
+    os.utime(annotation_dir / "episode_000002.json", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert not table.is_up_to_date()
+    # An outdated table is not used.
+    dataset = _annotations.LeRobotDatasetWithAnnotations(_FakeDataset(frames), use_annotation=True)
+    assert dataset[3]["prompt"].startswith("scene: table with cup. task: close drawer")
+
+    with (annotation_dir / "episode_000002.json").open("w") as f:
+        json.dump(episodes[2], f)
+    _annotations.write_prompt_table(str(annotation_dir), {0: "Pick up the cup.", 2: "Pick up the cup."})
+
+    # Prompts are read from the table, also after pickling the dataset.
+    dataset = _annotations.LeRobotDatasetWithAnnotations(_FakeDataset(frames), use_annotation=True)
+    dataset = pickle.loads(pickle.dumps(dataset))
+    for path in annotation_dir.glob("*.json"):
+        path.unlink()
+    assert [dataset[i]["prompt"] for i in range(len(frames))] == expected_prompts
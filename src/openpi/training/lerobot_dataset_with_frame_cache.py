@@ -0,0 +1,256 @@
+"""LeRobot dataset that caches decoded video frames.
+
+`LeRobotDataset` decodes the camera videos of every sample from the keyframe before the queried frame. With shuffled
+access, most of the decoded frames are thrown away. `LeRobotDatasetWithFrameCache` keeps the decoded frames instead,
+either in a per-worker LRU of decoded segments (the frames from one keyframe to the next) or in memory-mapped files on
+disk, which hold each video decoded once and resized.
+"""
+
+import collections
+from collections.abc import Sequence
+import fcntl
+import logging
+import multiprocessing
+import os
+import weakref
+
+import av
+import lerobot.common.datasets.lerobot_dataset as lerobot_dataset
+import numpy as np
+from openpi_client import image_tools
+import torch
+
+# Datasets created in this process, whose cache statistics are logged by `log_cache_stats`.
+_DATASETS: weakref.WeakSet["LeRobotDatasetWithFrameCache"] = weakref.WeakSet()
+
+
+def read_keyframe_timestamps(video_path: str) -> np.ndarray:
+    """Returns the sorted timestamps of the keyframes of a video, without decoding it."""
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        timestamps = [
+            float(packet.pts * stream.time_base)
+            for packet in container.demux(stream)
+            if packet.is_keyframe and packet.pts is not None
+        ]
+    return np.sort(timestamps)
+
+
+def decode_frames(
+    video_path: str, start: float = 0.0, end: float = np.inf, *, image_size: tuple[int, int] | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Decodes the frames of a video with timestamps in `[start, end)`.
+
+    `start` should be the timestamp of a keyframe, since decoding starts at the keyframe before it. If `image_size` is
+    given, the frames are resized with padding to this (height, width). Returns the timestamps of the frames and the
+    frames in [n, h, w, c] uint8 format.
+    """
+    timestamps, frames = [], []
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        if start > 0:
+            container.seek(round(start / stream.time_base), stream=stream)
+        for frame in container.decode(stream):
+            timestamp = float(frame.pts * stream.time_base)
+            if timestamp >= end:
+                break
+            if timestamp >= start:
+                image = frame.to_ndarray(format="rgb24")
+                if image_size is not None:
+                    image = image_tools.resize_with_pad(image, *image_size)
+                timestamps.append(timestamp)
+                frames.append(image)
+    if not frames:
+        raise ValueError(f"No frames between {start}s and {end}s in {video_path}.")
+    return np.array(timestamps), np.stack(frames)
+
+
+class VideoFrameCache:
+    """Cache of decoded video frames.
+
+    By default, videos are decoded in segments, which are the frames from one keyframe to the next, and the
+    `max_segments` most recently used segments are kept in memory. If `cache_dir` is set, each video is instead decoded
+    once, resized with padding to `image_size`, and stored as a uint8 array in `cache_dir`. The arrays of the
+    `max_open_videos` most recently used videos are kept memory-mapped, each of which holds a file descriptor.
+
+    Pickling the cache (e.g., for a data loader worker) drops the cached frames, so that each worker builds its own
+    cache. The hit and miss counts are shared with the workers.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_segments: int = 64,
+        cache_dir: str | None = None,
+        image_size: tuple[int, int] = (224, 224),
+        tolerance_s: float = 1e-4,
+        max_open_videos: int = 256,
+    ):
+        self._max_segments = max_segments
+        self._max_open_videos = max_open_videos
+        self._cache_dir = cache_dir
+        self._image_size = tuple(image_size)
+        self._tolerance_s = tolerance_s
+        self._init_cache()
+        ctx = multiprocessing.get_context("spawn")
+        self._hits = ctx.Value("q", 0)
+        self._misses = ctx.Value("q", 0)
+
+    def _init_cache(self) -> None:
+        # Keyframe timestamps by video path.
+        self._keyframes: dict[str, np.ndarray] = {}
+        # Timestamps and frames of decoded segments by (video path, keyframe index), in LRU order.
+        self._segments: collections.OrderedDict[tuple[str, int], tuple[np.ndarray, np.ndarray]] = (
+            collections.OrderedDict()
+        )
+        # Timestamps and memory-mapped frames of the videos in `cache_dir` by video path, in LRU order.
+        self._videos: collections.OrderedDict[str, tuple[np.ndarray, np.ndarray]] = collections.OrderedDict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_keyframes", "_segments", "_videos"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    def stats(self, *, reset: bool = False) -> tuple[int, int]:
+        """Returns the number of frames that were served from the cache and that had to be decoded, summed over all
+        processes. If `reset` is true, the counts are reset afterwards."""
+        with self._hits.get_lock(), self._misses.get_lock():
+            stats = (self._hits.value, self._misses.value)
+            if reset:
+                self._hits.value = self._misses.value = 0
+        return stats
+
+    def get_frames(self, video_path: str, timestamps: Sequence[float], *, name: str) -> np.ndarray:
+        """Returns the frames closest to the timestamps in [n, h, w, c] uint8 format.
+
+        `name` identifies the video in `cache_dir` (e.g., "repo_id/camera/episode_000000").
+        """
+        frames = []
+        hits = 0
+        for timestamp in timestamps:
+            if self._cache_dir is not None:
+                frame_timestamps, video_frames, hit = self._get_video(video_path, name)
+            else:
+                frame_timestamps, video_frames, hit = self._get_segment(video_path, timestamp)
+
+            index = np.argmin(np.abs(frame_timestamps - timestamp))
+            if abs(frame_timestamps[index] - timestamp) >= self._tolerance_s:
+                raise ValueError(
+                    f"No frame within {self._tolerance_s}s of {timestamp}s in {video_path}, the closest frame is at "
+                    f"{frame_timestamps[index]}s."
+                )
+            frames.append(video_frames[index])
+            hits += hit
+
+        with self._hits.get_lock():
+            self._hits.value += hits
+        with self._misses.get_lock():
+            self._misses.value += len(frames) - hits
+        return np.stack(frames)
+
+    def _get_segment(self, video_path: str, timestamp: float) -> tuple[np.ndarray, np.ndarray, bool]:
+        if (keyframes := self._keyframes.get(video_path)) is None:
+            keyframes = self._keyframes[video_path] = read_keyframe_timestamps(video_path)
+        # Frames within the tolerance before a keyframe belong to its segment.
+        keyframe_index = max(int(np.searchsorted(keyframes, timestamp + self._tolerance_s, side="right")) - 1, 0)
+
+        key = (video_path, keyframe_index)
+        if (segment := self._segments.get(key)) is not None:
+            self._segments.move_to_end(key)
+            return *segment, True
+
+        start = keyframes[keyframe_index] if keyframe_index > 0 else 0.0
+        end = keyframes[keyframe_index + 1] if keyframe_index + 1 < len(keyframes) else np.inf
+        segment = self._segments[key] = decode_frames(video_path, start, end)
+        if len(self._segments) > self._max_segments:
+            self._segments.popitem(last=False)
+        return *segment, False
+
+    def _get_video(self, video_path: str, name: str) -> tuple[np.ndarray, np.ndarray, bool]:
+        if (video := self._videos.get(video_path)) is not None:
+            self._videos.move_to_end(video_path)
+            return *video, True
+
+        height, width = self._image_size
+        path = os.path.join(self._cache_dir, f"{height}x{width}", name)
+        hit = os.path.exists(f"{path}.npy")
+        if not hit:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Only one process decodes a video. Other workers that need it wait for the lock and then read its frames.
+            with open(f"{path}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if not os.path.exists(f"{path}.npy"):
+                    timestamps, frames = decode_frames(video_path, image_size=self._image_size)
+                    # The frames are written last, so that their file only exists once both files are complete.
+                    _save_atomic(f"{path}_timestamps.npy", timestamps)
+                    _save_atomic(f"{path}.npy", frames)
+
+        video = self._videos[video_path] = (np.load(f"{path}_timestamps.npy"), np.load(f"{path}.npy", mmap_mode="r"))
+        # Evicted maps are closed once the returned frames, which are copied, no longer reference them.
+        if len(self._videos) > self._max_open_videos:
+            self._videos.popitem(last=False)
+        return *video, hit
+
+
+class LeRobotDatasetWithFrameCache(lerobot_dataset.LeRobotDataset):
+    """LeRobot dataset that caches the decoded frames of its videos in a `VideoFrameCache`.
+
+    Each data loader worker has its own cache. If `cache_dir` is set, the frames are returned at `image_size`.
+    Otherwise, they are returned in the same format as by `LeRobotDataset`. Frames are decoded with PyAV, independent
+    of `video_backend`. The cache hit rate is logged by `log_cache_stats`.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_segments: int = 64,
+        cache_dir: str | None = None,
+        image_size: tuple[int, int] = (224, 224),
+        max_open_videos: int = 256,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.frame_cache = VideoFrameCache(
+            max_segments=max_segments,
+            cache_dir=cache_dir,
+            image_size=image_size,
+            tolerance_s=self.tolerance_s,
+            max_open_videos=max_open_videos,
+        )
+        _DATASETS.add(self)
+
+    def _query_videos(self, query_timestamps: dict[str, list[float]], ep_idx: int) -> dict[str, torch.Tensor]:
+        item = {}
+        for vid_key, query_ts in query_timestamps.items():
+            video_path = str(self.root / self.meta.get_video_file_path(ep_idx, vid_key))
+            frames = self.frame_cache.get_frames(
+                video_path, query_ts, name=f"{self.repo_id}/{vid_key}/episode_{ep_idx:06d}"
+            )
+            # Same format as `decode_video_frames_torchvision`: float32 in [0, 1], [n, c, h, w].
+            frames = torch.from_numpy(frames).permute(0, 3, 1, 2).type(torch.float32) / 255
+            item[vid_key] = frames.squeeze(0)
+        return item
+
+
+def _save_atomic(path: str, array: np.ndarray) -> None:
+    """Saves an array such that concurrent readers (e.g., other data loader workers) never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def log_cache_stats(datasets: Sequence[LeRobotDatasetWithFrameCache] | None = None) -> None:
+    """Logs and resets the frame cache hit rates of the given datasets, or of all datasets created in this process."""
+    for dataset in _DATASETS if datasets is None else datasets:
+        hits, misses = dataset.frame_cache.stats(reset=True)
+        if hits + misses > 0:
+            logging.info(
+                f"Frame cache of {dataset.repo_id}: {hits / (hits + misses):.1%} hit rate ({hits} hits, {misses} misses)"
+            )
@@ -0,0 +1,104 @@
+import fractions
+import types
+
+import numpy as np
+import pytest
+import torch
+
+# Videos are encoded and decoded with PyAV.
+pytest.importorskip("av")
+
+import av
+
+from openpi.training import lerobot_dataset_with_frame_cache as _frame_cache
+
+
+def _write_video(path, num_frames: int, fps: int = 10) -> None:
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("mpeg4", rate=fps)
+        stream.width = stream.height = 32
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = 4
+        for i in range(num_frames):
+            frame = av.VideoFrame.from_ndarray(np.full((32, 32, 3), 20 * i, dtype=np.uint8), format="rgb24")
+            frame.pts = i
+            frame.time_base = fractions.Fraction(1, fps)
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+
+
+def test_segment_cache(tmp_path):
+    video_path = str(tmp_path / "video.mp4")
+    _write_video(video_path, num_frames=12)
+    timestamps, frames = _frame_cache.decode_frames(video_path)
+    np.testing.assert_allclose(timestamps, np.arange(12) / 10)
+    num_segments = len(_frame_cache.read_keyframe_timestamps(video_path))
+    assert num_segments > 1
+
+    cache = _frame_cache.VideoFrameCache(max_segments=num_segments)
+    order = np.random.default_rng(0).permutation(12)
+    for i in order:
+        np.testing.assert_array_equal(cache.get_frames(video_path, [i / 10], name="video")[0], frames[i])
+    # Each segment is decoded once.
+    assert cache.stats(reset=True) == (12 - num_segments, num_segments)
+    assert cache.stats() == (0, 0)
+
+    # Only the most recently used segment is kept.
+    cache = _frame_cache.VideoFrameCache(max_segments=1)
+    for i in order:
+        cache.get_frames(video_path, [i / 10], name="video")
+    assert cache.stats()[1] > num_segments
+
+
+def test_disk_cache(tmp_path):
+    video_path = str(tmp_path / "video.mp4")
+    _write_video(video_path, num_frames=12)
+
+    for expected_misses in (1, 0):
+        # A new cache, as in another data loader worker, reads the frames that were written by the first one.
+        cache = _frame_cache.VideoFrameCache(cache_dir=str(tmp_path / "cache"), image_size=(16, 24))
+        frames = cache.get_frames(video_path, [0.0, 0.5, 1.1], name="repo/camera/episode_000000")
+        assert frames.shape == (3, 16, 24, 3)
+        assert frames.dtype == np.uint8
+        assert cache.stats() == (3 - expected_misses, expected_misses)
+    assert (tmp_path / "cache/16x24/repo/camera/episode_000000.npy").exists()
+
+    # Only the most recently used video stays memory-mapped.
+    other_video_path = str(tmp_path / "other_video.mp4")
+    _write_video(other_video_path, num_frames=4)
+    cache = _frame_cache.VideoFrameCache(cache_dir=str(tmp_path / "cache"), image_size=(16, 24), max_open_videos=1)
+    for path, name in [(video_path, "video"), (other_video_path, "other_video"), (video_path, "video")]:
+        cache.get_frames(path, [0.0], name=name)
+    assert cache.stats() == (1, 2)
+
+
+def test_query_videos_matches_lerobot(tmp_path):
+    # LeRobot's PyAV decoding goes through torchvision.
+    video_utils = pytest.importorskip("lerobot.common.datasets.video_utils")
+    video_path = tmp_path / "videos/camera/episode_000003.mp4"
+    video_path.parent.mkdir(parents=True)
+    _write_video(video_path, num_frames=12)
+
+    dataset = _frame_cache.LeRobotDatasetWithFrameCache.__new__(_frame_cache.LeRobotDatasetWithFrameCache)
+    dataset.root = tmp_path
+    dataset.repo_id = "repo"
+    dataset.meta = types.SimpleNamespace(
+        get_video_file_path=lambda ep_idx, vid_key: f"videos/{vid_key}/episode_{ep_idx:06d}.mp4"
+    )
+    dataset.tolerance_s = 1e-4
+    dataset.frame_cache = _frame_cache.VideoFrameCache(max_segments=2, tolerance_s=dataset.tolerance_s)
+
+    # Keyframes, frames between keyframes, the last frame and a timestamp within the tolerance of a frame.
+    for timestamps in ([0.0], [0.1, 0.4], [0.3 + 5e-5, 0.9, 1.1]):
+        frames = dataset._query_videos({"camera": timestamps}, ep_idx=3)["camera"]  # noqa: SLF001
+        expected = video_utils.decode_video_frames_torchvision(
+            video_path, timestamps, dataset.tolerance_s, backend="pyav"
+        ).squeeze(0)
+        assert frames.dtype == expected.dtype == torch.float32
+        torch.testing.assert_close(frames, expected, rtol=0, atol=0)
+
+    # Timestamps between frames are rejected by both.
+    with pytest.raises(ValueError, match="No frame within"):
+        dataset._query_videos({"camera": [0.05]}, ep_idx=3)  # noqa: SLF001
+    with pytest.raises(AssertionError):
+        video_utils.decode_video_frames_torchvision(video_path, [0.05], dataset.tolerance_s, backend="pyav")
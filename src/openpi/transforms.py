@@ -36,6 +36,25 @@ class DataTransformFn(Protocol):
         """
 
 
+@runtime_checkable
+class BatchedDataTransformFn(DataTransformFn, Protocol):
+    """A transform that can also be applied to a batch of data at once."""
+
+    def batched(self, data: DataDict) -> DataDict:
+        """Apply transformation to a batch of data.
+
+        Must give the same result as applying the transform to each element of the batch and stacking the results,
+        but avoids splitting the batch, e.g., for the batches that are loaded from RLDS datasets.
+
+        Args:
+            data: Like the data of `__call__`, but each leaf has a leading batch dimension. Strings (e.g., prompts)
+                are numpy arrays of strings.
+
+        Returns:
+            The transformed data, with a leading batch dimension in each leaf.
+        """
+
+
 @dataclasses.dataclass(frozen=True)
 class Group:
     """A group of transforms."""
@@ -77,7 +96,7 @@ def compose(transforms: Sequence[DataTransformFn]) -> DataTransformFn:
 
 
 @dataclasses.dataclass(frozen=True)
-class RepackTransform(DataTransformFn):
+class RepackTransform(BatchedDataTransformFn):
     """Repacks an input dictionary into a new dictionary.
 
     Repacking is defined using a dictionary where the keys are the new keys and the values
@@ -100,9 +119,12 @@ class RepackTransform(DataTransformFn):
         flat_item = flatten_dict(data)
         return jax.tree.map(lambda k: flat_item[k], self.structure)
 
+    def batched(self, data: DataDict) -> DataDict:
+        return self(data)
+
 
 @dataclasses.dataclass(frozen=True)
-class InjectDefaultPrompt(DataTransformFn):
+class InjectDefaultPrompt(BatchedDataTransformFn):
     prompt: str | None
 
     def __call__(self, data: DataDict) -> DataDict:
@@ -110,9 +132,14 @@ class InjectDefaultPrompt(DataTransformFn):
             data["prompt"] = np.asarray(self.prompt)
         return data
 
+    def batched(self, data: DataDict) -> DataDict:
+        if self.prompt is not None and "prompt" not in data:
+            data["prompt"] = np.full(batch_size(data), self.prompt)
+        return data
+
 
 @dataclasses.dataclass(frozen=True)
-class Normalize(DataTransformFn):
+class Normalize(BatchedDataTransformFn):
     norm_stats: at.PyTree[NormStats] | None
     # If true, will use quantile normalization. Otherwise, normal z-score normalization will be used.
     use_quantiles: bool = False
@@ -134,6 +161,10 @@ class Normalize(DataTransformFn):
             strict=self.strict,
         )
 
+    def batched(self, data: DataDict) -> DataDict:
+        # The stats are broadcast over the leading dimensions.
+        return self(data)
+
     def _normalize(self, x, stats: NormStats):
         mean, std = stats.mean[..., : x.shape[-1]], stats.std[..., : x.shape[-1]]
         return (x - mean) / (std + 1e-6)
@@ -182,7 +213,7 @@ class Unnormalize(DataTransformFn):
 
 
 @dataclasses.dataclass(frozen=True)
-class ResizeImages(DataTransformFn):
+class ResizeImages(BatchedDataTransformFn):
     height: int
     width: int
 
@@ -190,18 +221,26 @@ class ResizeImages(DataTransformFn):
         data["image"] = {k: image_tools.resize_with_pad(v, self.height, self.width) for k, v in data["image"].items()}
         return data
 
+    def batched(self, data: DataDict) -> DataDict:
+        # `resize_with_pad` resizes the images along the last three dimensions.
+        return self(data)
+
 
 @dataclasses.dataclass(frozen=True)
-class SubsampleActions(DataTransformFn):
+class SubsampleActions(BatchedDataTransformFn):
     stride: int
 
     def __call__(self, data: DataDict) -> DataDict:
         data["actions"] = data["actions"][:: self.stride]
         return data
 
+    def batched(self, data: DataDict) -> DataDict:
+        data["actions"] = data["actions"][:, :: self.stride]
+        return data
+
 
 @dataclasses.dataclass(frozen=True)
-class DeltaActions(DataTransformFn):
+class DeltaActions(BatchedDataTransformFn):
     """Repacks absolute actions into delta action space."""
 
     # Boolean mask for the action dimensions to be repacked into delta action space. Length
@@ -221,6 +260,10 @@ class DeltaActions(DataTransformFn):
 
         return data
 
+    def batched(self, data: DataDict) -> DataDict:
+        # The state is broadcast over the action horizon, which is the second to last dimension.
+        return self(data)
+
 
 @dataclasses.dataclass(frozen=True)
 class AbsoluteActions(DataTransformFn):
@@ -245,7 +288,7 @@ class AbsoluteActions(DataTransformFn):
 
 
 @dataclasses.dataclass(frozen=True)
-class TokenizePrompt(DataTransformFn):
+class TokenizePrompt(BatchedDataTransformFn):
     tokenizer: _tokenizer.PaligemmaTokenizer
     discrete_state_input: bool = False
 
@@ -265,9 +308,24 @@ class TokenizePrompt(DataTransformFn):
         tokens, token_masks = self.tokenizer.tokenize(prompt, state)
         return {**data, "tokenized_prompt": tokens, "tokenized_prompt_mask": token_masks}
 
+    def batched(self, data: DataDict) -> DataDict:
+        if (prompt := data.pop("prompt", None)) is None:
+            raise ValueError("Prompt is required")
+
+        prompts = np.asarray(prompt).tolist()
+        if self.discrete_state_input:
+            if (state := data.get("state", None)) is None:
+                raise ValueError("State is required.")
+            outputs = [self.tokenizer.tokenize(p, s) for p, s in zip(prompts, state, strict=True)]
+        else:
+            outputs = [self.tokenizer.tokenize(p) for p in prompts]
+
+        tokens, token_masks = _stack(outputs)
+        return {**data, "tokenized_prompt": tokens, "tokenized_prompt_mask": token_masks}
+
 
 @dataclasses.dataclass(frozen=True)
-class TokenizeFASTInputs(DataTransformFn):
+class TokenizeFASTInputs(BatchedDataTransformFn):
     tokenizer: _tokenizer.FASTTokenizer
 
     def __call__(self, data: DataDict) -> DataDict:
@@ -287,6 +345,24 @@ class TokenizeFASTInputs(DataTransformFn):
             "token_loss_mask": loss_mask,
         }
 
+    def batched(self, data: DataDict) -> DataDict:
+        if (prompt := data.pop("prompt", None)) is None:
+            raise ValueError("Prompt is required")
+
+        prompts = np.asarray(prompt).tolist()
+        state, actions = data["state"], data.get("actions")
+        if actions is None:
+            actions = [None] * len(prompts)
+        outputs = [self.tokenizer.tokenize(p, s, a) for p, s, a in zip(prompts, state, actions, strict=True)]
+        tokens, token_mask, ar_mask, loss_mask = _stack(outputs)
+        return {
+            **data,
+            "tokenized_prompt": tokens,
+            "tokenized_prompt_mask": token_mask,
+            "token_ar_mask": ar_mask,
+            "token_loss_mask": loss_mask,
+        }
+
 
 @dataclasses.dataclass(frozen=True)
 class ExtractFASTActions(DataTransformFn):
@@ -325,7 +401,7 @@ class PromptFromLeRobotTask(DataTransformFn):
 
 
 @dataclasses.dataclass(frozen=True)
-class PadStatesAndActions(DataTransformFn):
+class PadStatesAndActions(BatchedDataTransformFn):
     """Zero-pads states and actions to the model action dimension."""
 
     model_action_dim: int
@@ -336,6 +412,10 @@ class PadStatesAndActions(DataTransformFn):
             data["actions"] = pad_to_dim(data["actions"], self.model_action_dim, axis=-1)
         return data
 
+    def batched(self, data: DataDict) -> DataDict:
+        # Only the last dimension is padded.
+        return self(data)
+
 
 def flatten_dict(tree: at.PyTree) -> dict:
     """Flatten a nested dictionary. Uses '/' as the separator."""
@@ -422,14 +502,56 @@ def apply_tree(
 
 def pad_to_dim(x: np.ndarray, target_dim: int, axis: int = -1, value: float = 0.0) -> np.ndarray:
     """Pad an array to the target dimension with zeros along the specified axis."""
+    x = np.asarray(x)
     current_dim = x.shape[axis]
     if current_dim < target_dim:
-        pad_width = [(0, 0)] * len(x.shape)
-        pad_width[axis] = (0, target_dim - current_dim)
-        return np.pad(x, pad_width, constant_values=value)
+        # Copy into a preallocated output, which is considerably faster than `np.pad` for small arrays.
+        shape = list(x.shape)
+        shape[axis] = target_dim
+        padded = np.full(shape, value, dtype=x.dtype)
+        padded[(slice(None),) * (axis % x.ndim) + (slice(current_dim),)] = x
+        return padded
     return x
 
 
+def make_gather_index(index_ranges: Sequence[tuple[int, int]]) -> np.ndarray:
+    """Returns the indices of the `(start, end)` ranges, concatenated in order.
+
+    Selecting dimensions with `np.take(x, index, axis=-1)` is a single gather, instead of slicing and concatenating
+    each range. Raises a `ValueError` if the ranges are invalid.
+    """
+    if not index_ranges:
+        raise ValueError("At least one index range is required.")
+    for index_range in index_ranges:
+        if len(index_range) != 2 or not all(isinstance(i, int | np.integer) for i in index_range):
+            raise ValueError(f"Index ranges must be (start, end) pairs of integers, got {index_range}.")
+        start, end = index_range
+        if not 0 <= start < end:
+            raise ValueError(f"Invalid index range ({start}, {end}), expected 0 <= start < end.")
+    return np.concatenate([np.arange(start, end) for start, end in index_ranges])
+
+
+def batch_size(data: DataDict) -> int:
+    """Returns the size of the leading batch dimension of batched data."""
+    return len(jax.tree.leaves(data)[0])
+
+
+def apply_batched(transforms: Sequence[DataTransformFn], data: DataDict) -> DataDict:
+    """Applies a sequence of transforms to a batch of data.
+
+    The batch is transformed at once if all transforms are `BatchedDataTransformFn`s. Otherwise, it is split into
+    individual elements, which are transformed separately and stacked again.
+    """
+    if all(isinstance(transform, BatchedDataTransformFn) for transform in transforms):
+        for transform in transforms:
+            data = transform.batched(data)
+        return data
+
+    transform = compose(transforms)
+    elements = [jax.tree.map(lambda x: x[i], data) for i in range(batch_size(data))]  # noqa: B023
+    return jax.tree.map(lambda *x: np.stack(x, axis=0), *[transform(element) for element in elements])
+
+
 def make_bool_mask(*dims: int) -> tuple[bool, ...]:
     """Make a boolean mask for the given dimensions.
 
@@ -458,3 +580,8 @@ def _assert_quantile_stats(norm_stats: at.PyTree[NormStats]) -> None:
             raise ValueError(
                 f"quantile stats must be provided if use_quantile_norm is True. Key {k} is missing q01 or q99."
             )
+
+
+def _stack(outputs: Sequence[tuple[np.ndarray, ...]]) -> tuple[np.ndarray, ...]:
+    """Stacks the outputs of a function that is applied to each element of a batch."""
+    return tuple(np.stack(x) for x in zip(*outputs, strict=True))
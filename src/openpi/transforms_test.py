@@ -1,3 +1,4 @@
+import jax
 import numpy as np
 import pytest
 
@@ -67,6 +68,24 @@ def test_make_bool_mask():
     assert _transforms.make_bool_mask(2, 0, 2) == (True, True, True, True)
 
 
+def test_pad_to_dim():
+    x = np.arange(6, dtype=np.float32).reshape(2, 3)
+    padded = _transforms.pad_to_dim(x, 5, value=-1.0)
+    np.testing.assert_array_equal(padded, np.pad(x, [(0, 0), (0, 2)], constant_values=-1.0))
+    assert padded.dtype == np.float32
+    np.testing.assert_array_equal(_transforms.pad_to_dim(x, 4, axis=0), np.pad(x, [(0, 2), (0, 0)]))
+    assert _transforms.pad_to_dim(x, 3) is x
+
+
+def test_make_gather_index():
+    index = _transforms.make_gather_index([(0, 2), (5, 7)])
+    np.testing.assert_array_equal(index, [0, 1, 5, 6])
+
+    for index_ranges in ([], [(2, 2)], [(-1, 2)], [(0, 1, 2)], [(0.0, 1.0)]):
+        with pytest.raises(ValueError, match="ndex range"):
+            _transforms.make_gather_index(index_ranges)
+
+
 def test_tokenize_prompt():
     tokenizer = _tokenizer.PaligemmaTokenizer(max_len=12)
     transform = _transforms.TokenizePrompt(tokenizer)
@@ -78,6 +97,19 @@ def test_tokenize_prompt():
     assert np.allclose(tok_mask, data["tokenized_prompt_mask"])
 
 
+def test_tokenize_prompt_batched():
+    transform = _transforms.TokenizePrompt(_tokenizer.PaligemmaTokenizer(max_len=12), discrete_state_input=True)
+    batch = {"prompt": np.array(["Hello, world!", "Hi"]), "state": np.array([[0.1, -0.5], [0.3, 0.9]])}
+
+    data = transform.batched(dict(batch))
+
+    assert data["tokenized_prompt"].shape == (2, 12)
+    for i in range(2):
+        element = transform({"prompt": batch["prompt"][i], "state": batch["state"][i]})
+        np.testing.assert_array_equal(data["tokenized_prompt"][i], element["tokenized_prompt"])
+        np.testing.assert_array_equal(data["tokenized_prompt_mask"][i], element["tokenized_prompt_mask"])
+
+
 def test_tokenize_no_prompt():
     transform = _transforms.TokenizePrompt(_tokenizer.PaligemmaTokenizer())
 
@@ -85,6 +117,39 @@ def test_tokenize_no_prompt():
         transform({})
 
 
+def test_apply_batched():
+    rng = np.random.default_rng(0)
+    batch = {
+        "observation": {"state": rng.random((4, 3)), "image": rng.integers(256, size=(4, 8, 6, 3), dtype=np.uint8)},
+        "actions": rng.random((4, 5, 3)),
+    }
+    norm_stats = {"state": _transforms.NormStats(mean=np.ones(3), std=np.full(3, 2.0))}
+    transforms = [
+        _transforms.RepackTransform(
+            {"state": "observation/state", "image": {"cam": "observation/image"}, "actions": "actions"}
+        ),
+        _transforms.DeltaActions(mask=[True, False]),
+        _transforms.Normalize(norm_stats),
+        _transforms.InjectDefaultPrompt("Hello, world!"),
+        _transforms.ResizeImages(4, 4),
+        _transforms.SubsampleActions(2),
+        _transforms.PadStatesAndActions(6),
+    ]
+
+    def copy(batch):
+        return jax.tree.map(np.copy, batch)
+
+    batched = _transforms.apply_batched(transforms, copy(batch))
+    # Falls back to transforming each element if a transform does not support batches.
+    unbatched = _transforms.apply_batched([*transforms, lambda data: data], copy(batch))
+
+    assert batched["state"].shape == (4, 6)
+    assert batched["actions"].shape == (4, 3, 6)
+    assert batched["image"]["cam"].shape == (4, 4, 4, 3)
+    assert batched["prompt"].tolist() == ["Hello, world!"] * 4
+    jax.tree.map(np.testing.assert_array_equal, batched, unbatched)
+
+
 def test_transform_dict():
     # Rename and remove keys.
     input = {"a": {"b": 1, "c": 2}}